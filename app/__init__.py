@@ -1,11 +1,44 @@
+import sqlite3
+
 from flask import Flask
 from config import Config
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import event
+
+from app.ema_buffer import EMAWriteBuffer
+from app.quiz_state import create_quiz_state_store
 
 app = Flask(__name__)
 app.config.from_object(Config)
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
 
-from app import routes, models
\ No newline at end of file
+
+def include_object(object, name, type_, reflected, compare_to):
+    """
+    Leave the full-text search index, an FTS5 table and its shadow tables
+    built at ingest rather than a model, out of migrations.
+    """
+    return not (type_ == 'table' and reflected
+                and name.startswith('question_fts'))
+
+
+migrate = Migrate(app, db, include_object=include_object)
+ema_buffer = EMAWriteBuffer(app, db)
+quiz_states = create_quiz_state_store(app.config)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply the `SQLITE_PRAGMAS` storage profile to a new connection."""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in app.config['SQLITE_PRAGMAS'].items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
+
+
+with app.app_context():
+    event.listen(db.engine, 'connect', set_sqlite_pragmas)
+
+
+from app import metrics, routes, models
\ No newline at end of file
@@ -0,0 +1,101 @@
+import atexit
+import threading
+
+from sqlalchemy import bindparam, select, update
+
+
+class EMAWriteBuffer:
+    """
+    Buffer EMA score updates in memory and write them in batches.
+
+    In 'write_behind' mode each new score is held in an overlay, which
+    `get` reads from so scores stay consistent, and the pending scores are
+    written in a single transaction once `EMA_FLUSH_MAX_PENDING` have been
+    buffered, `EMA_FLUSH_INTERVAL` seconds after the first one, when
+    `flush` is called and at shutdown. Repeated answers to one question
+    are coalesced into a single write.
+
+    N.B. This assumes this process is the only one updating scores. In
+    'immediate' mode the buffer is disabled and every update is committed
+    straight away by `Question.update_score`.
+    """
+
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+        self.enabled = app.config['EMA_WRITE_MODE'] == 'write_behind'
+        self.max_pending = app.config['EMA_FLUSH_MAX_PENDING']
+        self.interval = app.config['EMA_FLUSH_INTERVAL']
+        # question_id -> ema_score waiting to be written
+        self._pending = {}
+        # Scores being written by `flush`, still read until committed
+        self._flushing = {}
+        self._timer = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        if self.enabled:
+            atexit.register(self.flush)
+
+    def get(self, question_id, default):
+        """Return the buffered score of a question, or `default`."""
+        with self._lock:
+            if question_id in self._pending:
+                return self._pending[question_id]
+            return self._flushing.get(question_id, default)
+
+    def add(self, question_id, ema_score):
+        """Buffer the new score of a question, flushing if it is full."""
+        with self._lock:
+            self._pending[question_id] = ema_score
+            full = len(self._pending) >= self.max_pending
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered scores, and the scores in `topic_stats` of
+        their topics, in a single transaction.
+        """
+        # Imported here as the models use the buffer created with the app
+        from app.models import Question, TopicStats, next_score_version
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._pending:
+                    return
+                self._flushing, self._pending = self._pending, {}
+            rows = [{'question_id': question_id, 'score': ema_score}
+                    for question_id, ema_score in self._flushing.items()]
+            try:
+                with self.app.app_context(), self.db.engine.begin() as conn:
+                    old_scores = conn.execute(
+                        select(Question.id, Question.topic_id,
+                               Question.ema_score)
+                        .where(Question.id.in_(list(self._flushing)))
+                    ).all()
+                    conn.execute(
+                        update(Question.__table__)
+                        .where(Question.__table__.c.id
+                               == bindparam('question_id'))
+                        .values(ema_score=bindparam('score'),
+                                score_version=next_score_version()),
+                        rows
+                    )
+                    TopicStats.apply_score_changes(conn, [
+                        (topic_id, old_score, self._flushing[question_id])
+                        for question_id, topic_id, old_score in old_scores
+                    ])
+            except Exception:
+                # Put the scores back, newer pending scores take priority
+                with self._lock:
+                    self._pending = {**self._flushing, **self._pending}
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
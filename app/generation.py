@@ -0,0 +1,89 @@
+import threading
+import time
+
+from sqlalchemy import func, select, text
+
+from app import app, db
+from app.models import Question
+
+
+class DataGenerationWatcher:
+    """
+    Notice when an ingest has swapped in a new generation of the data.
+
+    Each ingest bumps the database's `user_version` in the same
+    transaction as the new rows. The generation is read at most every
+    `interval` seconds, so anything built from the old data can be
+    dropped without restarting the app.
+    """
+
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self._generation = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def changed(self):
+        """Return True if the generation has changed since it was last read."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < self.interval:
+                return False
+            self._checked_at = now
+            generation = db.session.execute(
+                text("PRAGMA user_version")
+            ).scalar()
+            changed = (self._generation is not None
+                       and generation != self._generation)
+            self._generation = generation
+            return changed
+
+
+class ScoreChangeWatcher:
+    """
+    Notice the EMA scores written by other processes.
+
+    Each score write sets the question's `score_version` above every
+    other, in the same transaction as the score. The highest version is
+    read at most every `interval` seconds, and the questions written since
+    it was last read are returned, so each process can move them in its
+    in-memory indexes.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def changes(self):
+        """
+        Return the questions whose score has been written since the last
+        call, as (question_id, topic_id, ema_score) rows. The first call
+        only reads the current version, so it must happen before the
+        indexes are loaded.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < self.interval:
+                return []
+            self._checked_at = now
+            version = db.session.execute(
+                select(func.max(Question.score_version))
+            ).scalar() or 0
+            if self._version is None or version == self._version:
+                self._version = version
+                return []
+            rows = db.session.execute(
+                select(Question.id, Question.topic_id, Question.ema_score)
+                .where(Question.score_version > self._version,
+                       Question.score_version <= version)
+            ).all()
+            self._version = version
+            return rows
+
+
+data_generation = DataGenerationWatcher(
+    app.config['DATA_GENERATION_CHECK_INTERVAL']
+)
+score_changes = ScoreChangeWatcher(app.config['SCORE_CHECK_INTERVAL'])
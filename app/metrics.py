@@ -0,0 +1,199 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+from app import app, db
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0)
+# Upper bounds of the SQL statement count buckets
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Upper bounds of the cookie size buckets, in bytes
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096)
+
+
+def format_labels(labels):
+    """Format label pairs in the Prometheus text format."""
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    """A Prometheus histogram, with a series for each set of label values."""
+
+    def __init__(self, name, description, buckets, label_names=()):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label_names = label_names
+        # label values -> [bucket counts..., sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """Add an observation to the series for the label values."""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = \
+                    [0] * len(self.buckets) + [0.0, 0]
+            # Counts are per bucket here and made cumulative when rendered
+            idx = bisect_left(self.buckets, value)
+            if idx < len(self.buckets):
+                series[idx] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        """Return the histogram in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.description}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, values in series:
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                bucket_labels = format_labels(labels + [('le', bound)])
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            bucket_labels = format_labels(labels + [('le', '+Inf')])
+            lines.append(f'{self.name}_bucket{bucket_labels} {values[-1]}')
+            lines.append(f'{self.name}_sum{format_labels(labels)} {values[-2]}')
+            lines.append(f'{self.name}_count{format_labels(labels)} '
+                         f'{values[-1]}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    """A Prometheus counter, with a series for each set of label values."""
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *label_values):
+        """Add to the series for the label values."""
+        with self._lock:
+            self._series[label_values] = \
+                self._series.get(label_values, 0) + amount
+
+    def render(self):
+        """Return the counter in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.description}',
+                 f'# TYPE {self.name} counter']
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, value in series:
+            labels = format_labels(list(zip(self.label_names, label_values)))
+            lines.append(f'{self.name}{labels} {value}')
+        return '\n'.join(lines)
+
+
+class Metrics:
+    """
+    Instrumentation of requests, SQL statements and ingests.
+
+    Nothing is hooked into the app, the engine or the ingest until
+    `install` is called, so there is no overhead while disabled.
+
+    N.B. The metrics are kept per process, with several worker processes
+    each one reports its own.
+    """
+
+    def __init__(self, slow_request_threshold=None):
+        self.slow_request_threshold = slow_request_threshold
+        self.request_duration = Histogram(
+            'skillsassist_request_duration_seconds',
+            'Time spent handling requests.', LATENCY_BUCKETS, ('endpoint',))
+        self.sql_statements = Histogram(
+            'skillsassist_request_sql_statements',
+            'SQL statements executed per request.', COUNT_BUCKETS,
+            ('endpoint',))
+        self.sql_duration = Histogram(
+            'skillsassist_request_sql_duration_seconds',
+            'Time spent executing SQL statements per request.',
+            LATENCY_BUCKETS, ('endpoint',))
+        self.session_cookie_size = Histogram(
+            'skillsassist_session_cookie_bytes',
+            'Size of the session cookie sent with requests.', SIZE_BUCKETS)
+        self.ingest_duration = Counter(
+            'skillsassist_ingest_stage_seconds_total',
+            'Time spent in each stage of populating the database.',
+            ('stage',))
+
+    def install(self, app, db):
+        """Hook the metrics into the app, its engine and the ingest."""
+        # Imported here as the ingest dependencies are otherwise not needed
+        from utils import INGEST_STAGE_OBSERVERS
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.add_url_rule('/metrics', 'metrics', self.render_response)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute',
+                         self.before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute',
+                         self.after_cursor_execute)
+        INGEST_STAGE_OBSERVERS.append(self.observe_ingest)
+
+    def before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_duration = 0.0
+
+    def after_request(self, response):
+        elapsed = time.perf_counter() - g.metrics_start
+        endpoint = request.endpoint or 'unknown'
+        self.request_duration.observe(elapsed, endpoint)
+        self.sql_statements.observe(g.sql_statements, endpoint)
+        self.sql_duration.observe(g.sql_duration, endpoint)
+        cookie = request.cookies.get(app.config['SESSION_COOKIE_NAME'], '')
+        self.session_cookie_size.observe(len(cookie))
+        if (self.slow_request_threshold is not None
+                and elapsed >= self.slow_request_threshold):
+            app.logger.warning(
+                'Slow request %s %s: %.1fms, %d SQL statements in %.1fms, '
+                'session cookie %d bytes', request.method, request.path,
+                elapsed * 1000, g.sql_statements, g.sql_duration * 1000,
+                len(cookie))
+        return response
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters,
+                             context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_start'].pop()
+        # Statements run outside a request, e.g. by the EMA write buffer,
+        # are not counted
+        if has_request_context() and 'sql_statements' in g:
+            g.sql_statements += 1
+            g.sql_duration += elapsed
+
+    def observe_ingest(self, timings):
+        for stage, seconds in timings.items():
+            self.ingest_duration.inc(seconds, stage)
+
+    def render(self):
+        """Return all metrics in the Prometheus text format."""
+        return '\n'.join(metric.render() for metric in (
+            self.request_duration, self.sql_statements, self.sql_duration,
+            self.session_cookie_size, self.ingest_duration
+        )) + '\n'
+
+    def render_response(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics(app.config['SLOW_REQUEST_THRESHOLD'])
+if app.config['METRICS_ENABLED']:
+    metrics.install(app, db)
@@ -1,12 +1,51 @@
-from datetime import datetime
+import json
+import re
+import uuid
+from array import array
+from datetime import datetime, timedelta
+from html import escape
 
+from sqlalchemy import and_, bindparam, case, delete, or_, select, text, \
+    update
 from sqlalchemy.sql import func
 
-from app import db
+from app import db, ema_buffer
+from app.quiz_state import ID_TYPECODE
 
 # Weight factor for Exponential Moving Average (EMA) score
 EMA_ALPHA = 0.5
 
+# Largest rounding error in an EMA score derived from the formula
+SCORE_TOLERANCE = 1e-9
+
+# Weights of the title, question text and explanation when ranking search
+# results with bm25
+SEARCH_WEIGHTS = (10.0, 1.0, 2.0)
+# Characters marking matches in search snippets, replaced after escaping
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+
+
+def build_match_query(search_text):
+    """
+    Turn user input into an FTS5 query which matches every word, the last
+    one as a prefix, or None if there are no words.
+    """
+    terms = [f'"{word}"' for word in re.findall(r'\w+', search_text)]
+    if not terms:
+        return None
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def next_score_version():
+    """
+    Return the SQL for a score version above every question's.
+
+    SQLite has a single writer, so versions are committed in order.
+    """
+    return func.coalesce(
+        select(func.max(Question.score_version)).scalar_subquery(), 0) + 1
+
 
 class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -15,31 +54,178 @@ class Question(db.Model):
     question_html = db.Column(db.Text, nullable=False)
     question_explanation = db.Column(db.Text)
     correct_choice = db.Column(db.Integer, nullable=False)
-    topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'), nullable=False)
+    # Whether the code in the question was highlighted at ingest
+    highlighted = db.Column(db.Boolean, default=False, nullable=False)
+    topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'),
+                         index=True, nullable=False)
     topic_name = db.Column(db.String(100), nullable=False)
     # Exponential Moving Average (EMA) score
     ema_score = db.Column(db.Float, index=True, default=0.0, nullable=False)
+    # Set above every other question's each time the score is written, so
+    # other processes can find the changed scores, see `ScoreChangeWatcher`
+    score_version = db.Column(db.Integer, index=True)
 
     def __repr__(self):
         return f'<Question {self.id}>'
 
-    def serialize(self):
+    def serialize_question(self):
+        """Serialize the question without its answer or explanation."""
         return {
             'id': self.id,
             'question_title': self.question_title,
             'question_html': self.question_html,
-            'question_explanation': self.question_explanation,
-            'correct_choice': self.correct_choice,
             'topic_name': self.topic_name,
+            'highlighted': self.highlighted,
         }
 
-    def update(self, score):
+    def serialize_answer(self):
+        """Serialize the correct choice and explanation of the question."""
+        return {
+            'correct_choice': self.correct_choice,
+            'explanation': self.question_explanation,
+            'highlighted': self.highlighted,
+        }
+
+    @staticmethod
+    def update_score(question_id, score):
         """
-        Update the EMA score of the question based on the correctness
-        of the answer and commit to database.
+        Update the EMA score of a question based on the correctness of
+        an answer, without loading the question.
+
+        `ema_score = EMA_ALPHA * score + (1 - EMA_ALPHA) * ema_score` is
+        applied in SQL when committing immediately, along with the scores
+        in `topic_stats`, or to the buffered score in write-behind mode.
+
+        Returns:
+            float: The new EMA score, or None if the question has been
+                   removed by an ingest.
         """
-        self.ema_score = EMA_ALPHA * score + (1 - EMA_ALPHA) * self.ema_score
-        db.session.commit()
+        if not ema_buffer.enabled:
+            query = (
+                update(Question)
+                .where(Question.id == question_id)
+                .values(ema_score=EMA_ALPHA * score
+                        + (1 - EMA_ALPHA) * Question.ema_score,
+                        score_version=next_score_version())
+                .returning(Question.topic_id, Question.ema_score)
+                .execution_options(synchronize_session=False)
+            )
+            row = db.session.execute(query).first()
+            if row is None:
+                db.session.commit()
+                return None
+            topic_id, ema_score = row
+            # The score before the update, from the formula
+            old_score = (ema_score - EMA_ALPHA * score) / (1 - EMA_ALPHA)
+            TopicStats.apply_score_changes(
+                db.session, [(topic_id, old_score, ema_score)])
+            db.session.commit()
+            return ema_score
+        ema_score = ema_buffer.get(question_id, None)
+        if ema_score is None:
+            query = select(Question.ema_score).where(Question.id == question_id)
+            ema_score = db.session.execute(query).scalar_one_or_none()
+            if ema_score is None:
+                return None
+        ema_score = EMA_ALPHA * score + (1 - EMA_ALPHA) * ema_score
+        ema_buffer.add(question_id, ema_score)
+        return ema_score
+
+    @staticmethod
+    def apply_scores(answers):
+        """
+        Update the EMA scores for several answers in the current transaction.
+
+        The same formula as `update_score` is applied in SQL, in order, so a
+        question answered twice is updated twice, then the scores in
+        `topic_stats` are updated. Nothing is committed.
+
+        N.B. In write-behind mode the buffered scores must be flushed
+        first, or writing them later would undo these updates.
+
+        Args:
+            answers (list): A (question_id, score) pair for each answer.
+
+        Returns:
+            dict: The new EMA score of each question, questions removed
+                  by an ingest are left out.
+        """
+        if not answers:
+            return {}
+        question_ids = {question_id for question_id, _ in answers}
+        old_scores = {
+            question_id: (topic_id, ema_score)
+            for question_id, topic_id, ema_score in db.session.execute(
+                select(Question.id, Question.topic_id, Question.ema_score)
+                .where(Question.id.in_(question_ids)))
+        }
+        query = (
+            update(Question.__table__)
+            .where(Question.__table__.c.id == bindparam('question_id'))
+            .values(ema_score=EMA_ALPHA * bindparam('score')
+                    + (1 - EMA_ALPHA) * Question.__table__.c.ema_score,
+                    score_version=next_score_version())
+        )
+        db.session.execute(query, [
+            {'question_id': question_id, 'score': score}
+            for question_id, score in answers
+        ])
+        ema_scores = dict(db.session.execute(
+            select(Question.id, Question.ema_score)
+            .where(Question.id.in_(question_ids))
+        ).all())
+        TopicStats.apply_score_changes(db.session, [
+            (topic_id, old_score, ema_scores[question_id])
+            for question_id, (topic_id, old_score) in old_scores.items()
+        ])
+        return ema_scores
+
+    @staticmethod
+    def search(search_text, topic_id=None, limit=20):
+        """
+        Search the questions with the full-text search index.
+
+        The index is built at ingest, if the data was ingested before it
+        existed it is built on the first search.
+
+        Returns:
+            list: A dict for each matching question, best match first,
+                  with its id, topic, title and an HTML snippet of the
+                  matching text with the matches in <mark> tags.
+        """
+        match = build_match_query(search_text)
+        if match is None:
+            return []
+        topic_filter = 'AND question.topic_id = :topic_id' if topic_id else ''
+        weights = ', '.join(map(str, SEARCH_WEIGHTS))
+        query = text(f"""
+            SELECT question.id, question.topic_id, question.topic_name,
+                   question.question_title,
+                   snippet(question_fts, -1, :start, :end, '…', 16)
+            FROM question_fts JOIN question ON question.id = question_fts.rowid
+            WHERE question_fts MATCH :match {topic_filter}
+            ORDER BY bm25(question_fts, {weights})
+            LIMIT :limit
+        """)
+        params = {'match': match, 'topic_id': topic_id, 'limit': limit,
+                  'start': SNIPPET_START, 'end': SNIPPET_END}
+        index_exists = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'question_fts'"
+        )).first()
+        if not index_exists:
+            from utils import ensure_search_index
+            ensure_search_index(db.session.connection().connection)
+            db.session.commit()
+        rows = db.session.execute(query, params).all()
+        return [{
+            'id': question_id,
+            'topic_id': question_topic_id,
+            'topic_name': topic_name,
+            'question_title': title,
+            'snippet': (escape(snippet)
+                        .replace(SNIPPET_START, '<mark>')
+                        .replace(SNIPPET_END, '</mark>')),
+        } for question_id, question_topic_id, topic_name, title, snippet in rows]
 
 
 class Topic(db.Model):
@@ -54,48 +240,177 @@ class Topic(db.Model):
     last_seen = db.Column(db.DateTime,
                           default=datetime.utcnow,
                           server_default=func.now())
+    # SHA-256 of the markdown file the questions were last parsed from
+    content_hash = db.Column(db.String(64))
 
     def __repr__(self):
         return f'<Topic {self.name}>'
 
+
+class TopicStats(db.Model):
+    """
+    Statistics for each topic, kept up to date rather than aggregated on
+    every request. The question and score columns are refreshed at ingest
+    and updated whenever scores are written, the attempt columns each time
+    results are saved.
+    """
+    topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'),
+                         primary_key=True)
+    topic_name = db.Column(db.String(100), index=True, nullable=False)
+    question_count = db.Column(db.Integer, default=0, nullable=False)
+    # Mean and minimum Exponential Moving Average (EMA) score
+    ema_mean = db.Column(db.Float, default=0.0, nullable=False)
+    ema_min = db.Column(db.Float, default=0.0, nullable=False)
+    attempt_count = db.Column(db.Integer, default=0, nullable=False)
+    last_accuracy = db.Column(db.Float)
+    last_seen = db.Column(db.DateTime, index=True)
+
+    def __repr__(self):
+        return f'<TopicStats {self.topic_name}>'
+
     @staticmethod
-    def get_all_topics():
+    def apply_score_changes(connection, changes):
         """
-        Return a list of all topics sorted alphabetically.
-        """
-        return Topic.query.order_by(Topic.name.asc()).all()
+        Update the EMA scores of topics after the scores of some of their
+        questions have been written, from each question's old and new
+        score. Nothing is committed.
 
-    def get_questions(self):
-        """
-        Return a list of all questions for this topic,
-        sorted by their EMA score.
-        """
-        return self.questions.order_by(Question.ema_score).all()
+        The mean moves by the change in score over the number of
+        questions. The minimum is only aggregated again when the question
+        which held it has gone up. An old score may have been derived from
+        the new one, so it is compared with a tolerance for rounding.
 
-    def get_number_of_questions(self):
+        Args:
+            connection: The session or connection the scores were written
+                        with.
+            changes (list): A (topic_id, old_score, new_score) tuple for
+                            each question, at most one per question.
         """
-        Returns the number of cards for this topic.
-        """
-        return self.questions.count()
+        if not changes:
+            return
+        stats = TopicStats.__table__
+        topic_min = (
+            select(func.min(Question.ema_score))
+            .where(Question.topic_id == stats.c.topic_id)
+            .scalar_subquery()
+        )
+        new_score = bindparam('new_score', type_=db.Float)
+        old_score = bindparam('old_score', type_=db.Float)
+        connection.execute(
+            update(stats)
+            .where(stats.c.topic_id == bindparam('stats_topic_id'),
+                   stats.c.question_count > 0)
+            .values(
+                ema_mean=stats.c.ema_mean
+                + (new_score - old_score) / stats.c.question_count,
+                ema_min=case(
+                    (new_score <= stats.c.ema_min, new_score),
+                    (old_score <= stats.c.ema_min + SCORE_TOLERANCE,
+                     topic_min),
+                    else_=stats.c.ema_min
+                )
+            ),
+            [{'stats_topic_id': topic_id, 'old_score': old,
+              'new_score': new} for topic_id, old, new in changes]
+        )
+
+
+class QuizPack(db.Model):
+    """
+    A quiz exported for a client to take offline, and its results once
+    they have been synced.
+
+    The pack is stored when it is exported, so it can be synced after a
+    long time offline, until it expires. It is marked as synced in the
+    same transaction as the score updates and performance, and only if it
+    was not already, so a retried sync is answered from the stored results
+    rather than applied again. Synced packs are kept for a while to answer
+    retries, then removed, see `purge`.
+    """
+    id = db.Column(db.String(32), primary_key=True)
+    topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'),
+                         nullable=False)
+    # The question ids in quiz order, as the bytes of a compact array
+    question_ids = db.Column(db.LargeBinary, nullable=False)
+    created = db.Column(db.DateTime, default=datetime.now, index=True,
+                        nullable=False)
+    # JSON list of [question_id, selected_choice, is_correct] once synced
+    results = db.Column(db.Text)
+    synced = db.Column(db.DateTime, index=True)
+    performance_id = db.Column(db.Integer,
+                               db.ForeignKey('performance_tracker.id'))
+
+    def __repr__(self):
+        return f'<QuizPack {self.id}>'
 
-    def get_performance(self):
+    @staticmethod
+    def create(topic_id, question_ids):
+        """Store a new pack of questions for a topic and return it."""
+        pack = QuizPack(id=uuid.uuid4().hex, topic_id=topic_id,
+                        question_ids=array(ID_TYPECODE,
+                                           question_ids).tobytes())
+        db.session.add(pack)
+        db.session.commit()
+        return pack
+
+    @staticmethod
+    def purge(now, ttl, synced_ttl):
         """
-        Returns a list of all past performances for this topic,
-        sorted by date.
+        Delete the packs which were exported more than `ttl` seconds ago
+        and never synced, and those synced more than `synced_ttl` seconds
+        ago. Nothing is committed.
         """
-        return self.past_performance.order_by(PerformanceTracker.date).all()
+        db.session.execute(
+            delete(QuizPack)
+            .where(or_(
+                and_(QuizPack.synced.is_(None),
+                     QuizPack.created < now - timedelta(seconds=ttl)),
+                QuizPack.synced < now - timedelta(seconds=synced_ttl)))
+            .execution_options(synchronize_session=False)
+        )
 
-    @staticmethod
-    def get_all_topics_with_performance():
+    def is_expired(self, now, ttl):
+        """Return whether the pack can no longer be synced, see `purge`."""
+        return (self.synced is None
+                and self.created < now - timedelta(seconds=ttl))
+
+    def get_question_ids(self):
+        """Return the ids of the pack's questions, in quiz order."""
+        question_ids = array(ID_TYPECODE)
+        question_ids.frombytes(self.question_ids)
+        return question_ids
+
+    def claim(self, results, date):
         """
-        Returns a list of topics that have associated PerformanceTracker
-        objects sorted by date.
+        Mark the pack as synced with its results, unless it already is.
+        Nothing is committed.
+
+        Returns:
+            bool: False if the pack had already been synced, including by
+                  a concurrent request whose transaction committed first.
         """
-        topics = Topic.query.filter(Topic.past_performance.any())
-        return topics.order_by(Topic.last_seen.desc()).all()
+        claimed = db.session.execute(
+            update(QuizPack)
+            .where(QuizPack.id == self.id, QuizPack.synced.is_(None))
+            .values(results=json.dumps(results), synced=date)
+            .execution_options(synchronize_session=False)
+        )
+        return claimed.rowcount == 1
+
+
+# SQLite strftime formats used to group performance history by period
+HISTORY_BUCKETS = {
+    'day': '%Y-%m-%d',
+    'week': '%Y-W%W',
+    'month': '%Y-%m',
+}
 
 
 class PerformanceTracker(db.Model):
+    __table_args__ = (
+        db.Index('ix_performance_tracker_topic_id_date', 'topic_id', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'), nullable=False)
     topic_name = db.Column(db.String(100), nullable=False)
@@ -104,3 +419,65 @@ class PerformanceTracker(db.Model):
 
     def __repr__(self):
         return f'<{self.data}: PerformanceTracker - {self.name}>'
+
+    @staticmethod
+    def _in_range(query, topic_id, start=None, end=None):
+        """Filter a query to a topic and an optional date range."""
+        query = query.where(PerformanceTracker.topic_id == topic_id)
+        if start is not None:
+            query = query.where(PerformanceTracker.date >= start)
+        if end is not None:
+            query = query.where(PerformanceTracker.date <= end)
+        return query
+
+    @staticmethod
+    def get_series(topic_id, start=None, end=None, limit=50):
+        """
+        Returns the most recent dates and accuracies for a topic, oldest
+        first, with the dates formatted by SQLite.
+        """
+        date = func.strftime('%Y-%m-%d %H:%M', PerformanceTracker.date)
+        query = PerformanceTracker._in_range(
+            select(date, PerformanceTracker.accuracy), topic_id, start, end
+        )
+        query = query.order_by(PerformanceTracker.date.desc()).limit(limit)
+        return db.session.execute(query).all()[::-1]
+
+    @staticmethod
+    def get_bucketed_series(topic_id, bucket, start=None, end=None, limit=50):
+        """
+        Returns the mean accuracy and number of attempts for a topic in
+        each day, week or month, oldest first, aggregated by SQLite.
+        """
+        period = func.strftime(HISTORY_BUCKETS[bucket], PerformanceTracker.date)
+        query = PerformanceTracker._in_range(
+            select(period, func.avg(PerformanceTracker.accuracy),
+                   func.count()),
+            topic_id, start, end
+        )
+        query = query.group_by(period).order_by(period.desc()).limit(limit)
+        return db.session.execute(query).all()[::-1]
+
+    @staticmethod
+    def get_page(topic_id, before_id=None, page_size=50):
+        """
+        Returns a page of performances for a topic, most recent first.
+
+        Pages are found with a keyset on (date, id): pass the id of the
+        last performance on a page as `before_id` to get the next page.
+        """
+        query = select(PerformanceTracker).where(
+            PerformanceTracker.topic_id == topic_id
+        )
+        if before_id is not None:
+            before = db.session.get(PerformanceTracker, before_id)
+            if before is None:
+                return []
+            query = query.where(or_(
+                PerformanceTracker.date < before.date,
+                and_(PerformanceTracker.date == before.date,
+                     PerformanceTracker.id < before.id)
+            ))
+        query = query.order_by(PerformanceTracker.date.desc(),
+                               PerformanceTracker.id.desc())
+        return db.session.execute(query.limit(page_size)).scalars().all()
@@ -0,0 +1,105 @@
+import threading
+from bisect import bisect_left, insort
+
+from sqlalchemy import select
+
+from app import db, ema_buffer
+from app.models import Question
+
+
+class QuestionPriorityIndex:
+    """
+    An in-memory index of each topic's questions ordered by EMA score.
+
+    Each topic is loaded once, with a single query for the ids and scores
+    of its questions, into an array of (ema_score, id) pairs sorted in the
+    order of a quiz, lowest score first. The array is then kept up to date
+    as answers are checked, so a quiz can be started without sorting or
+    loading any `Question` objects.
+    """
+
+    def __init__(self):
+        # topic_id -> sorted list of (ema_score, question_id)
+        self._entries = {}
+        # topic_id -> {question_id: ema_score}
+        self._scores = {}
+        # topic_id -> sum of the EMA scores
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def _load(self, topic_id):
+        """Load the scores for a topic if they are not already loaded."""
+        if topic_id in self._entries:
+            return self._entries[topic_id]
+        query = (
+            select(Question.ema_score, Question.id)
+            .where(Question.topic_id == topic_id)
+            .order_by(Question.ema_score, Question.id)
+        )
+        entries = [(ema_buffer.get(id_, score), id_)
+                   for score, id_ in db.session.execute(query)]
+        # Scores waiting in the write buffer may change the order
+        entries.sort()
+        self._entries[topic_id] = entries
+        self._scores[topic_id] = {id_: score for score, id_ in entries}
+        self._totals[topic_id] = sum(score for score, _ in entries)
+        return entries
+
+    def ordered_ids(self, topic_id):
+        """Return the ids of all questions in a topic, lowest score first."""
+        with self._lock:
+            return [id_ for _, id_ in self._load(topic_id)]
+
+    def summary(self, topic_id):
+        """Return the number, mean and minimum EMA score of a topic's questions."""
+        with self._lock:
+            entries = self._load(topic_id)
+            if not entries:
+                return 0, 0.0, 0.0
+            count = len(entries)
+            return count, self._totals[topic_id] / count, entries[0][0]
+
+    def loaded_summaries(self):
+        """Return the `summary` of each topic which is loaded, by topic id."""
+        with self._lock:
+            return {
+                topic_id: (len(entries),
+                           self._totals[topic_id] / len(entries),
+                           entries[0][0])
+                for topic_id, entries in self._entries.items() if entries
+            }
+
+    def update(self, topic_id, question_id, ema_score):
+        """
+        Move a question to its position for a new EMA score.
+
+        Topics that have not been loaded yet are left alone, they will
+        read the new score from the database when they are.
+        """
+        with self._lock:
+            if topic_id not in self._entries:
+                return
+            entries = self._entries[topic_id]
+            scores = self._scores[topic_id]
+            old_score = scores.get(question_id)
+            if old_score is not None:
+                del entries[bisect_left(entries, (old_score, question_id))]
+                self._totals[topic_id] -= old_score
+            scores[question_id] = ema_score
+            self._totals[topic_id] += ema_score
+            insort(entries, (ema_score, question_id))
+
+    def invalidate(self, topic_id=None):
+        """Drop one topic, or every topic, so it is reloaded when next used."""
+        with self._lock:
+            if topic_id is None:
+                self._entries.clear()
+                self._scores.clear()
+                self._totals.clear()
+            else:
+                self._entries.pop(topic_id, None)
+                self._scores.pop(topic_id, None)
+                self._totals.pop(topic_id, None)
+
+
+priority_index = QuestionPriorityIndex()
@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional, without it only gzip variants are built
+    brotli = None
+
+from app import app
+from app.models import Question
+
+
+def encode_json(obj):
+    """Encode an object as compact JSON bytes."""
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def compress_variants(body, min_size, gzip_level=9, brotli_quality=11):
+    """
+    Return the compressed variants of a payload, keyed by content coding.
+
+    Payloads smaller than `min_size` bytes are not worth compressing, and
+    a variant which is not smaller than the payload is dropped. The
+    highest levels suit payloads which are compressed once and sent many
+    times, lower ones payloads which are compressed for each response.
+    """
+    if len(body) < min_size:
+        return {}
+    variants = {'gzip': gzip.compress(body, compresslevel=gzip_level,
+                                      mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=brotli_quality)
+    return {coding: data for coding, data in variants.items()
+            if len(data) < len(body)}
+
+
+class CachedQuestion:
+    """
+    The pre-encoded JSON payloads for a question.
+
+    The question payload is what `/get_question` returns, along with its
+    strong ETag and its precompressed variants. The answer payload holds
+    the correct choice and explanation, which `/check_answer` returns
+    along with the result for the selected choice.
+    """
+    __slots__ = ('topic_id', 'correct_choice', 'question_json',
+                 'question_etag', 'question_variants', 'answer_json')
+
+    def __init__(self, question, compress_min_size=1024):
+        self.topic_id = question.topic_id
+        self.correct_choice = question.correct_choice
+        self.question_json = encode_json(question.serialize_question())
+        self.question_etag = hashlib.sha256(self.question_json).hexdigest()
+        self.question_variants = compress_variants(self.question_json,
+                                                   compress_min_size)
+        self.answer_json = encode_json(question.serialize_answer())
+
+    def answer_response(self, is_correct, selected_choice):
+        """Return the JSON bytes for the result of checking an answer."""
+        prefix = encode_json({'is_correct': is_correct,
+                              'selected_choice': selected_choice})
+        # Join the two objects, i.e. drop '}' from one and '{' from the other
+        return prefix[:-1] + b',' + self.answer_json[1:]
+
+
+class QuestionCache:
+    """
+    A read-through LRU cache of the JSON payloads for each question.
+
+    Question content only changes when the data is ingested, so a hit is
+    served without touching the ORM. The cache holds at most `max_entries`
+    questions and must be invalidated after an ingest. Payloads of at
+    least `compress_min_size` bytes are compressed once, as they are
+    loaded, rather than for every response.
+    """
+
+    def __init__(self, max_entries=4096, compress_min_size=1024):
+        self.max_entries = max_entries
+        self.compress_min_size = compress_min_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, question_id):
+        """Return the cached payloads for a question, loading on a miss."""
+        with self._lock:
+            cached = self._entries.get(question_id)
+            if cached is not None:
+                self._entries.move_to_end(question_id)
+                return cached
+        question = Question.query.get(question_id)
+        if question is None:
+            return None
+        cached = CachedQuestion(question, self.compress_min_size)
+        with self._lock:
+            self._entries[question_id] = cached
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cached
+
+    def get_many(self, question_ids):
+        """
+        Return the cached payloads of several questions keyed by id,
+        loading the misses with a single query. Questions which no longer
+        exist are left out.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for question_id in question_ids:
+                cached = self._entries.get(question_id)
+                if cached is None:
+                    missing.append(question_id)
+                else:
+                    self._entries.move_to_end(question_id)
+                    found[question_id] = cached
+        if not missing:
+            return found
+        loaded = {question.id: CachedQuestion(question, self.compress_min_size)
+                  for question in Question.query.filter(
+                      Question.id.in_(missing))}
+        with self._lock:
+            self._entries.update(loaded)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        found.update(loaded)
+        return found
+
+    def preload(self, question_ids):
+        """Load the payloads of several questions with a single query."""
+        question_ids = list(question_ids)[:self.max_entries]
+        questions = Question.query.filter(Question.id.in_(question_ids))
+        with self._lock:
+            for question in questions:
+                self._entries[question.id] = CachedQuestion(
+                    question, self.compress_min_size)
+                self._entries.move_to_end(question.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, question_id=None):
+        """Drop one question, or every question, from the cache."""
+        with self._lock:
+            if question_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(question_id, None)
+
+
+question_cache = QuestionCache(app.config['QUESTION_CACHE_MAX_ENTRIES'],
+                               app.config['COMPRESS_MIN_SIZE'])
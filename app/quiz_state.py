@@ -0,0 +1,147 @@
+import sqlite3
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict, namedtuple
+
+# Type code used to store question ids compactly (signed 64-bit)
+ID_TYPECODE = 'q'
+
+# Topic id stored for mixed review quizzes, which span several topics
+MIXED_TOPIC_ID = 0
+
+QuizState = namedtuple('QuizState', ['topic_id', 'question_ids'])
+
+
+class MemoryQuizStateStore:
+    """
+    Hold the state of each quiz in progress in this process.
+
+    The question ordering of each quiz is kept as a compact array of ids
+    rather than a list. The store is bounded: quizzes expire `ttl` seconds
+    after they start and the least recently used quiz is evicted once
+    there are more than `max_entries`.
+    """
+
+    def __init__(self, max_entries=1024, ttl=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, topic_id, question_ids):
+        """Store a new quiz and return its opaque id."""
+        quiz_id = uuid.uuid4().hex
+        state = QuizState(topic_id, array(ID_TYPECODE, question_ids))
+        with self._lock:
+            self._states[quiz_id] = (time.monotonic() + self.ttl, state)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+        return quiz_id
+
+    def get(self, quiz_id):
+        """Return the state of a quiz, or None if it is unknown or expired."""
+        with self._lock:
+            try:
+                expires, state = self._states[quiz_id]
+            except KeyError:
+                return None
+            if expires < time.monotonic():
+                del self._states[quiz_id]
+                return None
+            self._states.move_to_end(quiz_id)
+            return state
+
+    def replace(self, quiz_id, question_ids):
+        """Replace the questions of a quiz, keeping its topic and expiry."""
+        with self._lock:
+            if quiz_id in self._states:
+                expires, state = self._states[quiz_id]
+                self._states[quiz_id] = (expires, QuizState(
+                    state.topic_id, array(ID_TYPECODE, question_ids)))
+
+    def delete(self, quiz_id):
+        """Remove a quiz from the store."""
+        with self._lock:
+            self._states.pop(quiz_id, None)
+
+
+class SQLiteQuizStateStore:
+    """
+    Hold the state of each quiz in progress in an SQLite database.
+
+    This allows the state to be shared between worker processes. The
+    question ids are stored as the bytes of a compact array and quizzes
+    expire `ttl` seconds after they start.
+    """
+
+    def __init__(self, db_path, ttl=86400):
+        self.db_path = db_path
+        self.ttl = ttl
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS quiz_state (
+                quiz_id TEXT PRIMARY KEY,
+                topic_id INTEGER NOT NULL,
+                question_ids BLOB NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def create(self, topic_id, question_ids):
+        """Store a new quiz and return its opaque id."""
+        quiz_id = uuid.uuid4().hex
+        blob = array(ID_TYPECODE, question_ids).tobytes()
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM quiz_state WHERE expires < ?", (now,))
+            conn.execute("INSERT INTO quiz_state VALUES (?, ?, ?, ?)",
+                         (quiz_id, topic_id, blob, now + self.ttl))
+        conn.close()
+        return quiz_id
+
+    def get(self, quiz_id):
+        """Return the state of a quiz, or None if it is unknown or expired."""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT topic_id, question_ids FROM quiz_state "
+            "WHERE quiz_id = ? AND expires >= ?", (quiz_id, time.time())
+        ).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        question_ids = array(ID_TYPECODE)
+        question_ids.frombytes(row[1])
+        return QuizState(row[0], question_ids)
+
+    def replace(self, quiz_id, question_ids):
+        """Replace the questions of a quiz, keeping its topic and expiry."""
+        blob = array(ID_TYPECODE, question_ids).tobytes()
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE quiz_state SET question_ids = ? "
+                         "WHERE quiz_id = ?", (blob, quiz_id))
+        conn.close()
+
+    def delete(self, quiz_id):
+        """Remove a quiz from the store."""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM quiz_state WHERE quiz_id = ?", (quiz_id,))
+        conn.close()
+
+
+def create_quiz_state_store(config):
+    """Create the quiz state store selected by the app config."""
+    if config['QUIZ_STATE_STORE'] == 'sqlite':
+        return SQLiteQuizStateStore(config['QUIZ_STATE_DB'],
+                                    ttl=config['QUIZ_STATE_TTL'])
+    return MemoryQuizStateStore(max_entries=config['QUIZ_STATE_MAX_ENTRIES'],
+                                ttl=config['QUIZ_STATE_TTL'])
@@ -1,20 +1,86 @@
+import json
+import os
 from datetime import datetime
+from functools import lru_cache
 
-from flask import render_template, url_for, request, session, jsonify
+from flask import (render_template, url_for, request, session, jsonify,
+                   abort, Response, send_from_directory)
+from werkzeug.security import safe_join
 
-from app import app, db
-from app.models import Topic, Question, PerformanceTracker
-from app.helpers import datetime_format, percent
+from app import app, db, ema_buffer, quiz_states
+from app.models import (Topic, Question, PerformanceTracker, QuizPack,
+                        HISTORY_BUCKETS)
+from app.priority import priority_index
+from app.generation import data_generation, score_changes
+from app.question_cache import question_cache, compress_variants, encode_json
+from app.sampling import question_sampler
+from app.topic_stats import topic_stats
+from app.quiz_state import QuizState, MIXED_TOPIC_ID
+from app.helpers import percent
+
+
+@app.before_request
+def check_data_generation():
+    """Drop everything built from the data once an ingest swaps in more."""
+    if data_generation.changed():
+        priority_index.invalidate()
+        question_sampler.invalidate()
+        question_cache.invalidate()
+        topic_stats.invalidate()
+
+
+@app.before_request
+def check_score_changes():
+    """Pick up the EMA scores written by other worker processes."""
+    topic_ids = set()
+    for question_id, topic_id, ema_score in score_changes.changes():
+        # A score from this process may be newer, waiting to be written
+        ema_score = ema_buffer.get(question_id, ema_score)
+        priority_index.update(topic_id, question_id, ema_score)
+        question_sampler.update(question_id, ema_score)
+        topic_ids.add(topic_id)
+    for topic_id in topic_ids:
+        topic_stats.refresh(topic_id)
 
 
 @app.route('/')
 @app.route('/index')
 def index():
     """Render the index page and display all topics."""
-    topics = Topic.get_all_topics()
+    topics = topic_stats.all()
     return render_template('index.html', topics=topics)
 
 
+@lru_cache(maxsize=1024)
+def file_digest(path, mtime_ns, size):
+    """Return the content hash of a data file, computed once per version."""
+    from utils import asset_digest
+    return asset_digest(path)
+
+
+@app.route('/assets/<digest>/<path:filename>')
+def asset(digest, filename):
+    """Serve a data file by its content-hashed URL, cached for good.
+
+    The URLs are written into the questions when the data is ingested, a
+    file whose content changes gets a new URL, so it is safe for clients
+    to cache them forever. A URL whose hash is not that of the current
+    content is not found, rather than caching other content under it.
+    """
+    data_dir = os.path.join(app.static_folder, 'data')
+    path = safe_join(data_dir, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    stat = os.stat(path)
+    if digest != file_digest(path, stat.st_mtime_ns, stat.st_size):
+        abort(404)
+    response = send_from_directory(data_dir, filename,
+                                   max_age=app.config['ASSET_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 @app.route('/quiz')
 def quiz():
     """Render the quiz page."""
@@ -24,73 +90,295 @@ def quiz():
 @app.route('/history')
 def history_list():
     """Retrieve all topics with performance and render history-list."""
-    topics = Topic.get_all_topics_with_performance()
+    topics = topic_stats.with_attempts()
     return render_template('history_list.html', topics=topics)
 
 
 @app.route('/history/<topic_id>')
 def history_detail(topic_id):
-    """Retrieve the performance for a given topic and render history-detail."""
+    """Retrieve a page of performance for a topic and render history-detail.
+
+    The page starts after the performance with the id in the `before`
+    query parameter, or at the most recent performance.
+    """
     topic = Topic.query.get(topic_id)
-    history = topic.get_performance()
-    return render_template('history_detail.html', history=history, topic=topic)
+    page_size = app.config['HISTORY_PAGE_SIZE']
+    before_id = request.args.get('before', type=int)
+    # Fetch one extra row to find out if there is another page
+    history = PerformanceTracker.get_page(topic.id, before_id, page_size + 1)
+    next_id = history[page_size - 1].id if len(history) > page_size else None
+    return render_template('history_detail.html', history=history[:page_size],
+                           topic=topic, next_id=next_id,
+                           is_first_page=before_id is None)
+
+
+def get_date_arg(name):
+    """Return a query parameter parsed as an ISO date, or None if missing."""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, f"Invalid date for '{name}'")
+
+
+def get_limit_arg(max_value):
+    """Return the `limit` query parameter, clamped between 1 and `max_value`.
+
+    N.B. SQLite treats a negative LIMIT as no limit at all.
+    """
+    limit = request.args.get('limit', max_value, type=int)
+    return max(1, min(limit, max_value))
 
 
 @app.route('/get_barchart_data/<topic_id>')
 def get_barchart_data(topic_id):
-    """Retrieve the performance for a given topic and return as JSON."""
-    topic = Topic.query.get(topic_id)
-    history = topic.get_performance()
-    dates = [datetime_format(item.date) for item in history]
-    accuracies = [item.accuracy for item in history]
-    return jsonify({'dates': dates, 'accuracies': accuracies})
+    """Retrieve the performance for a given topic and return as JSON.
+
+    The `from` and `to` query parameters limit the dates, `limit` the
+    number of points (the most recent are kept). If `bucket` is 'day',
+    'week' or 'month' the mean accuracy and number of attempts in each
+    period are returned instead of every performance.
+    """
+    start, end = get_date_arg('from'), get_date_arg('to')
+    limit = get_limit_arg(app.config['HISTORY_MAX_POINTS'])
+    bucket = request.args.get('bucket')
+    if bucket is None:
+        history = PerformanceTracker.get_series(topic_id, start, end, limit)
+        return conditional_response(jsonify({
+            'dates': [date for date, _ in history],
+            'accuracies': [accuracy for _, accuracy in history]
+        }))
+    if bucket not in HISTORY_BUCKETS:
+        abort(400, f"Invalid bucket '{bucket}'")
+    history = PerformanceTracker.get_bucketed_series(topic_id, bucket, start,
+                                                     end, limit)
+    return conditional_response(jsonify({
+        'dates': [period for period, _, _ in history],
+        'accuracies': [accuracy for _, accuracy, _ in history],
+        'counts': [count for _, _, count in history]
+    }))
+
+
+@app.route('/search')
+def search():
+    """Search the questions and return the best matches as JSON.
+
+    The `q` query parameter holds the words to search for, `topic_id`
+    limits the results to one topic and `limit` their number.
+    """
+    limit = get_limit_arg(app.config['SEARCH_MAX_RESULTS'])
+    results = Question.search(request.args.get('q', ''),
+                              request.args.get('topic_id', type=int), limit)
+    return jsonify({'results': results})
+
+
+def create_quiz(topic_id):
+    """Store the sorted questions for a new quiz and return its state.
+
+    The question ids are held in the server-side quiz state store, the
+    session cookie only carries the opaque id of the quiz.
+    """
+    sorted_questions = priority_index.ordered_ids(topic_id)
+    session['quiz_id'] = quiz_states.create(topic_id, sorted_questions)
+    return QuizState(topic_id, sorted_questions)
+
+
+def create_mixed_quiz(topic_ids, number_of_questions):
+    """Store the questions drawn for a new mixed review quiz, return its state.
+
+    The questions are drawn from the topics in `topic_ids` (every topic if
+    None), weighted towards those with the lowest EMA scores.
+    """
+    question_ids = question_sampler.sample(number_of_questions, topic_ids)
+    session['quiz_id'] = quiz_states.create(MIXED_TOPIC_ID, question_ids)
+    return QuizState(MIXED_TOPIC_ID, question_ids)
+
+
+def end_quiz():
+    """Remove the state of the current quiz and clear the session."""
+    if 'quiz_id' in session:
+        quiz_states.delete(session['quiz_id'])
+    session.clear()
+
+
+def get_quiz_state():
+    """Return the state of the current quiz, or None if there is none."""
+    quiz_id = session.get('quiz_id')
+    if quiz_id is None:
+        return None
+    return quiz_states.get(quiz_id)
+
+
+def get_cached_question(state, idx):
+    """Return the cached payloads of a question in the quiz by index.
+
+    If an ingest has removed the question while the quiz is in progress
+    it is replaced, in the quiz state too, by a question of the quiz's
+    topic which is not in the quiz yet (of any topic for a mixed review).
+    Answers are credited to the quiz's topic, so if there is none the
+    question is dropped and the quiz shrinks, the next question taking
+    its place.
+
+    Returns:
+        CachedQuestion: The question's payloads, or None if the quiz has
+                        no question at `idx` (any more).
+    """
+    topic_ids = None if state.topic_id == MIXED_TOPIC_ID else [state.topic_id]
+    while idx < len(state.question_ids):
+        cached = question_cache.get(state.question_ids[idx])
+        if cached is not None:
+            return cached
+        in_quiz = set(state.question_ids)
+        for question_id in question_sampler.sample(len(in_quiz) + 1,
+                                                   topic_ids):
+            if question_id in in_quiz:
+                continue
+            cached = question_cache.get(question_id)
+            if cached is not None:
+                state.question_ids[idx] = question_id
+                quiz_states.replace(session['quiz_id'], state.question_ids)
+                return cached
+        del state.question_ids[idx]
+        quiz_states.replace(session['quiz_id'], state.question_ids)
+    return None
+
+
+def question_payload(state, idx, etag=None):
+    """Return the JSON bytes of a question, or null past the last one.
+
+    The payload holds the question's ETag, for the client to keep it with.
+    If `etag` is the question's current ETag the client already holds the
+    question, so only its id is returned, marked as not modified.
+    """
+    cached = get_cached_question(state, idx)
+    if cached is None:
+        return b'null'
+    if etag == cached.question_etag:
+        return b'{"id":%d,"not_modified":true}' % state.question_ids[idx]
+    # Add the ETag to the object, i.e. before its closing '}'
+    return (cached.question_json[:-1]
+            + b',"etag":"%s"}' % cached.question_etag.encode())
+
+
+def grade_answer(state, idx, selected_choice):
+    """Check an answer, update the question's score and return the result.
+
+    Compares the selected choice with the correct choice of the question to
+    determine if the answer is correct and updates the question's score
+    based on the correctness of the answer.
+
+    Returns:
+        bytes: The JSON result, including the correctness, selected choice,
+               correct choice and explanation.
+    """
+    question_id = state.question_ids[idx]
+    cached = question_cache.get(question_id)
+    if cached is None:
+        # Removed by an ingest since it was shown, it cannot be graded
+        abort(404, 'Question not found')
+    is_correct = 1 if cached.correct_choice == selected_choice else 0
+    ema_score = Question.update_score(question_id, is_correct)
+    # The question may have been removed by an ingest since it was shown
+    if ema_score is not None:
+        priority_index.update(cached.topic_id, question_id, ema_score)
+        question_sampler.update(question_id, ema_score)
+        topic_stats.record_scores(cached.topic_id,
+                                  *priority_index.summary(cached.topic_id))
+    return cached.answer_response(is_correct, selected_choice)
+
+
+def json_response(body):
+    """Return a response for JSON which has already been encoded."""
+    return Response(body, mimetype='application/json')
+
+
+def conditional_response(response):
+    """Add a strong ETag to a response, answering 304 if the client has it.
+
+    The client must revalidate before reusing its copy, which costs no
+    more than the headers while the content is unchanged.
+    """
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def accepted_coding(variants):
+    """Return the coding of the smallest variant the client accepts, or None.
+
+    Args:
+        variants (dict): Compressed payloads keyed by content coding, see
+                         `compress_variants`.
+    """
+    return min((coding for coding in variants
+                if request.accept_encodings[coding]),
+               key=lambda coding: len(variants[coding]), default=None)
+
+
+def question_response(cached):
+    """Return the question payload of a cached question.
+
+    The smallest precompressed variant the client accepts is sent, each
+    variant having its own strong ETag, and a GET for the variant the
+    client already has is answered with 304.
+    """
+    coding = accepted_coding(cached.question_variants)
+    if coding is None:
+        response = json_response(cached.question_json)
+        response.set_etag(cached.question_etag)
+    else:
+        response = json_response(cached.question_variants[coding])
+        response.content_encoding = coding
+        response.set_etag(f'{cached.question_etag}-{coding}')
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/question/<int:question_id>')
+def question(question_id):
+    """Get a question by id, without its answer, for a quiz to show.
+
+    The payload only changes when the data is ingested, so clients keep it
+    and revalidate it with its ETag.
+    """
+    cached = question_cache.get(question_id)
+    if cached is None:
+        abort(404, 'Question not found')
+    return question_response(cached)
 
 
 @app.route('/get_question', methods=['POST'])
 def get_question():
     """Get the next question for the quiz.
 
-    Retrieves the sorted questions from the session if they already exist.
-    If not, it initializes the quiz by creating and storing the sorted
-    questions in the session. If the topic ID has changed, it clears the
-    session and updates the questions accordingly. Finally, it retrieves
-    and returns the current question.
+    Retrieves the current quiz state if it already exists. If not, or if
+    the topic ID has changed, it initializes the quiz by creating and
+    storing the sorted questions in the quiz state store. Finally, it
+    retrieves and returns the current question.
 
     Returns:
         A JSON response containing the serialized question.
     """
-    try:
-        # Retrieve sorted questions and topic ID from session
-        sorted_questions = session['sorted_questions']
-        topic_id = session['topic_id']
-    except KeyError:
-        # Initialize quiz
-        topic_id = request.json['topic_id']
-        topic = Topic.query.get(topic_id)
-        sorted_questions = [q.id for q in topic.get_questions()]
-        session['sorted_questions'] = sorted_questions
-        session['topic_id'] = topic_id
-        session['number_of_questions'] = len(sorted_questions)
-    else:
-        new_topic_id = request.json['topic_id']
-        if new_topic_id != topic_id:
-            # New topic, clear current session and update questions
-            session.clear()
-            topic = Topic.query.get(new_topic_id)
-            sorted_questions = [q.id for q in topic.get_questions()]
-            session['sorted_questions'] = sorted_questions
-            session['topic_id'] = new_topic_id
-            session['number_of_questions'] = len(sorted_questions)
-    question_id = sorted_questions[request.json['current_idx']]
-    return jsonify(Question.query.get(question_id).serialize())
+    topic_id = int(request.json['topic_id'])
+    state = get_quiz_state()
+    if state is None or state.topic_id != topic_id:
+        # New quiz or new topic, clear current session and update questions
+        end_quiz()
+        state = create_quiz(topic_id)
+    cached = get_cached_question(state, request.json['current_idx'])
+    if cached is None:
+        abort(404, 'Question not found')
+    return question_response(cached)
 
 
 @app.route('/get_number_of_questions', methods=['POST'])
 def get_number_of_questions():
     """Get the number of questions for the quiz and return as JSON."""
-    topic_id = request.json['topicId']
-    topic = Topic.query.get(topic_id)
-    number_of_questions = topic.get_number_of_questions()
+    topic = topic_stats.get(int(request.json['topicId']))
+    number_of_questions = topic.question_count
     return jsonify({'number_of_questions': number_of_questions})
 
 
@@ -98,43 +386,265 @@ def get_number_of_questions():
 def check_answer():
     """Check the submitted answer for a question.
 
-    Retrieves the current question based on the provided index and session data.
-    Compares the selected choice with the correct choice of the question to
-    determine if the answer is correct. Updates the question's score based on
-    the correctness of the answer. Returns a JSON response with the result,
-    including the correctness, selected choice, correct choice and explanation.
+    Retrieves the current question based on the provided index and session
+    data, grades the answer and returns a JSON response with the result.
 
     Returns:
         A JSON response containing the result of the answer check.
     """
+    state = get_quiz_state()
+    if state is None:
+        abort(400, 'No quiz in progress')
+    return json_response(grade_answer(state, request.json['current_idx'],
+                                      request.json['selected_choice']))
+
+
+@app.route('/start_quiz', methods=['POST'])
+def start_quiz():
+    """Start a quiz and return its first question in a single request.
+
+    Any quiz already in progress is replaced. If `mode` is 'mixed' a mixed
+    review quiz of `number_of_questions` questions is drawn from the
+    topics in `topic_ids` (or every topic), otherwise the quiz covers
+    every question in `topic_id`.
+
+    Returns:
+        A JSON response containing the number of questions, the ids of the
+        questions in quiz order and the first question (null if the topic
+        has no questions).
+    """
+    if request.json.get('mode') == 'mixed':
+        number_of_questions = request.json.get('number_of_questions',
+                                               app.config['MIXED_QUIZ_SIZE'])
+        topic_ids = request.json.get('topic_ids')
+        try:
+            number_of_questions = int(number_of_questions)
+            if topic_ids is not None:
+                topic_ids = [int(topic_id) for topic_id in topic_ids]
+        except (TypeError, ValueError):
+            abort(400, 'Invalid mixed quiz options')
+        if number_of_questions < 1:
+            abort(400, 'Invalid mixed quiz options')
+        end_quiz()
+        state = create_mixed_quiz(topic_ids, number_of_questions)
+    else:
+        end_quiz()
+        state = create_quiz(int(request.json['topic_id']))
+    # The first question is loaded first, as it may shrink the quiz
+    question = question_payload(state, 0)
+    return json_response(
+        b'{"number_of_questions":%d,"question_ids":[%s],"question":%s}'
+        % (len(state.question_ids),
+           b','.join(b'%d' % question_id
+                     for question_id in state.question_ids),
+           question)
+    )
+
+
+@app.route('/answer_question', methods=['POST'])
+def answer_question():
+    """Check an answer and return the next question in a single request.
+
+    Combines `/check_answer` and `/get_question`, so the next question
+    is already on the client when the user moves on to it. A client
+    which kept the next question from an earlier quiz sends its ETag as
+    `next_question_etag`, and while it matches only the id is returned,
+    see `question_payload`.
+
+    Returns:
+        A JSON response containing the result of the answer check, the
+        next question (null after the last question) and the number of
+        questions, which is smaller if the quiz has shrunk, see
+        `get_cached_question`.
+    """
+    state = get_quiz_state()
+    if state is None:
+        abort(400, 'No quiz in progress')
     current_idx = request.json['current_idx']
-    question_id = session['sorted_questions'][current_idx]
-    question = Question.query.get(question_id)
-    selected_choice = request.json['selected_choice']
-    is_correct = 1 if question.correct_choice == selected_choice else 0
-    question.update(is_correct)
-    return jsonify({
-        'is_correct': is_correct,
-        'selected_choice': selected_choice,
-        'correct_choice': question.correct_choice,
-        'explanation': question.question_explanation
-    })
+    result = grade_answer(state, current_idx, request.json['selected_choice'])
+    next_question = question_payload(
+        state, current_idx + 1, request.json.get('next_question_etag'))
+    return json_response(
+        b'{"result":%s,"next_question":%s,"number_of_questions":%d}'
+        % (result, next_question, len(state.question_ids))
+    )
+
+
+@app.route('/quiz_pack', methods=['POST'])
+def quiz_pack():
+    """Export every question of a topic for a quiz run on the client.
+
+    The questions are in quiz order, without their answers, which stay on
+    the server to grade the answers sent to `/sync_results`. The pack is
+    stored in the database, so it can be synced after a long time offline,
+    up to `QUIZ_PACK_TTL` seconds. Expired packs are removed meanwhile.
+
+    Returns:
+        A JSON response, compressed if the client accepts it, containing
+        the pack id, the topic id and the question payloads.
+    """
+    topic_id = int(request.json['topic_id'])
+    question_ids = priority_index.ordered_ids(topic_id)
+    cached_questions = question_cache.get_many(question_ids)
+    question_ids = [question_id for question_id in question_ids
+                    if question_id in cached_questions]
+    QuizPack.purge(datetime.now(), app.config['QUIZ_PACK_TTL'],
+                   app.config['QUIZ_PACK_SYNCED_TTL'])
+    pack = QuizPack.create(topic_id, question_ids)
+    body = (b'{"pack_id":"%s","topic_id":%d,"questions":[%s]}'
+            % (pack.id.encode(), topic_id,
+               b','.join(cached_questions[question_id].question_json
+                         for question_id in question_ids)))
+    variants = compress_variants(body, app.config['COMPRESS_MIN_SIZE'],
+                                 app.config['QUIZ_PACK_GZIP_LEVEL'],
+                                 app.config['QUIZ_PACK_BROTLI_QUALITY'])
+    coding = accepted_coding(variants)
+    if coding is None:
+        return json_response(body)
+    response = json_response(variants[coding])
+    response.content_encoding = coding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def apply_sync(pack, question_ids, answers):
+    """Grade the answers to a quiz pack and save them in one transaction.
+
+    The pack is claimed first, so a concurrent sync of the same pack
+    finds it already synced before anything else is written. Answers to
+    questions removed by an ingest are not graded. Expired packs are
+    removed in the same transaction.
+
+    Returns:
+        bool: False if the pack had already been synced, in which case
+              nothing is written.
+    """
+    cached_questions = question_cache.get_many(question_ids)
+    results = []
+    for question_id, selected_choice in zip(question_ids, answers):
+        if selected_choice is None:
+            continue
+        cached = cached_questions.get(question_id)
+        if cached is None:
+            continue
+        is_correct = 1 if cached.correct_choice == selected_choice else 0
+        results.append([question_id, selected_choice, is_correct])
+    date = datetime.now()
+    if not pack.claim(results, date):
+        db.session.rollback()
+        return False
+    QuizPack.purge(date, app.config['QUIZ_PACK_TTL'],
+                   app.config['QUIZ_PACK_SYNCED_TTL'])
+    ema_scores = Question.apply_scores(
+        [(question_id, is_correct) for question_id, _, is_correct in results])
+    topic = Topic.query.get(pack.topic_id)
+    # The topic may have been removed by an ingest since the export
+    if results and topic is not None:
+        accuracy = sum(result[2] for result in results) / len(results)
+        topic.last_seen = date
+        performance_tracker = PerformanceTracker(
+            topic_id=topic.id, accuracy=accuracy,
+            topic_name=topic.name, date=date)
+        db.session.add(performance_tracker)
+        db.session.flush()
+        pack.performance_id = performance_tracker.id
+        topic_stats.record_attempt(topic.id, accuracy, date)
+    db.session.commit()
+    # The in-memory scores and stats follow once the sync is committed
+    for question_id, ema_score in ema_scores.items():
+        priority_index.update(pack.topic_id, question_id, ema_score)
+        question_sampler.update(question_id, ema_score)
+    topic_stats.refresh(pack.topic_id)
+    return True
+
+
+def sync_response(pack):
+    """Return the JSON bytes for the results of a synced quiz pack."""
+    results = json.loads(pack.results)
+    cached_questions = question_cache.get_many(
+        [question_id for question_id, _, _ in results])
+    payloads = []
+    for question_id, selected_choice, is_correct in results:
+        cached = cached_questions.get(question_id)
+        if cached is None:
+            payload = encode_json({'is_correct': is_correct,
+                                   'selected_choice': selected_choice})
+        else:
+            payload = cached.answer_response(is_correct, selected_choice)
+        payloads.append(b'{"question_id":%d,%s' % (question_id, payload[1:]))
+    correct = sum(is_correct for _, _, is_correct in results)
+    accuracy = correct / len(results) if results else None
+    return (b'{"pack_id":%s,"accuracy":%s,"results":[%s]}'
+            % (encode_json(pack.id), encode_json(accuracy),
+               b','.join(payloads)))
+
+
+@app.route('/sync_results', methods=['POST'])
+def sync_results():
+    """Grade and save all the answers to a quiz pack in a single request.
+
+    `answers` holds the selected choice for each question of the pack, in
+    order, or null for a question which was not answered. The answers are
+    graded on the server, then every EMA score update, the topic's
+    performance and a record of the sync are committed together. Syncing
+    a pack again returns the recorded results without applying them twice,
+    so a client can safely retry after losing the response, for up to
+    `QUIZ_PACK_SYNCED_TTL` seconds.
+
+    Returns:
+        A JSON response containing the accuracy and, for each answer, the
+        result, the correct choice and the explanation.
+    """
+    pack_id = request.json.get('pack_id')
+    answers = request.json.get('answers')
+    if (not isinstance(pack_id, str) or not isinstance(answers, list)
+            or not all(answer is None or type(answer) is int
+                       for answer in answers)):
+        abort(400, 'Invalid quiz pack results')
+    pack = db.session.get(QuizPack, pack_id)
+    if pack is None or pack.is_expired(datetime.now(),
+                                       app.config['QUIZ_PACK_TTL']):
+        abort(404, 'Quiz pack not found')
+    if pack.synced is None:
+        question_ids = pack.get_question_ids()
+        if len(answers) != len(question_ids):
+            abort(400, 'Expected an answer for each question of the pack')
+        # Buffered scores are written first so they cannot overwrite these
+        ema_buffer.flush()
+        # If a concurrent retry synced the pack first, the pack is reloaded
+        # with its results
+        apply_sync(pack, question_ids, answers)
+    return json_response(sync_response(pack))
 
 
 @app.route('/save_results', methods=['POST'])
 def save_results():
-    """Save the results to database, clear session and confirm success."""
-    topic_id = request.json['topic_id']
+    """Save the results to database, clear session and confirm success.
+
+    Mixed review quizzes, sent without a topic id, span several topics so
+    no performance is recorded for them.
+    """
+    if request.json.get('topic_id') is None:
+        ema_buffer.flush()
+        end_quiz()
+        return jsonify({'success': True})
+    topic_id = int(request.json['topic_id'])
     accuracy = request.json['accuracy']
+    date = datetime.now()
     # Update the topic's last seen date
     topic = Topic.query.get(topic_id)
-    topic.last_seen = datetime.now()
+    topic.last_seen = date
     # Add results as PerformanceTracker object
     performance_tracker = PerformanceTracker(topic_id=topic_id,
                                              accuracy=accuracy,
-                                             topic_name=topic.name)
+                                             topic_name=topic.name,
+                                             date=date)
     db.session.add(performance_tracker)
+    topic_stats.record_attempt(topic_id, accuracy, date)
     db.session.commit()
-    # Clear session
-    session.clear()
+    # Write any buffered EMA scores from this quiz
+    ema_buffer.flush()
+    topic_stats.refresh(topic_id)
+    # Clear session and the quiz state
+    end_quiz()
     return jsonify({'success': True})
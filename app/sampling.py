@@ -0,0 +1,154 @@
+import random
+import threading
+
+from sqlalchemy import select
+
+from app import app, db, ema_buffer
+from app.models import Question
+
+
+class FenwickTree:
+    """
+    A Fenwick (binary indexed) tree of weights.
+
+    Supports changing a weight and finding the position of a cumulative
+    weight in O(log n), which is used for weighted random sampling.
+    """
+
+    def __init__(self, weights):
+        self.weights = list(weights)
+        self.size = len(self.weights)
+        # Build the tree in O(n), tree[i] holds the sum of a range ending at i
+        self.tree = [0.0] + self.weights
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self.total = sum(self.weights)
+
+    def set(self, idx, weight):
+        """Set the weight at a (0-based) position."""
+        delta = weight - self.weights[idx]
+        self.weights[idx] = weight
+        self.total += delta
+        i = idx + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        """Return the position whose cumulative weight range holds `value`."""
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= value:
+                pos = nxt
+                value -= self.tree[nxt]
+            step >>= 1
+        # Guard against rounding error at the very end of the range
+        return min(pos, self.size - 1)
+
+
+class WeightedQuestionSampler:
+    """
+    Sample questions across topics, weighted towards low EMA scores.
+
+    Every question is held in a Fenwick tree for its topic, loaded once
+    with a single query for the ids, topics and scores. A question's
+    weight is `1 - ema_score` plus `min_weight`, so questions that have
+    been mastered still come up occasionally. Drawing a question costs
+    O(t + log n) for t topics, and `update` adjusts a weight in O(log n),
+    so starting a review never sorts or loads the question table.
+    """
+
+    def __init__(self, min_weight=0.05):
+        self.min_weight = min_weight
+        # topic_id -> FenwickTree
+        self._trees = None
+        # topic_id -> list of question ids by position in its tree
+        self._ids = None
+        # question_id -> (topic_id, position)
+        self._positions = None
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def weight(self, ema_score):
+        """Return the sampling weight for an EMA score."""
+        return max(1.0 - ema_score, 0.0) + self.min_weight
+
+    def _load(self):
+        """Load the scores of every question if they are not already loaded."""
+        if self._trees is not None:
+            return
+        query = select(Question.topic_id, Question.id, Question.ema_score)
+        weights = {}
+        self._ids = {}
+        self._positions = {}
+        for topic_id, question_id, ema_score in db.session.execute(query):
+            ids = self._ids.setdefault(topic_id, [])
+            self._positions[question_id] = (topic_id, len(ids))
+            ids.append(question_id)
+            ema_score = ema_buffer.get(question_id, ema_score)
+            weights.setdefault(topic_id, []).append(self.weight(ema_score))
+        self._trees = {topic_id: FenwickTree(topic_weights)
+                       for topic_id, topic_weights in weights.items()}
+
+    def preload(self):
+        """Load the weights now rather than on the first draw."""
+        with self._lock:
+            self._load()
+
+    def sample(self, k, topic_ids=None):
+        """
+        Draw up to `k` distinct question ids, from every topic or only from
+        `topic_ids`, with probability proportional to their weights.
+        """
+        with self._lock:
+            self._load()
+            if topic_ids is None:
+                topic_ids = list(self._trees)
+            trees = [(topic_id, self._trees[topic_id])
+                     for topic_id in topic_ids if topic_id in self._trees]
+            k = min(k, sum(tree.size for _, tree in trees))
+            drawn = []
+            # Weights are set to zero while drawing so questions are not
+            # drawn twice, and restored afterwards
+            removed = []
+            try:
+                while len(drawn) < k:
+                    total = sum(tree.total for _, tree in trees)
+                    if total <= 0:
+                        break
+                    value = self._random.random() * total
+                    for topic_id, tree in trees:
+                        if value < tree.total:
+                            break
+                        value -= tree.total
+                    pos = tree.find(value)
+                    if tree.weights[pos] <= 0:
+                        # Rounding landed on a drawn question, draw again
+                        continue
+                    removed.append((tree, pos, tree.weights[pos]))
+                    tree.set(pos, 0.0)
+                    drawn.append(self._ids[topic_id][pos])
+            finally:
+                for tree, pos, weight in removed:
+                    tree.set(pos, weight)
+            return drawn
+
+    def update(self, question_id, ema_score):
+        """Set the weight of a question from its new EMA score."""
+        with self._lock:
+            if self._positions is None or question_id not in self._positions:
+                return
+            topic_id, pos = self._positions[question_id]
+            self._trees[topic_id].set(pos, self.weight(ema_score))
+
+    def invalidate(self):
+        """Drop all weights so they are reloaded when next used."""
+        with self._lock:
+            self._trees = self._ids = self._positions = None
+
+
+question_sampler = WeightedQuestionSampler(app.config['SAMPLING_MIN_WEIGHT'])
@@ -42,13 +42,13 @@ function populateDropdown(minValue, maxValue, defaultValue) {
 
 // Event listener used to display the chart once the page is loaded
 document.addEventListener('DOMContentLoaded', function () {
-  const url = window.location.href;
-  const topicId = url.split('/').pop();
+  // The path is /history/<topic_id>, the query string holds the page
+  const topicId = window.location.pathname.split('/').pop();
   let chart = null;
 
-  // Fetch the chart data from the server using ajax
-  function fetchData(topicId) {
-    return fetch('/get_barchart_data/' + topicId)
+  // Fetch the most recent chart data from the server using ajax
+  function fetchData(topicId, limit) {
+    return fetch('/get_barchart_data/' + topicId + '?limit=' + limit)
       .then(response => response.json())
       .catch(error => {
         console.error('Error fetching chart data:', error);
@@ -1,33 +1,18 @@
 // Global variables
 const selectedTopicId = getTopicIdFromURL();
+const isMixedReview = getModeFromURL() === 'mixed';
 let questionCount = 0;
 let questionIndex = 0;
 let progress = 0;
 let accuracy = 0.0;
+// The ids of the questions in quiz order, and the next question, loaded
+// along with the result of each answer
+let questionIds = [];
+let nextQuestion = null;
 
-// Function to handle the topic selection
+// Function to handle the topic selection, the quiz is started by quiz.html
 function selectTopic(topicId) {
-  fetch('/get_question', {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json'
-    },
-    body: JSON.stringify({
-      topic_id: topicId,
-      current_idx: questionIndex
-    })
-  })
-    .then(response => {
-      if (response.ok) {
-        // Redirect to quiz.html
-        window.location.href = `/quiz?topic_id=${topicId}`;
-      } else {
-        throw new Error('Error:', response.statusText);
-      }
-    })
-    .catch(error => {
-      console.error('Error selecting topic:', error);
-    });
+  window.location.href = `/quiz?topic_id=${topicId}`;
 }
 
 // Function to retrieve the topic ID from the URL
@@ -36,28 +21,15 @@ function getTopicIdFromURL() {
   return urlParams.get('topic_id');
 }
 
-// Function to retrieve the number of questions for a topic
-function getNumberOfQuestions(topicId) {
-  fetch('/get_number_of_questions', {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json'
-    },
-    body: JSON.stringify({ topicId })
-  })
-    .then(response => {
-      if (response.ok) {
-        return response.json();
-      } else {
-        throw new Error('Error:', response.statusText);
-      }
-    })
-    .then(data => {
-      questionCount = data.number_of_questions;
-    })
-    .catch(error => {
-      console.error('Error:', error);
-    });
+// Function to start a mixed review quiz across all topics
+function selectMixedReview() {
+  window.location.href = '/quiz?mode=mixed';
+}
+
+// Function to retrieve the quiz mode from the URL
+function getModeFromURL() {
+  const urlParams = new URLSearchParams(window.location.search);
+  return urlParams.get('mode');
 }
 
 // Function to update the UI with the next question
@@ -81,10 +53,13 @@ function updateQuestionInterface(question) {
   var progressTracker = document.getElementById('progress-tracker');
   progressTracker.innerHTML = `Question: ${questionIndex + 1}/${questionCount}`;
 
-  // Call the syntax highlighting after the content is added to the DOM
-  setTimeout(() => {
-    hljs.highlightAll();
-  }, 0);
+  // Call the syntax highlighting after the content is added to the DOM,
+  // unless the code was already highlighted when the data was ingested
+  if (!question.highlighted) {
+    setTimeout(() => {
+      hljs.highlightAll();
+    }, 0);
+  }
 }
 
 // Function to handle the AJAX success response for checking the answer
@@ -147,14 +122,50 @@ function handleAnswerCheckResponse(response, selectedChoice) {
     listItems[i].style.pointerEvents = 'none';
   }
 
-  // Call the syntax highlighting after the content is added to the DOM
-  setTimeout(function () {
-    hljs.highlightAll();
-  }, 0);
+  // Call the syntax highlighting after the content is added to the DOM,
+  // unless the code was already highlighted when the data was ingested
+  if (!response.highlighted) {
+    setTimeout(function () {
+      hljs.highlightAll();
+    }, 0);
+  }
 }
 
-// Function to retrieve the next question using AJAX
+// Function to get a question kept from an earlier quiz, or null
+function getStoredQuestion(questionId) {
+  try {
+    return JSON.parse(localStorage.getItem(`question-${questionId}`));
+  } catch (error) {
+    return null;
+  }
+}
+
+// Function to keep a question, with its ETag, for later quizzes
+function storeQuestion(question) {
+  try {
+    localStorage.setItem(`question-${question.id}`, JSON.stringify(question));
+  } catch (error) {
+    // Storage is full or disabled, the question is sent again next time
+  }
+}
+
+// Function to resolve a question payload, which only holds the id of the
+// question if the stored copy is still current
+function resolveQuestion(question) {
+  if (question.not_modified) {
+    return getStoredQuestion(question.id);
+  }
+  storeQuestion(question);
+  return question;
+}
+
+// Function to show the next question, which is normally already loaded
 function getNextQuestion() {
+  if (nextQuestion) {
+    updateQuestionInterface(nextQuestion);
+    nextQuestion = null;
+    return;
+  }
   fetch('/get_question', {
     method: 'POST',
     headers: {
@@ -180,16 +191,20 @@ function getNextQuestion() {
     });
 }
 
-// Function to check the selected answer using AJAX
+// Function to check the selected answer and load the next question using AJAX
 function checkAnswer(selectedChoice) {
-  fetch('/check_answer', {
+  // Send the ETag of the next question if it is stored, so the question
+  // is only sent again if it has changed
+  const stored = getStoredQuestion(questionIds[questionIndex + 1]);
+  fetch('/answer_question', {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json'
     },
     body: JSON.stringify({
       current_idx: questionIndex,
-      selected_choice: selectedChoice
+      selected_choice: selectedChoice,
+      next_question_etag: stored ? stored.etag : null
     })
   })
     .then(response => {
@@ -200,7 +215,12 @@ function checkAnswer(selectedChoice) {
       }
     })
     .then(response => {
-      handleAnswerCheckResponse(response, selectedChoice);
+      // The quiz is shorter if questions were removed since it started
+      questionCount = response.number_of_questions;
+      // The next question is ready while the explanation is read
+      nextQuestion = response.next_question ?
+        resolveQuestion(response.next_question) : null;
+      handleAnswerCheckResponse(response.result, selectedChoice);
     })
     .catch(error => {
       console.error('Error:', error);
@@ -224,11 +244,36 @@ function saveResults() {
     });
 }
 
-// Function to start the quiz
+// Function to start the quiz, loading the first question in the same request
 function startQuiz() {
-  if (selectedTopicId) {
+  if (selectedTopicId || isMixedReview) {
     console.log('Starting quiz for topic ID:', selectedTopicId);
-    questionCount = getNumberOfQuestions(selectedTopicId);
-    getNextQuestion();
+    // Mixed review quizzes are drawn from every topic
+    const options = isMixedReview ? { mode: 'mixed' } :
+      { topic_id: selectedTopicId };
+    fetch('/start_quiz', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify(options)
+    })
+      .then(response => {
+        if (response.ok) {
+          return response.json();
+        } else {
+          throw new Error('Error:' + response.status);
+        }
+      })
+      .then(data => {
+        questionCount = data.number_of_questions;
+        questionIds = data.question_ids;
+        if (data.question) {
+          updateQuestionInterface(resolveQuestion(data.question));
+        }
+      })
+      .catch(error => {
+        console.error('Error:', error);
+      });
   }
 }
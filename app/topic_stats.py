@@ -0,0 +1,135 @@
+import threading
+import time
+
+from sqlalchemy import select, update
+
+from app import app, db, ema_buffer
+from app.models import Topic, TopicStats
+from app.priority import priority_index
+
+
+class TopicSummary:
+    """The statistics for one topic, as shown on the index and history pages."""
+    __slots__ = ('id', 'name', 'question_count', 'ema_mean', 'ema_min',
+                 'attempt_count', 'last_accuracy', 'last_seen')
+
+    def __init__(self, row):
+        self.id = row.topic_id
+        self.name = row.topic_name
+        self.question_count = row.question_count
+        self.ema_mean = row.ema_mean
+        self.ema_min = row.ema_min
+        self.attempt_count = row.attempt_count
+        self.last_accuracy = row.last_accuracy
+        self.last_seen = row.last_seen
+
+
+class TopicStatsSnapshot:
+    """
+    An in-process snapshot of the `topic_stats` table.
+
+    The snapshot is loaded with one query and kept up to date by this
+    process as answers are checked and results saved, once the changes
+    have been committed. It is reloaded after `ttl` seconds to pick up
+    changes made by other processes, such as an ingest.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._topics = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Return the topics by id, reloading them if they are stale."""
+        if (self._topics is not None
+                and time.monotonic() - self._loaded_at < self.ttl):
+            return self._topics
+        query = select(TopicStats).order_by(TopicStats.topic_name)
+        rows = db.session.execute(query).scalars().all()
+        if not rows and db.session.execute(select(Topic.id).limit(1)).first():
+            # The table was added after the data was ingested, build it now
+            from utils import refresh_topic_stats
+            refresh_topic_stats(db.session.connection().connection)
+            db.session.commit()
+            rows = db.session.execute(query).scalars().all()
+        self._topics = {row.topic_id: TopicSummary(row) for row in rows}
+        if ema_buffer.enabled:
+            # Scores waiting in the write buffer are not in the table yet,
+            # the topics loaded in the priority index include them
+            for topic_id, scores in priority_index.loaded_summaries().items():
+                topic = self._topics.get(topic_id)
+                if topic is not None:
+                    (topic.question_count, topic.ema_mean,
+                     topic.ema_min) = scores
+        self._loaded_at = time.monotonic()
+        return self._topics
+
+    def all(self):
+        """Return all topics sorted alphabetically."""
+        with self._lock:
+            return list(self._load().values())
+
+    def with_attempts(self):
+        """Return the topics which have been attempted, most recent first."""
+        with self._lock:
+            topics = [topic for topic in self._load().values()
+                      if topic.attempt_count]
+        return sorted(topics, key=lambda topic: topic.last_seen, reverse=True)
+
+    def get(self, topic_id):
+        """Return the statistics for a topic, or None if it is unknown."""
+        with self._lock:
+            return self._load().get(topic_id)
+
+    def record_scores(self, topic_id, question_count, ema_mean, ema_min):
+        """
+        Update the question count and EMA scores of a topic in the
+        snapshot, once its scores have been committed or buffered. The
+        table is updated as the scores are written, see
+        `TopicStats.apply_score_changes`.
+        """
+        with self._lock:
+            topic = self._load().get(topic_id)
+            if topic is not None:
+                topic.question_count = question_count
+                topic.ema_mean = ema_mean
+                topic.ema_min = ema_min
+
+    @staticmethod
+    def record_attempt(topic_id, accuracy, date):
+        """
+        Add an attempt at a topic to the `topic_stats` table. The caller is
+        responsible for committing the session and then calling `refresh`.
+        """
+        db.session.execute(
+            update(TopicStats)
+            .where(TopicStats.topic_id == topic_id)
+            .values(attempt_count=TopicStats.attempt_count + 1,
+                    last_accuracy=accuracy,
+                    last_seen=date)
+            .execution_options(synchronize_session=False)
+        )
+
+    def refresh(self, topic_id):
+        """Reload the statistics of a topic from the `topic_stats` table."""
+        row = db.session.execute(
+            select(TopicStats.__table__)
+            .where(TopicStats.topic_id == topic_id)
+        ).first()
+        with self._lock:
+            # A topic added since the snapshot was loaded waits for a reload,
+            # so the topics stay sorted
+            if self._topics is not None and topic_id in self._topics:
+                if row is None:
+                    del self._topics[topic_id]
+                else:
+                    self._topics[topic_id] = TopicSummary(row)
+
+    def invalidate(self):
+        """Drop the snapshot so it is reloaded when next used."""
+        with self._lock:
+            self._topics = None
+
+
+topic_stats = TopicStatsSnapshot(app.config['TOPIC_STATS_TTL'])
@@ -0,0 +1,317 @@
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+# Stages and metrics compared with a baseline, with the direction that is
+# better: 1 for higher (throughput), -1 for lower (latency and memory)
+COMPARED_METRICS = {
+    'throughput': 1,
+    'p50_ms': -1,
+    'p95_ms': -1,
+    'p99_ms': -1,
+    'peak_mb': -1,
+}
+
+
+def write_question(lines, rnd, number):
+    """Append the markdown for one question, in the data repository format."""
+    kind = rnd.randrange(6)
+    lines.append(f'#### Q{number}. What does `func{number}()` return for '
+                 f'case {rnd.randrange(1000)}?')
+    lines.append('')
+    if kind == 1:
+        lines += ['```python', f'def func{number}(items):',
+                  '    return [i for i in items if i < 3]  # <3 only',
+                  '```', '']
+    if kind == 2:
+        lines += ['![image](images/Q1.png)', '']
+    correct = rnd.randrange(4)
+    for choice in range(4):
+        mark = 'x' if choice == correct else ' '
+        if kind == 3 and choice == 1:
+            # A code block in a choice, holding a line that looks like a list
+            lines += [f'- [{mark}] This code:', '', '```js',
+                      'const a = [1, 2];', '- not a list item', '```', '']
+        else:
+            lines.append(f'- [{mark}] Choice {choice} with `code` & text')
+    lines.append('')
+    if kind in (1, 4, 5):
+        lines += [f'**Explanation:** because of *reason* {number}.', '',
+                  f'[Reference](https://example.com/{number})', '']
+
+
+def generate_corpus(root, questions, topics, seed=0):
+    """
+    Write a synthetic data directory in the format `parse_md_file` expects.
+
+    Each topic directory holds `<topic>-quiz.md` and an image, and the
+    questions include code blocks, code blocks holding list-like lines
+    inside choices, explanations and images.
+
+    Args:
+        root (str): The data directory to create.
+        questions (int): The total number of questions.
+        topics (int): The number of topics to spread the questions over.
+        seed (int, optional): The random seed. Defaults to 0.
+    """
+    rnd = random.Random(seed)
+    for t in range(topics):
+        topic = f'topic{t:04d}'
+        topic_dir = os.path.join(root, topic)
+        os.makedirs(os.path.join(topic_dir, 'images'), exist_ok=True)
+        with open(os.path.join(topic_dir, 'images', 'Q1.png'), 'wb') as f:
+            f.write(b'\x89PNG')
+        lines = [f'## {topic} quiz', '']
+        # Spread any remainder over the first topics
+        count = questions // topics + (t < questions % topics)
+        for number in range(1, count + 1):
+            write_question(lines, rnd, number)
+        with open(os.path.join(topic_dir, f'{topic}-quiz.md'), 'w') as f:
+            f.write('\n'.join(lines))
+
+
+def percentile(values, p):
+    """Return the p-th percentile of sorted values (nearest rank)."""
+    if not values:
+        return 0.0
+    idx = max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))
+    return values[idx]
+
+
+def summarize(latencies, items, elapsed, peak):
+    """Return the metrics for a stage from its latencies in seconds."""
+    latencies = sorted(latencies)
+    result = {
+        'count': len(latencies),
+        'throughput': items / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'total_s': elapsed,
+    }
+    if peak is not None:
+        result['peak_mb'] = peak / (1024 * 1024)
+    return result
+
+
+class Stage:
+    """Time a benchmark stage and trace its peak memory if enabled."""
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.latencies = []
+        self.peak = None
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        if self.trace_memory:
+            self.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def time(self, func, *args, **kwargs):
+        """Call a function, recording how long it took."""
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+
+def bench_parse(data_dir, trace_memory):
+    """Time `parse_md_file` on every topic, latencies are per file."""
+    from utils import parse_md_file
+    topics = sorted(os.listdir(data_dir))
+    questions = 0
+    with Stage(trace_memory) as stage:
+        for topic in topics:
+            path = os.path.join(data_dir, topic, f'{topic}-quiz.md')
+            questions += len(stage.time(parse_md_file, path, topic))
+    return summarize(stage.latencies, questions, stage.elapsed, stage.peak)
+
+
+def bench_populate(data_dir, workers, trace_memory):
+    """Time `populate_database` into the empty benchmark database."""
+    from utils import populate_database
+    with Stage(trace_memory) as stage, redirect_stdout(io.StringIO()):
+        stage.time(populate_database, data_dir, workers=workers,
+                   force=True, defer_indexes=True, cache_dir=None)
+    return summarize(stage.latencies, count_questions(), stage.elapsed,
+                     stage.peak)
+
+
+def bench_add_topic(data_dir, repeats, trace_memory):
+    """Time `add_topic` re-adding the first topic, latencies are per call."""
+    from utils import add_topic, parse_md_file
+    topic = sorted(os.listdir(data_dir))[0]
+    questions = parse_md_file(
+        os.path.join(data_dir, topic, f'{topic}-quiz.md'), topic
+    )
+    with Stage(trace_memory) as stage:
+        for _ in range(repeats):
+            stage.time(add_topic, topic, questions)
+    return summarize(stage.latencies, len(questions) * repeats,
+                     stage.elapsed, stage.peak)
+
+
+def bench_quiz(answers, trace_memory):
+    """
+    Drive quizzes through `/get_question`, `/check_answer` and
+    `/save_results` with the test client, latencies are per request.
+    """
+    from app import app
+    from app.topic_stats import topic_stats
+    client = app.test_client()
+    with app.app_context():
+        topics = [(topic.id, topic.question_count)
+                  for topic in topic_stats.all()]
+    rnd = random.Random(0)
+    answered = 0
+    with Stage(trace_memory) as stage:
+        while answered < answers:
+            topic_id, count = topics[rnd.randrange(len(topics))]
+            count = min(count, answers - answered)
+            correct = 0
+            for idx in range(count):
+                stage.time(client.post, '/get_question',
+                           json={'topic_id': topic_id, 'current_idx': idx})
+                response = stage.time(client.post, '/check_answer',
+                                      json={'current_idx': idx,
+                                            'selected_choice': 0})
+                correct += response.get_json()['is_correct']
+            answered += count
+            stage.time(client.post, '/save_results',
+                       json={'topic_id': topic_id, 'accuracy': correct / count})
+    return summarize(stage.latencies, len(stage.latencies), stage.elapsed,
+                     stage.peak)
+
+
+def count_questions():
+    """Return the number of questions in the benchmark database."""
+    from app import app, db
+    from app.models import Question
+    with app.app_context():
+        return db.session.query(Question).count()
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print each compared metric against the baseline.
+
+    Returns:
+        list: The (stage, metric) pairs which regressed by more than
+              `tolerance`, a fraction of the baseline value.
+    """
+    regressions = []
+    for stage, metrics in results.items():
+        for metric, direction in COMPARED_METRICS.items():
+            old = baseline.get(stage, {}).get(metric)
+            new = metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change * direction < -tolerance
+            if regressed:
+                regressions.append((stage, metric))
+            print(f'{stage:>10} {metric:>10} {old:>12.2f} {new:>12.2f} '
+                  f'{change:>+8.1%}{"  REGRESSION" if regressed else ""}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the ingest and quiz endpoints on a synthetic '
+                    'corpus, optionally comparing with a stored baseline.')
+    parser.add_argument('--questions', type=int, default=1000,
+                        help='Number of questions to generate (100 to 100k)')
+    parser.add_argument('--topics', type=int, default=None,
+                        help='Number of topics (defaults to one per 250 '
+                             'questions)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Parser processes used by populate_database')
+    parser.add_argument('--add-topic-repeats', type=int, default=5)
+    parser.add_argument('--answers', type=int, default=500,
+                        help='Number of questions answered in the quiz loop')
+    parser.add_argument('--memory', action='store_true',
+                        help='Trace the peak memory of each stage with '
+                             'tracemalloc, which slows every stage down')
+    parser.add_argument('--baseline',
+                        help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed regression as a fraction of the '
+                             'baseline. Defaults to 0.2')
+    parser.add_argument('--save', help='Write the results as JSON')
+    args = parser.parse_args()
+    trace_memory = args.memory
+    topics = args.topics or max(1, args.questions // 250)
+
+    work_dir = tempfile.mkdtemp(prefix='skillsassist-bench-')
+    try:
+        # The app must be configured before it is first imported
+        os.environ['DATABASE_URL'] = \
+            'sqlite:///' + os.path.join(work_dir, 'app.db')
+        os.environ['QUIZ_STATE_STORE'] = 'memory'
+        from app import app, db
+        with app.app_context():
+            db.create_all()
+        data_dir = os.path.join(work_dir, 'data')
+        generate_corpus(data_dir, args.questions, topics)
+
+        results = {}
+        print('Timing parse_md_file...')
+        results['parse'] = bench_parse(data_dir, trace_memory)
+        print('Timing populate_database...')
+        results['populate'] = bench_populate(data_dir, args.workers,
+                                             trace_memory)
+        print('Timing add_topic...')
+        results['add_topic'] = bench_add_topic(data_dir,
+                                               args.add_topic_repeats,
+                                               trace_memory)
+        print('Timing the quiz endpoints...')
+        results['quiz'] = bench_quiz(args.answers, trace_memory)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    units = {'parse': 'questions/s', 'populate': 'questions/s',
+             'add_topic': 'questions/s', 'quiz': 'requests/s'}
+    for stage, metrics in results.items():
+        peak = (f', peak {metrics["peak_mb"]:.1f}MB'
+                if 'peak_mb' in metrics else '')
+        print(f'{stage:>10}: {metrics["throughput"]:.1f} {units[stage]}, '
+              f'p50 {metrics["p50_ms"]:.2f}ms, p95 {metrics["p95_ms"]:.2f}ms, '
+              f'p99 {metrics["p99_ms"]:.2f}ms{peak}')
+    results['params'] = vars(args)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        params = baseline.get('params', {})
+        if params.get('questions') != args.questions:
+            print('Warning: the baseline was run with a different corpus')
+        if params.get('memory') != args.memory:
+            print('Warning: only one of the runs traced memory, so their '
+                  'timings are not comparable')
+        regressions = compare(
+            {k: v for k, v in results.items() if k != 'params'},
+            baseline, args.tolerance
+        )
+        if regressions:
+            sys.exit(f'{len(regressions)} metrics regressed')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,3 +10,82 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Pool of connections shared by the request threads of a process
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 8,
+        'max_overflow': 8,
+        'pool_timeout': 10,
+    }
+
+    # SQLite storage profile, applied to every pooled connection. WAL lets
+    # readers run alongside the writer, and with it synchronous NORMAL only
+    # risks the last commits (not corruption) on a power loss
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,  # Milliseconds to wait for a lock
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -16000,  # Negative values are in KiB, i.e. 16MB
+    }
+
+    # Configure the server-side store for quizzes in progress, either
+    # 'memory' (this process only) or 'sqlite' (shared between processes)
+    QUIZ_STATE_STORE = os.environ.get('QUIZ_STATE_STORE') or 'memory'
+    QUIZ_STATE_DB = os.environ.get('QUIZ_STATE_DB') or \
+        os.path.join(basedir, 'quiz_state.db')
+    QUIZ_STATE_MAX_ENTRIES = 1024
+    QUIZ_STATE_TTL = 24 * 60 * 60
+
+    # Configure how EMA score updates are written, either 'immediate'
+    # (one commit per answer) or 'write_behind' (buffered and batched)
+    EMA_WRITE_MODE = os.environ.get('EMA_WRITE_MODE') or 'immediate'
+    EMA_FLUSH_MAX_PENDING = 64
+    EMA_FLUSH_INTERVAL = 5.0
+
+    # Maximum number of questions held in the JSON payload cache, and the
+    # size in bytes from which their payloads are precompressed
+    QUESTION_CACHE_MAX_ENTRIES = 4096
+    COMPRESS_MIN_SIZE = 1024
+
+    # Seconds an exported quiz pack can be synced for, and seconds a synced
+    # pack's results are kept to answer a retried sync. Expired packs are
+    # removed as packs are exported and synced
+    QUIZ_PACK_TTL = 30 * 24 * 60 * 60
+    QUIZ_PACK_SYNCED_TTL = 24 * 60 * 60
+    # Quiz packs are compressed for every export, so at faster levels than
+    # the question payloads, which are compressed once
+    QUIZ_PACK_GZIP_LEVEL = 6
+    QUIZ_PACK_BROTLI_QUALITY = 5
+
+    # Seconds data assets are cached for, their URLs hold a content hash
+    # so a changed file gets a new URL
+    ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+    # Seconds before the topic statistics snapshot is reloaded
+    TOPIC_STATS_TTL = 60
+
+    # Number of rows per page of the history table, and maximum number
+    # of points (or periods) returned for the history chart
+    HISTORY_PAGE_SIZE = 50
+    HISTORY_MAX_POINTS = 500
+
+    # Default number of questions in a mixed review quiz, and the weight
+    # added to every question so mastered ones are still drawn sometimes
+    MIXED_QUIZ_SIZE = 20
+    SAMPLING_MIN_WEIGHT = 0.05
+
+    # Seconds between checks for a new generation of the data, swapped
+    # in by an ingest while the app is running
+    DATA_GENERATION_CHECK_INTERVAL = 2.0
+    # Seconds between checks for EMA scores written by other processes
+    SCORE_CHECK_INTERVAL = 1.0
+
+    # Expose request, SQL and ingest metrics at /metrics, and log requests
+    # slower than SLOW_REQUEST_THRESHOLD seconds (if set)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in \
+        ('1', 'true', 'yes')
+    SLOW_REQUEST_THRESHOLD = float(os.environ['SLOW_REQUEST_THRESHOLD']) \
+        if os.environ.get('SLOW_REQUEST_THRESHOLD') else None
+
+    # Maximum number of results returned by a search
+    SEARCH_MAX_RESULTS = 50
@@ -0,0 +1,128 @@
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+def wait_for_server(host, port, timeout=30):
+    """Wait until the server accepts requests, or raise if it never does."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server did not start on {host}:{port}')
+
+
+class QuizClient:
+    """A client working through quizzes over one keep-alive connection."""
+
+    def __init__(self, host, port, topic_id):
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.topic_id = topic_id
+        self.cookie = None
+
+    def post(self, url, data):
+        headers = {'Content-Type': 'application/json'}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.conn.request('POST', url, json.dumps(data), headers)
+        response = self.conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f'{url} returned {response.status}')
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return json.loads(body)
+
+    def run(self, stop, counts):
+        """Answer questions until `stop` is set, counting requests by URL."""
+        while not stop.is_set():
+            data = self.post('/start_quiz', {'topic_id': self.topic_id})
+            for idx in range(data['number_of_questions']):
+                if stop.is_set():
+                    return
+                self.post('/get_question', {'topic_id': self.topic_id,
+                                            'current_idx': idx})
+                self.post('/check_answer', {'current_idx': idx,
+                                            'selected_choice': 0})
+                counts['/get_question'] += 1
+                counts['/check_answer'] += 1
+
+
+def measure(host, port, clients, duration, topic_id):
+    """Return the requests per second for each URL with `clients` threads."""
+    stop = threading.Event()
+    all_counts = []
+    threads = []
+    for _ in range(clients):
+        counts = {'/get_question': 0, '/check_answer': 0}
+        client = QuizClient(host, port, topic_id)
+        thread = threading.Thread(target=client.run, args=(stop, counts))
+        all_counts.append(counts)
+        threads.append(thread)
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {url: sum(counts[url] for counts in all_counts) / elapsed
+            for url in all_counts[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure how requests/sec on /get_question and '
+                    '/check_answer scale with the number of worker '
+                    'processes of `run.py serve`. The database must '
+                    'already be populated.')
+    parser.add_argument('--processes', default='1,2,4',
+                        help='Comma separated worker process counts')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='Threads per worker process')
+    parser.add_argument('--clients', type=int, default=16,
+                        help='Number of concurrent client threads')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='Seconds to run each measurement for')
+    parser.add_argument('--topic-id', type=int, default=1,
+                        help='The topic to run quizzes for')
+    parser.add_argument('--port', type=int, default=8001)
+    args = parser.parse_args()
+    host = '127.0.0.1'
+    # More than one process needs the quiz state shared between them
+    env = dict(os.environ, QUIZ_STATE_STORE='sqlite',
+               EMA_WRITE_MODE='immediate')
+    print(f'{"processes":>9} {"/get_question":>14} {"/check_answer":>14}')
+    for processes in map(int, args.processes.split(',')):
+        server = subprocess.Popen(
+            [sys.executable, 'run.py', 'serve', '--host', host,
+             '--port', str(args.port), '--processes', str(processes),
+             '--threads', str(args.threads)],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_for_server(host, args.port)
+            rates = measure(host, args.port, args.clients, args.duration,
+                            args.topic_id)
+        finally:
+            server.terminate()
+            server.wait()
+        print(f'{processes:>9} {rates["/get_question"]:>14.1f} '
+              f'{rates["/check_answer"]:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,40 @@
 import argparse
 import os
 import subprocess
+import time
 
-from app import app
-from utils import populate_database, remove_table_rows
+start_time = time.perf_counter()
 
+from app import app, db
+from app.generation import score_changes
+from app.priority import priority_index
+from app.question_cache import question_cache
+from app.sampling import question_sampler
+from app.topic_stats import topic_stats
+# N.B. utils is imported where it is used, as the markdown and bs4
+# packages it needs are only used to populate the database
 
-def submodule_update(force=False):
+
+def submodule_update(force=False, workers=None, use_parse_cache=True,
+                     duplicates='report', duplicate_threshold=0.8):
     """
     Update the submodule data repository and populate the database.
     
     Args:
         force (bool, optional): Force update the submodule. Defaults to False.
+        workers (int, optional): Number of parser processes used to
+                                 populate the database. Defaults to None
+                                 (one per CPU).
+        use_parse_cache (bool, optional): Use the parse cache. Defaults
+                                          to True.
+        duplicates (str, optional): Report, drop or ignore near-duplicate
+                                    questions. Defaults to 'report'.
+        duplicate_threshold (float, optional): The similarity from which
+                                               questions are near-duplicates.
+                                               Defaults to 0.8.
     """
+    from utils import PARSE_CACHE_DIR, IngestValidationError, populate_database
+    cache_dir = PARSE_CACHE_DIR if use_parse_cache else None
     if not force:
         # Check if there are differences in the submodule repository
         submodule_status_process = subprocess.run(
@@ -31,27 +53,221 @@ def submodule_update(force=False):
         subprocess.run(['git', 'submodule', 'update', '--init', '--force'])
     else:
         subprocess.run(['git', 'submodule', 'update', '--init'])
-    # Remove the old data from the database (keeping performance_tracker)
-    remove_table_rows('app.db', 'topic')
-    remove_table_rows('app.db', 'question')
-    # Populate the database with the data from the data directory
+    # Update the database with the changed files (keeping EMA scores),
+    # a running app picks up the new data without a restart
     print('Populating the database...')
-    populate_database()
+    try:
+        populate_database(workers=workers, force=force, cache_dir=cache_dir,
+                          duplicates=duplicates,
+                          duplicate_threshold=duplicate_threshold)
+    except IngestValidationError as e:
+        print(f'Database not updated, the parsed data is invalid: {e}')
+        return
+    # Drop any question orderings, payloads and stats built from the old data
+    priority_index.invalidate()
+    question_sampler.invalidate()
+    question_cache.invalidate()
+    topic_stats.invalidate()
+
+
+def init_database():
+    """
+    Create the database schema from the models.
+
+    If there is a Flask-Migrate migrations directory, the new database is
+    stamped with its head revisions, so `flask db upgrade` only applies
+    migrations added later. The migration environment (env.py) is not run,
+    as it would configure logging again in the serving process.
+    """
+    with app.app_context():
+        db.create_all()
+        directory = app.extensions['migrate'].directory
+        if os.path.isdir(directory):
+            from alembic.runtime.migration import MigrationContext
+            from alembic.script import ScriptDirectory
+            script = ScriptDirectory(directory)
+            with db.engine.begin() as connection:
+                MigrationContext.configure(connection).stamp(script, 'heads')
+
+
+def upgrade_database():
+    """
+    Bring the schema of an existing database up to date with the models.
+
+    Missing tables and indexes are created and missing columns are added,
+    columns which are not nullable with their default for existing rows.
+    Topic stats are computed if their table was missing. Nothing is done
+    to a database which is already up to date, so this runs on every start.
+    """
+    from sqlalchemy import inspect, text
+    with app.app_context():
+        inspector = inspect(db.engine)
+        existing_tables = set(inspector.get_table_names())
+        with db.engine.begin() as connection:
+            for table in db.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                existing_columns = {column['name'] for column
+                                    in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing_columns:
+                        continue
+                    print(f'Adding column {table.name}.{column.name}')
+                    column_type = column.type.compile(dialect=db.engine.dialect)
+                    ddl = f'ALTER TABLE {table.name} ADD COLUMN ' \
+                          f'{column.name} {column_type}'
+                    if not column.nullable:
+                        # SQLite needs a default to fill in existing rows
+                        default = column.default.arg
+                        if isinstance(default, bool):
+                            default = int(default)
+                        ddl += f' NOT NULL DEFAULT {default!r}'
+                    connection.execute(text(ddl))
+                for index in table.indexes:
+                    index.create(connection, checkfirst=True)
+        db.create_all()
+        if 'topic_stats' not in existing_tables:
+            print('Computing topic stats')
+            from utils import connect, refresh_topic_stats
+            conn = connect()
+            refresh_topic_stats(conn)
+            conn.commit()
+            conn.close()
+
+
+def warm_caches():
+    """
+    Load the topic stats, question orderings and sampling weights, and the
+    payloads of the first questions of each topic, before serving.
+    """
+    with app.app_context():
+        # Scores written from here on are picked up from other processes
+        score_changes.changes()
+        topics = topic_stats.all()
+        question_sampler.preload()
+        per_topic = question_cache.max_entries // max(len(topics), 1)
+        question_ids = []
+        for topic in topics:
+            question_ids += priority_index.ordered_ids(topic.id)[:per_topic]
+        question_cache.preload(question_ids)
+        # Connections must not be shared with forked worker processes
+        db.engine.dispose()
+    print(f'Warmed caches for {len(topics)} topics')
+
+
+def serve(host='127.0.0.1', port=8000, processes=1, threads=8):
+    """
+    Serve the app without debug, after warming its caches.
+
+    Gunicorn is used if it is installed, preloading the app so the worker
+    processes start with warm caches, otherwise the Werkzeug server runs
+    with threads in a single process. Each worker process moves the scores
+    written by the others in its caches, see `ScoreChangeWatcher`.
+
+    Args:
+        host (str, optional): The interface to listen on.
+                              Defaults to '127.0.0.1'.
+        port (int, optional): The port to listen on. Defaults to 8000.
+        processes (int, optional): The number of worker processes, more
+                                   than one requires gunicorn. Defaults
+                                   to 1.
+        threads (int, optional): The number of threads in each gunicorn
+                                 worker process. Defaults to 8.
+    """
+    if processes > 1 and (app.config['QUIZ_STATE_STORE'] != 'sqlite'
+                          or app.config['EMA_WRITE_MODE'] != 'immediate'):
+        # Quizzes and buffered scores in memory are not shared by processes
+        raise SystemExit('Serving with more than one process requires '
+                         'QUIZ_STATE_STORE=sqlite and EMA_WRITE_MODE=immediate')
+    app.config['DEBUG'] = False
+    warm_caches()
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        if processes > 1:
+            print('gunicorn is not installed, serving with threads in a '
+                  'single process')
+        from werkzeug.serving import run_simple
+        run_simple(host, port, app, threaded=True)
+        return
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', processes)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('preload_app', True)
+
+        def load(self):
+            return app
+
+    Application().run()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='SkillsAssist Quiz App')
+    parser.add_argument('command',
+                        nargs='?',
+                        choices=['serve'],
+                        help='Serve the app for production, rather than '
+                             'running the development server')
     parser.add_argument('--clone',
                         action='store_true',
                         help='Clone the data repository')
     parser.add_argument('--force-clone',
                         action='store_true',
                         help='Force clone the data repository')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=None,
+                        help='Number of processes used to parse the data '
+                             '(defaults to one per CPU)')
+    parser.add_argument('--no-parse-cache',
+                        action='store_true',
+                        help='Parse the data without using the parse cache')
+    parser.add_argument('--clear-parse-cache',
+                        action='store_true',
+                        help='Remove all entries from the parse cache')
+    parser.add_argument('--duplicates',
+                        choices=['report', 'drop', 'off'],
+                        default='report',
+                        help='Report near-duplicate questions when populating '
+                             'the database, drop them as well, or skip the '
+                             'check (defaults to report)')
+    parser.add_argument('--duplicate-threshold',
+                        type=float,
+                        default=0.8,
+                        help='Similarity, between 0 and 1, from which '
+                             'questions are near-duplicates (defaults to 0.8)')
+    parser.add_argument('--host',
+                        default='127.0.0.1',
+                        help='Interface to serve on (serve only)')
+    parser.add_argument('--port',
+                        type=int,
+                        default=8000,
+                        help='Port to serve on (serve only)')
+    parser.add_argument('--processes',
+                        type=int,
+                        default=1,
+                        help='Number of worker processes (serve only)')
+    parser.add_argument('--threads',
+                        type=int,
+                        default=8,
+                        help='Number of threads per worker (serve only)')
     args = parser.parse_args()
+    if args.clear_parse_cache:
+        from utils import clear_parse_cache
+        clear_parse_cache()
+    use_parse_cache = not args.no_parse_cache
+    duplicate_options = {'duplicates': args.duplicates,
+                         'duplicate_threshold': args.duplicate_threshold}
     if args.clone:
-        submodule_update()
+        submodule_update(workers=args.workers,
+                         use_parse_cache=use_parse_cache, **duplicate_options)
     elif args.force_clone:
-        submodule_update(force=True)
+        submodule_update(force=True, workers=args.workers,
+                         use_parse_cache=use_parse_cache, **duplicate_options)
 
     # Check if data directory exists before running the app
     if not os.path.exists('app/static/data'):
@@ -62,15 +278,25 @@ if __name__ == '__main__':
             'https://github.com/Caff1982/linkedin-skill-assessments-quizzes',
             'app/static/data'])
 
-    # Check if the database exists before running the app
-    if not os.path.exists('app.db'):
+    # Check if the configured database exists before running the app
+    with app.app_context():
+        db_path = db.engine.url.database
+    if os.path.exists(db_path):
+        # Databases created by earlier versions are missing new columns
+        upgrade_database()
+    else:
         print('Populating the database...')
+        from utils import PARSE_CACHE_DIR, populate_database
         # Initialise the database
-        subprocess.run(['flask', 'db', 'init'])
-        subprocess.run(['flask', 'db', 'migrate'])
-        subprocess.run(['flask', 'db', 'upgrade'])
+        init_database()
         # Populate the database with the data from the data directory
-        populate_database()
+        populate_database(workers=args.workers, defer_indexes=True,
+                          cache_dir=PARSE_CACHE_DIR if use_parse_cache
+                          else None, **duplicate_options)
 
+    print(f'Started in {time.perf_counter() - start_time:.2f}s')
     # Run the app
-    app.run(debug=True)
+    if args.command == 'serve':
+        serve(args.host, args.port, args.processes, args.threads)
+    else:
+        app.run(debug=True)
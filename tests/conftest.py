@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The app reads its configuration when it is first imported, so the tests
+# point it at a database of their own before any test imports it
+TEST_DIR = tempfile.mkdtemp(prefix='skillsassist-tests-')
+TEST_DB_PATH = os.path.join(TEST_DIR, 'app.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{TEST_DB_PATH}'
+os.environ['QUIZ_STATE_STORE'] = 'memory'
+os.environ['EMA_WRITE_MODE'] = 'immediate'
+os.environ.pop('METRICS_ENABLED', None)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def database():
+    """
+    Start a test with an empty database, with the schema created, and with
+    every in-memory cache of the app dropped. Yields the database path.
+    """
+    from app import app, db
+    from app.generation import data_generation, score_changes
+    from app.priority import priority_index
+    from app.question_cache import question_cache
+    from app.sampling import question_sampler
+    from app.topic_stats import topic_stats
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(TEST_DB_PATH + suffix):
+                os.remove(TEST_DB_PATH + suffix)
+        db.create_all()
+    priority_index.invalidate()
+    question_sampler.invalidate()
+    question_cache.invalidate()
+    topic_stats.invalidate()
+    # The watchers read the new database on their next check
+    data_generation._generation = None
+    score_changes._version = None
+    with app.app_context():
+        yield TEST_DB_PATH
+        db.session.remove()
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """A data directory holding a copy of the fixture topics."""
+    path = tmp_path / 'data'
+    shutil.copytree(FIXTURES_DIR, path)
+    return str(path)
+
+
+@pytest.fixture
+def populated(database, data_dir):
+    """The database populated with the fixture topics. Yields the data dir."""
+    from utils import populate_database
+    populate_database(data_dir, workers=1, cache_dir=None, duplicates='off')
+    yield data_dir
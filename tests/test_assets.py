@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+import utils
+from app import app
+
+
+@pytest.fixture
+def image(database, tmp_path, monkeypatch):
+    """An image in the data directory of a topic, served from `tmp_path`."""
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    topic_dir = tmp_path / 'data' / 'python'
+    (topic_dir / 'images').mkdir(parents=True)
+    (topic_dir / 'images' / 'Q1.png').write_bytes(b'first version')
+    return str(topic_dir)
+
+
+def test_asset_is_cached_for_good(image):
+    url = utils.asset_url(image, 'python', 'images/Q1.png')
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    assert response.data == b'first version'
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == app.config['ASSET_MAX_AGE']
+
+
+def test_asset_with_another_digest_is_not_found(image):
+    url = utils.asset_url(image, 'python', 'images/Q1.png')
+    client = app.test_client()
+    assert client.get('/assets/0123456789abcdef/python/images/Q1.png'
+                      ).status_code == 404
+    with open(os.path.join(image, 'images', 'Q1.png'), 'wb') as f:
+        f.write(b'second version')
+    # The old URL no longer serves the file, the new one does
+    assert client.get(url).status_code == 404
+    new_url = utils.asset_url(image, 'python', 'images/Q1.png')
+    assert new_url != url
+    assert client.get(new_url).data == b'second version'
+
+
+def test_asset_outside_the_data_directory_is_not_found(image):
+    response = app.test_client().get('/assets/0123456789abcdef/../app.db')
+    assert response.status_code == 404
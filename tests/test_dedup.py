@@ -0,0 +1,124 @@
+import os
+import sqlite3
+
+import pytest
+
+import utils
+
+ABSTRACT_CLASS = '''
+#### Q9. What is an abstract class?
+
+- [ ] An abstract class is the name for any class from which you can instantiate an object.
+- [x] An abstract class exists only so that other "concrete" classes can inherit from it.
+- [ ] An abstract class is the same as a `class` with only `@staticmethod` methods.
+- [ ] An abstract class has no methods at all.
+'''
+
+
+def words(count, start=0):
+    return ' '.join(f'word{n}' for n in range(start, start + count))
+
+
+def test_identical_sets_have_identical_signatures():
+    shingles = utils.shingle(words(40))
+    assert utils.minhash_signature(shingles) == \
+        utils.minhash_signature(set(shingles))
+
+
+def test_signatures_estimate_similarity():
+    a = utils.shingle(words(400))
+    b = utils.shingle(words(400, start=100))
+    jaccard = len(a & b) / len(a | b)
+    sig_a = utils.minhash_signature(a, 256)
+    sig_b = utils.minhash_signature(b, 256)
+    estimate = sum(x == y for x, y in zip(sig_a, sig_b)) / 256
+    assert estimate == pytest.approx(jaccard, abs=0.1)
+
+
+@pytest.mark.parametrize('threshold', [0.5, 0.8, 0.9])
+def test_lsh_bands_find_pairs_below_threshold(threshold):
+    rows = utils.lsh_rows(utils.MINHASH_SIZE, threshold)
+    assert utils.MINHASH_SIZE % rows == 0
+    bands = utils.MINHASH_SIZE // rows
+    assert (1 / bands) ** (1 / rows) <= threshold - 0.1
+
+
+def test_normalize_question_includes_choices_and_code():
+    html = ('<ul><li>First <code>choice</code></li><li>Second</li></ul>'
+            '<pre><code class="language-python">print(x)</code></pre>')
+    assert utils.normalize_question('The Title?', html) == \
+        'the title first choice second print x'
+
+
+def test_index_finds_near_duplicates():
+    index = utils.DuplicateIndex(0.8)
+    text = words(30)
+    assert index.add('first', text) is None
+    assert index.add('unrelated', words(30, start=1000)) is None
+    assert index.add('copy', text) == ('first', 1.0)
+    # One word changed out of 30 leaves 27 of 31 bigrams shared
+    near = text.replace('word15', 'changed')
+    key, similarity = index.add('near', near)
+    assert key == 'first'
+    assert similarity == pytest.approx(27 / 31)
+    assert index.add('far', words(30, start=20)) is None
+
+
+def test_duplicates_are_not_added_to_the_index():
+    index = utils.DuplicateIndex(0.8)
+    index.add('first', words(30))
+    index.add('copy', words(30))
+    assert index.keys == ['first']
+
+
+def populate_with_duplicate(data_dir, duplicates):
+    markdown_file = os.path.join(data_dir, 'python', 'python-quiz.md')
+    with open(markdown_file, 'a') as f:
+        f.write(ABSTRACT_CLASS)
+    utils.populate_database(data_dir, workers=1, cache_dir=None,
+                            duplicates=duplicates)
+
+
+def question_counts(db_path):
+    conn = sqlite3.connect(db_path)
+    questions = conn.execute("SELECT COUNT(*) FROM question "
+                             "WHERE topic_name = 'python'").fetchone()[0]
+    stats = conn.execute("SELECT question_count FROM topic_stats "
+                         "WHERE topic_name = 'python'").fetchone()[0]
+    conn.close()
+    return questions, stats
+
+
+def test_duplicates_are_reported(database, data_dir, capsys):
+    populate_with_duplicate(data_dir, 'report')
+    output = capsys.readouterr().out
+    assert 'Found 1 near-duplicate questions' in output
+    assert question_counts(database) == (8, 8)
+
+
+def test_duplicates_are_dropped(database, data_dir, capsys):
+    populate_with_duplicate(data_dir, 'drop')
+    assert 'Found 1 near-duplicate questions' in capsys.readouterr().out
+    assert question_counts(database) == (7, 7)
+    conn = sqlite3.connect(database)
+    assert conn.execute("SELECT COUNT(*) FROM question "
+                        "WHERE question_number = 9").fetchone() == (0,)
+    conn.close()
+
+
+def test_duplicates_of_stored_topics_are_found(database, populated, capsys):
+    # Only the python topic is staged, it is checked against javascript
+    javascript_file = os.path.join(populated, 'javascript',
+                                   'javascript-quiz.md')
+    with open(javascript_file) as f:
+        javascript = f.read()
+    python_file = os.path.join(populated, 'python', 'python-quiz.md')
+    first_question = javascript[javascript.index('#### Q1.'):
+                                javascript.index('#### Q2.')]
+    with open(python_file, 'a') as f:
+        f.write('\n' + first_question.replace('Q1.', 'Q9.'))
+    capsys.readouterr()
+    utils.populate_database(populated, workers=1, cache_dir=None,
+                            duplicates='drop')
+    assert 'Found 1 near-duplicate questions' in capsys.readouterr().out
+    assert question_counts(database) == (7, 7)
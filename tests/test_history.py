@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app, db
+from app.models import PerformanceTracker
+
+START = datetime(2023, 1, 1)
+
+
+@pytest.fixture
+def topic_id(populated):
+    from app.topic_stats import topic_stats
+    return next(topic.id for topic in topic_stats.all()
+                if topic.name == 'python')
+
+
+def add_performances(topic_id, dates):
+    performances = [PerformanceTracker(topic_id=topic_id, topic_name='python',
+                                       accuracy=0.5, date=date)
+                    for date in dates]
+    db.session.add_all(performances)
+    db.session.commit()
+    return [performance.id for performance in performances]
+
+
+def all_pages(topic_id, page_size):
+    pages = []
+    before_id = None
+    while True:
+        page = PerformanceTracker.get_page(topic_id, before_id, page_size)
+        if not page:
+            return pages
+        pages.append([performance.id for performance in page])
+        before_id = page[-1].id
+
+
+def test_pages_are_most_recent_first(topic_id):
+    ids = add_performances(topic_id, [START + timedelta(days=n)
+                                      for n in range(7)])
+    assert all_pages(topic_id, 3) == [ids[6:3:-1], ids[3:0:-1], ids[:1]]
+
+
+def test_page_size_divides_rows(topic_id):
+    ids = add_performances(topic_id, [START + timedelta(days=n)
+                                      for n in range(6)])
+    assert all_pages(topic_id, 3) == [ids[5:2:-1], ids[2::-1]]
+
+
+def test_equal_dates_are_paged_by_id(topic_id):
+    # Performances saved within the same moment are split across pages
+    # without being skipped or repeated
+    ids = add_performances(topic_id, [START] * 5 + [START - timedelta(days=1)])
+    assert all_pages(topic_id, 2) == [ids[4:2:-1], ids[2:0:-1],
+                                      [ids[0], ids[5]]]
+
+
+def test_unknown_before_id_is_an_empty_page(topic_id):
+    add_performances(topic_id, [START])
+    assert PerformanceTracker.get_page(topic_id, before_id=10 ** 6) == []
+
+
+def test_pages_only_hold_the_topic(topic_id):
+    ids = add_performances(topic_id, [START, START + timedelta(days=1)])
+    add_performances(topic_id + 1000, [START + timedelta(days=2)])
+    assert all_pages(topic_id, 10) == [ids[::-1]]
+
+
+def test_history_links_the_next_page(topic_id, monkeypatch):
+    monkeypatch.setitem(app.config, 'HISTORY_PAGE_SIZE', 2)
+    ids = add_performances(topic_id, [START + timedelta(days=n)
+                                      for n in range(3)])
+    client = app.test_client()
+    first = client.get(f'/history/{topic_id}').data.decode()
+    assert f'before={ids[1]}' in first
+    last = client.get(f'/history/{topic_id}?before={ids[1]}').data.decode()
+    assert 'before=' not in last
@@ -0,0 +1,109 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import utils
+
+
+def query(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    return rows
+
+
+def populate(data_dir, **kwargs):
+    utils.populate_database(data_dir, workers=1, cache_dir=None,
+                            duplicates='off', **kwargs)
+
+
+def test_populate_database(database, populated):
+    topics = dict(query(database, "SELECT name, content_hash FROM topic"))
+    assert sorted(topics) == ['javascript', 'python']
+    assert all(topics.values())
+    counts = dict(query(database, "SELECT topic_name, question_count "
+                                  "FROM topic_stats"))
+    # Questions without a correct answer are left out
+    assert counts == {'javascript': 4, 'python': 7}
+    assert query(database, "SELECT COUNT(*) FROM question_fts") == [(11,)]
+
+
+def test_upsert_keeps_ema_scores(database, populated):
+    conn = sqlite3.connect(database)
+    with conn:
+        conn.execute("UPDATE question SET ema_score = id / 10.0")
+    conn.close()
+    before = dict(query(database, "SELECT question_title, ema_score "
+                                  "FROM question"))
+    markdown_file = os.path.join(populated, 'python', 'python-quiz.md')
+    with open(markdown_file, 'a') as f:
+        f.write('\n#### Q9. Which is new?\n\n- [x] This one\n- [ ] Not this\n')
+    populate(populated)
+    after = dict(query(database, "SELECT question_title, ema_score "
+                                 "FROM question"))
+    assert after.pop('Which is new?') == 0.0
+    assert after == before
+
+
+def test_removed_topic_is_deleted(database, populated):
+    (topic_id,) = query(database, "SELECT id FROM topic "
+                                  "WHERE name = 'javascript'")[0]
+    question_ids = [row[0] for row in query(
+        database, "SELECT id FROM question WHERE topic_id = ?", (topic_id,))]
+    shutil.rmtree(os.path.join(populated, 'javascript'))
+    # Nothing changed in the other topic, only the removal is applied
+    populate(populated)
+    assert query(database, "SELECT name FROM topic") == [('python',)]
+    assert query(database, "SELECT COUNT(*) FROM question "
+                           "WHERE topic_id = ?", (topic_id,)) == [(0,)]
+    assert query(database, "SELECT topic_name FROM topic_stats") \
+        == [('python',)]
+    fts_ids = {row[0] for row in query(database, "SELECT rowid "
+                                                 "FROM question_fts")}
+    assert fts_ids.isdisjoint(question_ids)
+    assert len(fts_ids) == 7
+
+
+def test_removed_topic_is_deleted_on_force(database, populated):
+    os.remove(os.path.join(populated, 'javascript', 'javascript-quiz.md'))
+    populate(populated, force=True)
+    assert query(database, "SELECT name FROM topic") == [('python',)]
+
+
+def test_empty_data_dir_is_not_applied(database, populated, tmp_path):
+    empty_dir = tmp_path / 'empty'
+    empty_dir.mkdir()
+    with pytest.raises(utils.IngestValidationError):
+        populate(str(empty_dir))
+    assert query(database, "SELECT COUNT(*) FROM topic") == [(2,)]
+
+
+def test_topic_which_fails_to_parse_is_not_applied(database, data_dir,
+                                                   monkeypatch):
+    parse_topic = utils.parse_topic
+
+    def parse_all_but_javascript(data_dir, topic, *args):
+        if topic == 'javascript':
+            return topic, None, 0.0, False, {}
+        return parse_topic(data_dir, topic, *args)
+
+    monkeypatch.setattr(utils, 'parse_topic', parse_all_but_javascript)
+    with pytest.raises(utils.IngestValidationError, match='javascript'):
+        populate(data_dir)
+    assert query(database, "SELECT COUNT(*) FROM topic") == [(0,)]
+
+
+def test_parse_cache_key_includes_pygments_version(data_dir, monkeypatch):
+    import pygments
+    markdown_file = os.path.join(data_dir, 'python', 'python-quiz.md')
+    content_hash = utils.file_hash(markdown_file)
+    monkeypatch.setattr(pygments, '__version__', '0.0')
+    assert utils.file_hash(markdown_file) != content_hash
+
+
+def test_parse_cache_dir_does_not_depend_on_cwd():
+    assert os.path.isabs(utils.PARSE_CACHE_DIR)
+    assert os.path.dirname(utils.PARSE_CACHE_DIR) == \
+        os.path.dirname(os.path.abspath(utils.__file__))
@@ -0,0 +1,106 @@
+import os
+import re
+from html import escape, unescape
+
+import pytest
+
+import utils
+from tests.baseline_parser import parse_md_file as baseline_parse_md_file
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+# The quiz data, once its git submodule has been cloned
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                        'app', 'static', 'data')
+# Matches the fingerprinted part of an asset URL
+ASSET_URL_RE = re.compile(r'/assets/[0-9a-f]+/')
+# Matches the opening tag of a code block, with its language class
+CODE_TAG_RE = re.compile(r'<code[^>]*>')
+
+
+def quiz_files(data_dir):
+    """Return the path and topic of each quiz file in a data directory."""
+    if not os.path.isdir(data_dir):
+        return []
+    return [
+        (os.path.join(data_dir, topic, f'{topic}-quiz.md'), topic)
+        for topic in sorted(os.listdir(data_dir))
+        if os.path.isfile(os.path.join(data_dir, topic, f'{topic}-quiz.md'))
+    ]
+
+
+def static_urls(question):
+    """Replace the asset URLs in a question with the old static URLs."""
+    return tuple(ASSET_URL_RE.sub('static/data/', value)
+                 if isinstance(value, str) else value
+                 for value in question)
+
+
+def without_highlighting(html):
+    """Return the text of some HTML, without the highlighting of its code."""
+    return unescape(CODE_TAG_RE.sub('<code>', utils.SPAN_RE.sub('', html)))
+
+
+QUIZ_FILES = quiz_files(FIXTURES_DIR) + quiz_files(DATA_DIR)
+
+
+@pytest.mark.parametrize('filepath, topic', QUIZ_FILES,
+                         ids=lambda value: os.path.basename(value))
+def test_parse_md_file_matches_baseline(filepath, topic):
+    # Images are now served from content-hashed URLs, which is the only
+    # intended difference from the baseline parser
+    expected = baseline_parse_md_file(filepath, topic)
+    questions = utils.parse_md_file(filepath, topic, highlight=False)
+    assert [static_urls(question[:5]) for question in questions] == expected
+
+
+def test_reference_defined_in_another_question():
+    filepath, topic = quiz_files(FIXTURES_DIR)[1]
+    questions = utils.parse_md_file(filepath, topic, highlight=False)
+    explanation = questions[1][3]
+    assert ('<a target="_blank" id="explanation-header" '
+            'class="btn btn-secondary" '
+            'href="https://docs.python.org/3/library/functions.html">'
+            'the built-ins</a>') in explanation
+    assert ('href="https://docs.python.org/3/" '
+            'title="Python documentation">docs</a>') in explanation
+
+
+@pytest.mark.parametrize('filepath, topic', QUIZ_FILES,
+                         ids=lambda value: os.path.basename(value))
+def test_highlighting_keeps_the_code(filepath, topic):
+    plain = utils.parse_md_file(filepath, topic, highlight=False)
+    highlighted = utils.parse_md_file(filepath, topic)
+    for question, expected in zip(highlighted, plain):
+        for html, expected_html in zip(question[2:4], expected[2:4]):
+            if expected_html is not None:
+                assert (without_highlighting(html)
+                        == without_highlighting(expected_html))
+
+
+@pytest.mark.parametrize('topic, code', [
+    # Without `<?php`, which PHP in the quizzes rarely starts with
+    ('php', '$items = array(1, 2);\necho count($items);\n'),
+    # Django names a template lexer, the code is Python
+    ('django', 'from django.db import models\n\n'
+               'class Post(models.Model):\n'
+               '    title = models.CharField(max_length=20)\n'),
+])
+def test_topic_code_is_highlighted(topic, code):
+    html, complete = utils.highlight_html(
+        f'<pre><code>{escape(code, quote=False)}</code></pre>', topic)
+    assert complete
+    assert '<span class="hljs-' in html
+
+
+def test_code_without_tokens_is_left_for_highlightjs():
+    html = '<pre><code>&lt;p&gt;some text&lt;/p&gt;</code></pre>'
+    assert utils.highlight_html(html, 'php') == (html, False)
+
+
+@pytest.mark.parametrize('language, comment',
+                         [('c', '//'), ('sql', '--'), ('bash', '#')])
+def test_highlighting_keeps_the_last_line(language, comment):
+    html = (f'<pre><code class="language-{language}">x = 1 {comment} note'
+            '</code></pre>')
+    highlighted, _ = utils.highlight_html(html, language)
+    assert without_highlighting(highlighted) == without_highlighting(html)
@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+from app.priority import QuestionPriorityIndex
+
+
+@pytest.fixture
+def scored(database, populated):
+    """The python topic's question ids, with scores which tie in pairs."""
+    conn = sqlite3.connect(database)
+    (topic_id,) = conn.execute("SELECT id FROM topic "
+                               "WHERE name = 'python'").fetchone()
+    with conn:
+        conn.execute("UPDATE question SET ema_score = (id % 3) / 4.0")
+    conn.close()
+    return topic_id
+
+
+def database_order(db_path, topic_id):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT id FROM question WHERE topic_id = ? "
+                        "ORDER BY ema_score, id", (topic_id,)).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def test_ordered_ids_are_lowest_score_first(database, scored):
+    index = QuestionPriorityIndex()
+    # Questions with the same score are in id order
+    assert index.ordered_ids(scored) == database_order(database, scored)
+
+
+def test_update_moves_question(database, scored):
+    index = QuestionPriorityIndex()
+    first, *rest = index.ordered_ids(scored)
+    index.update(scored, first, 1.0)
+    assert index.ordered_ids(scored) == rest + [first]
+    index.update(scored, first, -1.0)
+    assert index.ordered_ids(scored) == [first] + rest
+
+
+def test_update_matches_database_order(database, scored):
+    index = QuestionPriorityIndex()
+    ordered = index.ordered_ids(scored)
+    conn = sqlite3.connect(database)
+    with conn:
+        for question_id, ema_score in ((ordered[-1], 0.0), (ordered[0], 0.5)):
+            conn.execute("UPDATE question SET ema_score = ? WHERE id = ?",
+                         (ema_score, question_id))
+            index.update(scored, question_id, ema_score)
+    conn.close()
+    assert index.ordered_ids(scored) == database_order(database, scored)
+
+
+def test_summary_follows_updates(database, scored):
+    index = QuestionPriorityIndex()
+    count, mean, minimum = index.summary(scored)
+    first = index.ordered_ids(scored)[0]
+    index.update(scored, first, minimum + 7.0)
+    new_count, new_mean, new_minimum = index.summary(scored)
+    assert new_count == count == 7
+    assert new_mean == pytest.approx(mean + 1.0)
+    assert new_minimum >= minimum
+    assert index.loaded_summaries() == {
+        scored: (new_count, new_mean, new_minimum)}
+
+
+def test_unloaded_topic_reads_scores_when_loaded(database, scored):
+    index = QuestionPriorityIndex()
+    last = database_order(database, scored)[-1]
+    # Updates to topics which are not loaded are left to the database
+    index.update(scored, last, -1.0)
+    assert index.loaded_summaries() == {}
+    assert index.ordered_ids(scored)[-1] == last
+    index.update(scored, last, -1.0)
+    index.invalidate(scored)
+    assert index.ordered_ids(scored)[-1] == last
@@ -0,0 +1,115 @@
+import pytest
+
+from app import app
+
+
+@pytest.fixture
+def client(populated):
+    return app.test_client()
+
+
+def topics(client):
+    from app.topic_stats import topic_stats
+    return [{'id': topic.id, 'name': topic.name}
+            for topic in topic_stats.all()]
+
+
+def start_topic_quiz(client, topic_name='python'):
+    topic_id = next(topic['id'] for topic in topics(client)
+                    if topic['name'] == topic_name)
+    response = client.post('/start_quiz', json={'topic_id': topic_id})
+    assert response.status_code == 200
+    return topic_id, response.get_json()
+
+
+def test_start_quiz_sends_the_first_question(client):
+    _, data = start_topic_quiz(client)
+    assert data['number_of_questions'] == len(data['question_ids']) == 7
+    question = data['question']
+    assert question['id'] == data['question_ids'][0]
+    assert question['question_html'] and question['etag']
+
+
+def test_answer_question_sends_the_next_question(client):
+    _, data = start_topic_quiz(client)
+    response = client.post('/answer_question', json={
+        'current_idx': 0, 'selected_choice': 0})
+    next_question = response.get_json()['next_question']
+    assert next_question['id'] == data['question_ids'][1]
+    assert 'question_html' in next_question
+
+
+def test_held_question_is_not_sent_again(client):
+    _, data = start_topic_quiz(client)
+    etags = {}
+    for idx in range(len(data['question_ids']) - 1):
+        response = client.post('/answer_question', json={
+            'current_idx': idx, 'selected_choice': 0})
+        question = response.get_json()['next_question']
+        etags[question['id']] = question['etag']
+    # Repeat the quiz holding every question but the first
+    _, data = start_topic_quiz(client)
+    for idx, question_id in enumerate(data['question_ids'][1:]):
+        response = client.post('/answer_question', json={
+            'current_idx': idx, 'selected_choice': 0,
+            'next_question_etag': etags.get(question_id)})
+        assert response.get_json()['next_question'] == {
+            'id': question_id, 'not_modified': True}
+
+
+def test_changed_question_is_sent_again(client):
+    _, data = start_topic_quiz(client)
+    response = client.post('/answer_question', json={
+        'current_idx': 0, 'selected_choice': 0,
+        'next_question_etag': 'stale'})
+    next_question = response.get_json()['next_question']
+    assert next_question['id'] == data['question_ids'][1]
+    assert 'question_html' in next_question
+
+
+def test_last_answer_has_no_next_question(client):
+    _, data = start_topic_quiz(client)
+    last_idx = data['number_of_questions'] - 1
+    response = client.post('/answer_question', json={
+        'current_idx': last_idx, 'selected_choice': 0})
+    assert response.get_json()['next_question'] is None
+
+
+def remove_question(question_id):
+    from app import db
+    from app.models import Question
+    from app.question_cache import question_cache
+    db.session.delete(db.session.get(Question, question_id))
+    db.session.commit()
+    question_cache.invalidate(question_id)
+
+
+def test_removed_question_shrinks_a_topic_quiz(client):
+    _, data = start_topic_quiz(client)
+    question_ids = data['question_ids']
+    remove_question(question_ids[1])
+    response = client.post('/answer_question', json={
+        'current_idx': 0, 'selected_choice': 0}).get_json()
+    # Every other question of the topic is in the quiz, so none of another
+    # topic takes its place
+    assert response['next_question']['id'] == question_ids[2]
+    assert response['number_of_questions'] == len(question_ids) - 1
+
+
+def test_removed_question_is_replaced_from_its_topic(client):
+    from app import db
+    from app.models import Question
+    from app.sampling import question_sampler
+    topic_id, data = start_topic_quiz(client)
+    question_ids = data['question_ids']
+    new_question = Question(question_number=99, question_title='New',
+                            question_html='<ul></ul>', correct_choice=0,
+                            topic_id=topic_id, topic_name='python')
+    db.session.add(new_question)
+    db.session.commit()
+    question_sampler.invalidate()
+    remove_question(question_ids[1])
+    response = client.post('/answer_question', json={
+        'current_idx': 0, 'selected_choice': 0}).get_json()
+    assert response['next_question']['id'] == new_question.id
+    assert response['number_of_questions'] == len(question_ids)
@@ -0,0 +1,87 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app, db
+from app.models import PerformanceTracker, Question, QuizPack
+
+
+@pytest.fixture
+def client(populated):
+    return app.test_client()
+
+
+def export_pack(client, topic_name='python'):
+    from app.topic_stats import topic_stats
+    topic_id = next(topic.id for topic in topic_stats.all()
+                    if topic.name == topic_name)
+    response = client.post('/quiz_pack', json={'topic_id': topic_id})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def sync(client, pack, answers=None):
+    if answers is None:
+        answers = [0] * len(pack['questions'])
+    return client.post('/sync_results', json={'pack_id': pack['pack_id'],
+                                              'answers': answers})
+
+
+def ema_scores():
+    db.session.expire_all()
+    return dict(db.session.execute(
+        db.select(Question.id, Question.ema_score)).all())
+
+
+def test_pack_holds_every_question_without_answers(client):
+    pack = export_pack(client)
+    assert len(pack['questions']) == 7
+    assert all('correct_choice' not in question
+               for question in pack['questions'])
+
+
+def test_sync_is_idempotent(client):
+    pack = export_pack(client)
+    response = sync(client, pack)
+    assert response.status_code == 200
+    scores = ema_scores()
+    assert sync(client, pack).data == response.data
+    assert ema_scores() == scores
+    assert PerformanceTracker.query.count() == 1
+
+
+def test_concurrent_syncs_are_applied_once(client):
+    pack = export_pack(client)
+    responses = []
+
+    def sync_in_thread():
+        with app.app_context():
+            responses.append(sync(app.test_client(), pack))
+            db.session.remove()
+
+    threads = [threading.Thread(target=sync_in_thread) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [response.status_code for response in responses] == [200] * 4
+    assert len({response.data for response in responses}) == 1
+    assert PerformanceTracker.query.count() == 1
+
+
+def test_expired_packs_are_removed(client):
+    expired = export_pack(client)
+    synced = export_pack(client)
+    sync(client, synced)
+    now = datetime.now()
+    db.session.execute(db.update(QuizPack).values(
+        created=now - timedelta(seconds=app.config['QUIZ_PACK_TTL'] + 1)))
+    db.session.execute(db.update(QuizPack)
+                       .where(QuizPack.id == synced['pack_id'])
+                       .values(synced=now - timedelta(
+                           seconds=app.config['QUIZ_PACK_SYNCED_TTL'] + 1)))
+    db.session.commit()
+    assert sync(client, expired).status_code == 404
+    current = export_pack(client)
+    assert [pack.id for pack in QuizPack.query] == [current['pack_id']]
@@ -0,0 +1,79 @@
+import pytest
+
+from app import quiz_state
+from app.quiz_state import MemoryQuizStateStore, SQLiteQuizStateStore
+
+
+class FakeClock:
+    """Stands in for the `time` module, only moving when told to."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(quiz_state, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path, clock):
+    if request.param == 'sqlite':
+        return SQLiteQuizStateStore(str(tmp_path / 'quiz_state.db'), ttl=60)
+    return MemoryQuizStateStore(max_entries=3, ttl=60)
+
+
+def test_state_round_trips(store):
+    quiz_id = store.create(2, [5, 3, 9])
+    state = store.get(quiz_id)
+    assert state.topic_id == 2
+    assert list(state.question_ids) == [5, 3, 9]
+    store.replace(quiz_id, [5, 9])
+    assert list(store.get(quiz_id).question_ids) == [5, 9]
+    store.delete(quiz_id)
+    assert store.get(quiz_id) is None
+
+
+def test_state_expires_after_ttl(store, clock):
+    quiz_id = store.create(1, [1])
+    clock.now += 60
+    assert store.get(quiz_id) is not None
+    clock.now += 1
+    assert store.get(quiz_id) is None
+
+
+def test_replace_keeps_expiry(store, clock):
+    quiz_id = store.create(1, [1, 2])
+    clock.now += 50
+    store.replace(quiz_id, [2])
+    clock.now += 11
+    assert store.get(quiz_id) is None
+
+
+def test_expired_states_are_removed_on_create(clock, tmp_path):
+    store = SQLiteQuizStateStore(str(tmp_path / 'quiz_state.db'), ttl=60)
+    store.create(1, [1])
+    clock.now += 61
+    store.create(1, [2])
+    conn = store._connect()
+    assert conn.execute("SELECT COUNT(*) FROM quiz_state").fetchone() == (1,)
+    conn.close()
+
+
+def test_least_recently_used_state_is_evicted(clock):
+    store = MemoryQuizStateStore(max_entries=3, ttl=60)
+    first, second, third = (store.create(1, [n]) for n in range(3))
+    # Reading the first quiz makes the second the least recently used
+    assert store.get(first) is not None
+    fourth = store.create(1, [3])
+    assert store.get(second) is None
+    assert all(store.get(quiz_id) is not None
+               for quiz_id in (first, third, fourth))
@@ -0,0 +1,113 @@
+import random
+import sqlite3
+from collections import Counter
+
+import pytest
+
+from app.sampling import FenwickTree, WeightedQuestionSampler
+
+
+def prefix_sums(weights):
+    total = 0.0
+    sums = []
+    for weight in weights:
+        total += weight
+        sums.append(total)
+    return sums
+
+
+def slow_find(weights, value):
+    """The position `FenwickTree.find` should return, found linearly."""
+    for pos, end in enumerate(prefix_sums(weights)):
+        if value < end:
+            return pos
+    return len(weights) - 1
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 8, 33])
+def test_find_matches_cumulative_weights(size):
+    rng = random.Random(size)
+    weights = [rng.random() for _ in range(size)]
+    tree = FenwickTree(weights)
+    for _ in range(200):
+        value = rng.random() * tree.total
+        assert tree.find(value) == slow_find(weights, value)
+    # The middle of each position's range is found at that position
+    for pos, end in enumerate(prefix_sums(weights)):
+        assert tree.find(end - weights[pos] / 2) == pos
+
+
+def test_set_updates_total_and_find():
+    rng = random.Random(1)
+    weights = [rng.random() for _ in range(20)]
+    tree = FenwickTree(weights)
+    for _ in range(100):
+        pos = rng.randrange(len(weights))
+        weights[pos] = rng.choice([0.0, rng.random() * 3])
+        tree.set(pos, weights[pos])
+        assert tree.total == pytest.approx(sum(weights))
+        value = rng.random() * tree.total
+        assert tree.find(value) == slow_find(weights, value)
+
+
+def test_zero_weights_are_never_found():
+    tree = FenwickTree([0.0, 1.0, 0.0, 0.0, 2.0, 0.0])
+    found = {tree.find(i / 100 * tree.total) for i in range(100)}
+    assert found == {1, 4}
+
+
+@pytest.fixture
+def sampler(database, populated):
+    sampler = WeightedQuestionSampler(min_weight=0.05)
+    sampler._random.seed(0)
+    return sampler
+
+
+def question_ids(db_path, topic_name=None):
+    conn = sqlite3.connect(db_path)
+    sql = "SELECT id FROM question"
+    params = ()
+    if topic_name is not None:
+        sql += " WHERE topic_name = ?"
+        params = (topic_name,)
+    ids = [row[0] for row in conn.execute(sql, params)]
+    conn.close()
+    return ids
+
+
+def test_weights_follow_scores(sampler):
+    assert sampler.weight(0.0) == pytest.approx(1.05)
+    assert sampler.weight(1.0) == pytest.approx(0.05)
+    assert sampler.weight(1.5) == pytest.approx(0.05)
+
+
+def test_sample_draws_distinct_questions(sampler, database):
+    all_ids = question_ids(database)
+    drawn = sampler.sample(len(all_ids) + 5)
+    assert sorted(drawn) == sorted(all_ids)
+    drawn = sampler.sample(5)
+    assert len(set(drawn)) == 5
+
+
+def test_sample_from_topics(sampler, database):
+    from app.topic_stats import topic_stats
+    topic_id = next(topic.id for topic in topic_stats.all()
+                    if topic.name == 'javascript')
+    drawn = sampler.sample(10, [topic_id])
+    assert sorted(drawn) == sorted(question_ids(database, 'javascript'))
+
+
+def test_updated_weights_change_draws(sampler, database):
+    all_ids = question_ids(database)
+    weak = all_ids[0]
+    # Updates are only applied once the weights are loaded
+    sampler.preload()
+    for question_id in all_ids[1:]:
+        sampler.update(question_id, 1.0)
+    counts = Counter(sampler.sample(1)[0] for _ in range(2000))
+    # The weak question weighs 1.05 against 0.05 for each of the others
+    expected = 1.05 / (1.05 + 0.05 * (len(all_ids) - 1))
+    assert counts[weak] / 2000 == pytest.approx(expected, abs=0.05)
+    # Weights are restored after every draw
+    assert sum(tree.total for tree in sampler._trees.values()) == \
+        pytest.approx(1.05 + 0.05 * (len(all_ids) - 1))
@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+
+# The schema of databases created before topic stats, content hashes,
+# score versions, highlighting and quiz packs were added
+OLD_SCHEMA = """
+    CREATE TABLE topic (
+        id INTEGER NOT NULL PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        last_seen DATETIME DEFAULT (CURRENT_TIMESTAMP)
+    );
+    CREATE TABLE question (
+        id INTEGER NOT NULL PRIMARY KEY,
+        question_number INTEGER NOT NULL,
+        question_title VARCHAR(255) NOT NULL,
+        question_html TEXT NOT NULL,
+        question_explanation TEXT,
+        correct_choice INTEGER NOT NULL,
+        topic_id INTEGER NOT NULL REFERENCES topic (id),
+        topic_name VARCHAR(100) NOT NULL,
+        ema_score FLOAT NOT NULL
+    );
+    CREATE INDEX ix_question_ema_score ON question (ema_score);
+    CREATE TABLE performance_tracker (
+        id INTEGER NOT NULL PRIMARY KEY,
+        topic_id INTEGER NOT NULL REFERENCES topic (id),
+        topic_name VARCHAR(100) NOT NULL,
+        accuracy FLOAT NOT NULL,
+        date DATETIME
+    );
+    INSERT INTO topic (id, name) VALUES (1, 'python');
+    INSERT INTO question VALUES
+        (1, 1, 'First?', '<p>First?</p>', NULL, 0, 1, 'python', 0.5),
+        (2, 2, 'Second?', '<p>Second?</p>', NULL, 1, 1, 'python', 0.25);
+    INSERT INTO performance_tracker VALUES
+        (1, 1, 'python', 0.5, '2023-01-01 00:00:00.000000');
+"""
+
+
+@pytest.fixture
+def old_database(database):
+    from app import db
+    db.session.remove()
+    db.engine.dispose()
+    conn = sqlite3.connect(database)
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")]
+    for table in tables:
+        conn.execute(f"DROP TABLE {table}")
+    conn.executescript(OLD_SCHEMA)
+    conn.close()
+    return database
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def test_old_database_is_upgraded(old_database):
+    import run
+    run.upgrade_database()
+    conn = sqlite3.connect(old_database)
+    assert {'content_hash'} <= columns(conn, 'topic')
+    assert {'highlighted', 'score_version'} <= columns(conn, 'question')
+    assert conn.execute("SELECT highlighted, ema_score FROM question "
+                        "ORDER BY id").fetchall() == [(0, 0.5), (0, 0.25)]
+    assert conn.execute(
+        "SELECT topic_name, question_count, ema_mean, ema_min, "
+        "attempt_count, last_accuracy FROM topic_stats"
+    ).fetchall() == [('python', 2, 0.375, 0.25, 1, 0.5)]
+    assert conn.execute("SELECT COUNT(*) FROM quiz_pack").fetchone() == (0,)
+    indexes = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'ix_question_score_version' in indexes
+    conn.close()
+
+
+def test_upgrade_is_idempotent(old_database):
+    import run
+    run.upgrade_database()
+    conn = sqlite3.connect(old_database)
+    schema = conn.execute("SELECT sql FROM sqlite_master").fetchall()
+    run.upgrade_database()
+    assert conn.execute("SELECT sql FROM sqlite_master").fetchall() == schema
+    conn.close()
+
+
+def test_upgraded_database_serves_quizzes(old_database):
+    import run
+    from app import app
+    run.upgrade_database()
+    client = app.test_client()
+    response = client.post('/start_quiz', json={'topic_id': 1})
+    assert response.status_code == 200
+    assert response.get_json()['number_of_questions'] == 2
+    assert client.post('/answer_question', json={
+        'current_idx': 0, 'selected_choice': 1}).status_code == 200
@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+from app import app
+
+
+@pytest.fixture
+def client(populated):
+    return app.test_client()
+
+
+def search(client, **params):
+    response = client.get('/search', query_string=params)
+    assert response.status_code == 200
+    return response.get_json()['results']
+
+
+def test_best_match_first(client):
+    results = search(client, q='abstract')
+    assert results[0]['question_title'] == 'What is an abstract class?'
+    assert results[0]['topic_name'] == 'python'
+    assert '<mark>abstract</mark>' in results[0]['snippet']
+
+
+def test_last_word_matches_as_prefix(client):
+    assert [result['question_title'] for result in search(client, q='abstr')] \
+        == ['What is an abstract class?']
+
+
+def test_every_word_must_match(client):
+    assert search(client, q='abstract console') == []
+
+
+def test_no_words_has_no_results(client):
+    assert search(client) == []
+    assert search(client, q='"*) (') == []
+
+
+def test_topic_filter(client):
+    results = search(client, q='code')
+    assert {result['topic_name'] for result in results} == \
+        {'javascript', 'python'}
+    topic_id = next(result['topic_id'] for result in results
+                    if result['topic_name'] == 'javascript')
+    results = search(client, q='code', topic_id=topic_id)
+    assert results
+    assert {result['topic_name'] for result in results} == {'javascript'}
+
+
+@pytest.mark.parametrize('limit, expected', [
+    (1, 1), (0, 1), (-1, 1), ('x', 3), (1000, 3),
+])
+def test_limit_is_clamped(client, monkeypatch, limit, expected):
+    monkeypatch.setitem(app.config, 'SEARCH_MAX_RESULTS', 3)
+    # SQLite would return every match for a negative limit
+    assert len(search(client, q='code', limit=limit)) == expected
+
+
+def test_index_is_built_on_first_search(client, database):
+    conn = sqlite3.connect(database)
+    conn.execute("DROP TABLE question_fts")
+    conn.close()
+    assert search(client, q='abstract')
@@ -0,0 +1,97 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT_DIR, 'tests', 'fixtures')
+# Modules which are only needed to populate the database
+INGEST_MODULES = ('utils', 'markdown', 'bs4')
+# Modules which are only needed to parse topics missing from the parse
+# cache (pygments is not listed, Flask-Migrate imports it through mako)
+PARSER_MODULES = ('markdown', 'bs4')
+# Seconds allowed to import the app, or to warm its caches, on a cold start
+STARTUP_TIME_LIMIT = 3.0
+
+
+def run_script(script, db_path):
+    """
+    Run a script in a new interpreter, as `run.py` would be, and return the
+    JSON it prints.
+    """
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}',
+               QUIZ_STATE_STORE='memory')
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT_DIR,
+                            env=env, capture_output=True, text=True,
+                            check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_import_run_is_fast_and_lazy(tmp_path):
+    result = run_script(
+        'import json, sys, time\n'
+        'start = time.perf_counter()\n'
+        'import run\n'
+        'elapsed = time.perf_counter() - start\n'
+        f'print(json.dumps([elapsed, [name for name in {INGEST_MODULES!r} '
+        'if name in sys.modules]]))\n',
+        tmp_path / 'app.db'
+    )
+    elapsed, imported = result
+    assert imported == []
+    assert elapsed < STARTUP_TIME_LIMIT
+
+
+def test_warm_start_is_fast_and_lazy(tmp_path):
+    db_path = tmp_path / 'app.db'
+    run_script('from app import app, db\n'
+               'with app.app_context():\n'
+               '    db.create_all()\n'
+               'print("null")\n', db_path)
+    result = run_script(
+        'import json, sys, time\n'
+        'import run\n'
+        'start = time.perf_counter()\n'
+        'run.warm_caches()\n'
+        'elapsed = time.perf_counter() - start\n'
+        f'print(json.dumps([elapsed, [name for name in {INGEST_MODULES!r} '
+        'if name in sys.modules]]))\n',
+        db_path
+    )
+    elapsed, imported = result
+    assert imported == []
+    assert elapsed < STARTUP_TIME_LIMIT
+
+
+def run_first_start(db_path, cache_dir):
+    return run_script(
+        'import json, logging, sys, time\n'
+        'start = time.perf_counter()\n'
+        'import run\n'
+        'from utils import populate_database\n'
+        'handlers = list(logging.getLogger().handlers)\n'
+        'run.init_database()\n'
+        'logging_kept = (logging.getLogger().handlers == handlers and not '
+        'logging.getLogger("werkzeug").disabled)\n'
+        f'populate_database({FIXTURES_DIR!r}, workers=1, '
+        f'cache_dir={str(cache_dir)!r}, duplicates="off", '
+        'defer_indexes=True)\n'
+        'elapsed = time.perf_counter() - start\n'
+        f'print(json.dumps([elapsed, logging_kept, [name for name in '
+        f'{PARSER_MODULES!r} if name in sys.modules]]))\n',
+        db_path
+    )
+
+
+def test_first_start_is_fast(tmp_path):
+    cache_dir = tmp_path / 'parse_cache'
+    elapsed, logging_kept, _ = run_first_start(tmp_path / 'first.db',
+                                               cache_dir)
+    assert logging_kept
+    assert elapsed < STARTUP_TIME_LIMIT
+    # With the topics in the parse cache, nothing needs to be parsed
+    elapsed, logging_kept, imported = run_first_start(tmp_path / 'second.db',
+                                                      cache_dir)
+    assert logging_kept
+    assert imported == []
+    assert elapsed < STARTUP_TIME_LIMIT
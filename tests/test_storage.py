@@ -0,0 +1,62 @@
+import threading
+import time
+
+from sqlalchemy import select
+
+# Seconds the writer holds each ingest transaction open for
+WRITE_HOLD = 0.5
+READERS = 8
+DURATION = 2.0
+
+
+def test_readers_are_not_blocked_by_a_writer(populated):
+    """
+    A writer repeatedly holds an ingest transaction, which has updated
+    every question, open while readers query the questions through the
+    app's connection pool. No read waits for the writer.
+    """
+    from app import app, db
+    from app.models import Question
+    from utils import ingest_connection
+
+    stop = threading.Event()
+    latencies = []
+    writes = []
+    errors = []
+
+    def write():
+        try:
+            while not stop.is_set():
+                with ingest_connection() as conn:
+                    conn.execute("UPDATE question SET ema_score = ema_score")
+                    time.sleep(WRITE_HOLD)
+                writes.append(1)
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        query = select(Question.id, Question.ema_score)
+        try:
+            with app.app_context():
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    rows = db.session.execute(query).all()
+                    db.session.commit()
+                    latencies.append(time.perf_counter() - start)
+                    assert len(rows) == 11
+                db.session.remove()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write)]
+    threads += [threading.Thread(target=read) for _ in range(READERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert writes
+    assert latencies
+    assert max(latencies) < WRITE_HOLD / 2
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+from sqlalchemy import func, select
+
+from app import app, db, ema_buffer
+from app.models import Question, TopicStats
+from app.topic_stats import topic_stats
+
+
+def aggregate_scores():
+    """Return the question count, mean and minimum EMA score of each topic."""
+    return {
+        topic_id: (count, mean, minimum)
+        for topic_id, count, mean, minimum in db.session.execute(
+            select(Question.topic_id, func.count(), func.avg(Question.ema_score),
+                   func.min(Question.ema_score))
+            .group_by(Question.topic_id))
+    }
+
+
+def stored_scores():
+    """Return the question count and EMA scores in `topic_stats`."""
+    db.session.commit()
+    return {
+        topic_id: (count, mean, minimum)
+        for topic_id, count, mean, minimum in db.session.execute(
+            select(TopicStats.topic_id, TopicStats.question_count,
+                   TopicStats.ema_mean, TopicStats.ema_min))
+    }
+
+
+def assert_scores_match(stored, expected):
+    assert stored.keys() == expected.keys()
+    for topic_id, (count, mean, minimum) in expected.items():
+        assert stored[topic_id][0] == count
+        assert stored[topic_id][1:] == pytest.approx((mean, minimum))
+
+
+def answer_questions(client, answers):
+    """Answer questions of every topic, in a random but repeatable order."""
+    rng = random.Random(0)
+    for topic in topic_stats.all():
+        data = client.post('/start_quiz', json={'topic_id': topic.id}
+                           ).get_json()
+        for idx in range(min(answers, data['number_of_questions'])):
+            client.post('/check_answer', json={
+                'current_idx': idx, 'selected_choice': rng.randrange(2)})
+
+
+def test_scores_follow_answers(populated):
+    client = app.test_client()
+    for _ in range(3):
+        answer_questions(client, answers=5)
+        assert_scores_match(stored_scores(), aggregate_scores())
+    # The snapshot matches the table
+    for topic in topic_stats.all():
+        assert (topic.question_count, topic.ema_mean, topic.ema_min) \
+            == pytest.approx(stored_scores()[topic.id])
+
+
+def test_minimum_is_found_again_when_it_goes_up(populated):
+    client = app.test_client()
+    topic = topic_stats.all()[0]
+    data = client.post('/start_quiz', json={'topic_id': topic.id}).get_json()
+    # Every score starts at 0, answer all but one question correctly
+    for idx in range(data['number_of_questions'] - 1):
+        response = client.post('/check_answer', json={
+            'current_idx': idx, 'selected_choice': -1}).get_json()
+        correct_choice = response['correct_choice']
+        client.post('/check_answer', json={
+            'current_idx': idx, 'selected_choice': correct_choice})
+    assert stored_scores()[topic.id][2] == 0.0
+    response = client.post('/check_answer', json={
+        'current_idx': data['number_of_questions'] - 1,
+        'selected_choice': -1}).get_json()
+    client.post('/check_answer', json={
+        'current_idx': data['number_of_questions'] - 1,
+        'selected_choice': response['correct_choice']})
+    assert stored_scores()[topic.id][2] == 0.5
+    assert_scores_match(stored_scores(), aggregate_scores())
+
+
+def test_write_behind_stats_load_without_flushing(populated, monkeypatch):
+    monkeypatch.setattr(ema_buffer, 'enabled', True)
+    monkeypatch.setattr(ema_buffer, 'interval', 3600)
+    client = app.test_client()
+    before = stored_scores()
+    answer_questions(client, answers=3)
+    topic_stats.invalidate()
+    topics = topic_stats.all()
+    # The scores are still buffered, but the snapshot includes them
+    assert stored_scores() == before
+    ema_buffer.flush()
+    after = stored_scores()
+    assert after != before
+    assert_scores_match(after, aggregate_scores())
+    for topic in topics:
+        assert (topic.question_count, topic.ema_mean, topic.ema_min) \
+            == pytest.approx(after[topic.id])
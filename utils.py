@@ -1,10 +1,21 @@
 import sqlite3
 import re
 import os
+import hashlib
 import itertools
+import json
+import shutil
+import time
+import zlib
+from html import escape, unescape
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 
-import markdown
-from bs4 import BeautifulSoup
+from config import basedir
+# N.B. markdown, bs4 and pygments are imported where they are used, so the
+# app can populate the database from the parse cache without loading them
 
 
 def remove_duplicate_ul(string):
@@ -43,7 +54,497 @@ def remove_duplicate_ul(string):
     return string.replace('  ', ' ')
 
 
-def parse_md_file(filepath, topic_name):
+# Bump when a change to the parser changes its output, this invalidates
+# the parse cache and the stored hash of every topic
+PARSER_VERSION = 5
+
+# Default location and maximum size of the on-disk parse cache, which is
+# kept in the project directory whichever directory the app is run from
+PARSE_CACHE_DIR = os.path.join(basedir, 'parse_cache')
+PARSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Matches a markdown link to a topic's image
+IMAGE_LINK_RE = re.compile(r'\(images/([^)\s]+)')
+# Number of hex digits of the content hash in the URL of an asset
+ASSET_DIGEST_LENGTH = 16
+
+# Matches a level four heading, each of which starts a new question
+QUESTION_HEADING_RE = re.compile(r'####(?!#)')
+# Matches a line which may define a reference link
+REFERENCE_LINE_RE = re.compile(r'^[ ]{0,3}\[[^\[\]]*\]:', re.MULTILINE)
+# Matches the opening line of a block for the `fenced_code` extension
+OPENING_FENCE_RE = re.compile(
+    r'(?P<fence>~{3,}|`{3,})[ ]*'
+    r'((\{[^\}\n]*\})|(\.?[\w#.+-]*[ ]*)?'
+    r'(hl_lines=(?P<quot>"|\').*?(?P=quot)[ ]*)?)\n'
+)
+
+
+def iter_question_blocks(lines, block=None):
+    """
+    Split lines of markdown into the markdown for each question.
+
+    A question starts at a level four heading and ends before the next
+    one. Headings inside fenced code blocks are ignored, in the same way
+    as the `fenced_code` extension, and any text before the first question
+    is skipped. Only the current question is held in memory.
+
+    Args:
+        lines (iterable): The lines of markdown, including line endings.
+        block (list, optional): The lines of a question which has already
+                                been started. Defaults to None.
+
+    Yields:
+        str: The markdown for each question.
+    """
+    fence = None
+    # Lines after an opening fence, scanned again if it is never closed
+    fenced = []
+    for line in lines:
+        if fence is not None:
+            if line.rstrip('\n').rstrip(' ') == fence:
+                fence = None
+            else:
+                fenced.append(line)
+        elif QUESTION_HEADING_RE.match(line):
+            if block is not None:
+                yield ''.join(block)
+            block = []
+        else:
+            match = OPENING_FENCE_RE.match(line)
+            if match:
+                fence = match.group('fence')
+                fenced = []
+        if block is not None:
+            block.append(line)
+
+    if fence is not None:
+        # An unclosed fence is not a code block, so look for questions in
+        # the lines after it
+        if block is not None:
+            del block[len(block) - len(fenced):]
+        yield from iter_question_blocks(fenced, block)
+    elif block is not None:
+        yield ''.join(block)
+
+
+class FileReferences(dict):
+    """
+    The reference link definitions of a whole markdown file.
+
+    Converting the whole file resolves a reference defined anywhere in it,
+    whereas each question on its own only sees its own definitions. The
+    definitions are collected before the questions are converted, and a
+    conversion cannot change them, so the last definition in the file wins
+    for every question as it does for the whole file.
+    """
+
+    def __setitem__(self, key, value):
+        # The definitions found while converting a question are ignored
+        pass
+
+    def clear(self):
+        # Called by `Markdown.reset` before each question
+        pass
+
+
+def collect_references(md, blocks):
+    """
+    Collect the reference link definitions in blocks of markdown.
+
+    Only blocks with a line which may be a definition are converted, the
+    definitions are then read from the converter.
+
+    Returns:
+        FileReferences: The definitions, keyed by lowercase id.
+    """
+    references = {}
+    for md_text in blocks:
+        if REFERENCE_LINE_RE.search(md_text):
+            md.reset().convert(md_text)
+            references.update(md.references)
+    return FileReferences(references)
+
+
+def iter_md_questions(filepath, topic_name, timings=None, highlight=True):
+    """
+    Parse a markdown file one question at a time.
+
+    The markdown is split into questions before it is converted, so each
+    question is converted to HTML and parsed with BeautifulSoup on its
+    own. This means memory use is bounded by the largest question rather
+    than the size of the file. Reference link definitions are the one
+    thing shared between questions, they are collected first.
+
+    Args:
+        filepath (str): The path to the markdown file.
+        topic_name (str): The name of the topic.
+        timings (dict, optional): If given, the seconds spent converting
+                                  markdown, parsing the HTML and
+                                  highlighting code are added to its
+                                  'convert', 'soup' and 'highlight' keys.
+        highlight (bool, optional): Whether to highlight the code with
+                                    Pygments, otherwise it is left for
+                                    highlight.js. Defaults to True.
+
+    Yields:
+        tuple: A tuple representing each question, see `parse_md_file`.
+    """
+    import markdown
+    from bs4 import BeautifulSoup
+
+    # Extensions used to preserve newlines and code blocks
+    md = markdown.Markdown(extensions=['nl2br', 'fenced_code'])
+    topic_dir = os.path.dirname(filepath)
+
+    def image_url(match):
+        path = f'images/{match.group(1)}'
+        return f'({asset_url(topic_dir, topic_name, path)}'
+
+    # References may be defined in any question or before the first one,
+    # so they are collected in a first pass over the file
+    with open(filepath, 'r') as f:
+        references = collect_references(
+            md, (IMAGE_LINK_RE.sub(image_url, md_text)
+                 for md_text in iter_question_blocks(f, block=[])))
+    with open(filepath, 'r') as f:
+        for md_text in iter_question_blocks(f):
+            start = time.perf_counter()
+            # Update all image paths to point to their content-hashed URL
+            md_text = IMAGE_LINK_RE.sub(image_url, md_text)
+            md.reset()
+            md.references = references
+            html = md.convert(md_text)
+            converted = time.perf_counter()
+            # Parse HTML using BeautifulSoup
+            soup = BeautifulSoup(html, 'html.parser')
+            questions = [parse_question(block) for block in soup.find_all('h4')]
+            parsed = time.perf_counter()
+            if highlight:
+                questions = [highlight_question(question, topic_name)
+                             for question in questions]
+            else:
+                questions = [question + (False,) for question in questions]
+            if timings is not None:
+                timings['convert'] = (timings.get('convert', 0.0)
+                                      + converted - start)
+                timings['soup'] = (timings.get('soup', 0.0)
+                                   + parsed - converted)
+                timings['highlight'] = (timings.get('highlight', 0.0)
+                                        + time.perf_counter() - parsed)
+            yield from questions
+
+
+def asset_digest(filepath):
+    """
+    Return the hash of a file's content as it appears in its asset URL.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:ASSET_DIGEST_LENGTH]
+
+
+def asset_url(topic_dir, topic_name, path):
+    """
+    Return the URL of a file in a topic's directory, fingerprinted with
+    the hash of its content.
+
+    The app serves these URLs from `/assets` with far-future caching, a
+    changed file gets a new URL when its topic is parsed again. A file
+    which does not exist keeps its plain static URL.
+
+    Args:
+        topic_dir (str): The path to the topic's directory.
+        topic_name (str): The name of the topic (and its directory).
+        path (str): The path of the file within the topic's directory.
+    """
+    try:
+        fingerprint = asset_digest(os.path.join(topic_dir, path))
+    except OSError:
+        return f'static/data/{topic_name}/{path}'
+    return f'/assets/{fingerprint}/{topic_name}/{path}'
+
+
+def parse_question(block):
+    """
+    Parse the HTML for a question, starting at its heading.
+
+    Args:
+        block (bs4.element.Tag): The h4 tag with the question title.
+
+    Returns:
+        tuple: A tuple representing the question, see `parse_md_file`.
+    """
+    answer_idx = 0
+    correct_index = None
+    question_explanation = None
+    question_number = re.search(r'\d+', block.text).group()
+    question_title = ' '.join(block.text.strip().split()[1:])
+    question_content = [question_title]
+    # Find the next sibling until the next question block or end of file
+    next_sibling = block.next_sibling
+    while next_sibling and next_sibling.name != 'h4':
+        if next_sibling.name == 'ul':
+            # Add the answer choices
+            next_sibling['class'] = 'list-group'
+            next_sibling['id'] = 'answer_choices'
+            answer_choices = []
+            for item in next_sibling.find_all('li'):
+                if item.text.strip().startswith('[x]'):
+                    correct_index = answer_idx
+                item['onclick'] = f"checkAnswer({answer_idx})"
+                item['class'] = 'my-1 list-group-item'
+                item.string = item.text[4:].strip()
+                answer_choices.append(str(item).strip())
+                # Increment the answer index
+                answer_idx += 1
+
+            question_content.append(str(next_sibling))
+        elif next_sibling.name != 'a':
+            # Append anchor tags to the question content
+            question_content.append(str(next_sibling).strip())
+        next_sibling = next_sibling.next_sibling
+
+    question_content_html = ''.join(question_content)
+    # Insert 'pre' tag before 'code' tag to enable syntax highlighting
+    pattern = r'(<code>.*?</code>)'
+    replacement = r'<pre>\1</pre>'
+    question_content_html = re.sub(pattern,
+                                   replacement,
+                                   question_content_html)
+    # Remove duplicate ul tags
+    question_content_html = remove_duplicate_ul(question_content_html)
+    # Check if there is an explanation after the question content
+    if not question_content_html.endswith('</ul>'):
+        # Split the question content and explanation at list UL tag
+        split_idx = question_content_html.index('</ul>') + 5
+        question_content, question_explanation = (
+            question_content_html[:split_idx],
+            question_content_html[split_idx:]
+        )
+        # Change all <p> tags to <div> in the explanation
+        question_explanation = (
+            question_explanation
+            .replace('<p>', '<div class="my-2">')
+            .replace('</p>', '</div>')
+        )
+        # Change the <strong> tag to <h5> in the explanation
+        question_explanation = (
+            question_explanation
+            .replace('<strong>', '<h5 id="explanation-header">')
+            .replace('</strong>', '</h5>')
+        )
+        # Style anchor tag as button and make link open in new tab
+        a_str = '<a target="_blank" id="explanation-header" class="btn btn-secondary"'
+        question_explanation = (
+            question_explanation
+            .replace('<a', a_str)
+        )
+    else:
+        # Question has no explanation, just use the question content
+        question_content = question_content_html
+
+    # Remove all p tags from content and return the question
+    question_content = question_content.replace('<p>', '').replace('</p>', '')
+    return (question_number, question_title, question_content,
+            question_explanation, correct_index)
+
+
+# Matches a code block, which highlight.js would highlight in the browser
+CODE_BLOCK_RE = re.compile(
+    r'<pre><code(?: class="language-(?P<language>[^"]+)")?>(?P<code>.*?)'
+    r'</code>', re.DOTALL
+)
+# highlight.js classes for Pygments token types, so the stylesheet of the
+# highlight.js theme applies to code highlighted at ingest. Token types
+# which are not listed use the class of their closest listed parent. Token
+# types are tuples of their names, e.g. `Keyword.Constant` is equal to
+# ('Keyword', 'Constant'), so they are listed without importing Pygments.
+HLJS_CLASSES = {
+    ('Keyword',): 'hljs-keyword',
+    ('Keyword', 'Constant'): 'hljs-literal',
+    ('Keyword', 'Type'): 'hljs-type',
+    ('Operator', 'Word'): 'hljs-keyword',
+    ('Name', 'Builtin'): 'hljs-built_in',
+    ('Name', 'Class'): 'hljs-title class_',
+    ('Name', 'Exception'): 'hljs-title class_',
+    ('Name', 'Function'): 'hljs-title function_',
+    ('Name', 'Decorator'): 'hljs-meta',
+    ('Name', 'Tag'): 'hljs-name',
+    ('Name', 'Attribute'): 'hljs-attr',
+    ('Literal', 'String'): 'hljs-string',
+    ('Literal', 'String', 'Regex'): 'hljs-regexp',
+    ('Literal', 'Number'): 'hljs-number',
+    ('Comment',): 'hljs-comment',
+    ('Comment', 'Preproc'): 'hljs-meta',
+    ('Generic', 'Deleted'): 'hljs-deletion',
+    ('Generic', 'Inserted'): 'hljs-addition',
+    ('Generic', 'Heading'): 'hljs-section',
+}
+
+
+# Languages a code block without one may be guessed as, the common ones
+# highlight.js detects in the browser
+GUESSED_LANGUAGES = (
+    'bash', 'c', 'cpp', 'csharp', 'css', 'go', 'html', 'java', 'javascript',
+    'json', 'kotlin', 'php', 'python', 'ruby', 'rust', 'sql', 'swift',
+    'typescript', 'xml', 'yaml',
+)
+
+
+# Options for the lexers of some languages, by their first alias. PHP in
+# the quizzes rarely starts with `<?php`, without which it is lexed as HTML
+LEXER_OPTIONS = {
+    'php': {'startinline': True},
+}
+
+
+@lru_cache(maxsize=None)
+def find_lexer(name):
+    """Return the Pygments lexer for a language name, or None."""
+    from pygments.lexers import find_lexer_class_by_name
+    from pygments.util import ClassNotFound
+    try:
+        lexer_class = find_lexer_class_by_name(name)
+    except ClassNotFound:
+        return None
+    # The code is highlighted as it is, without newlines added or removed
+    return lexer_class(ensurenl=False, stripnl=False,
+                       **LEXER_OPTIONS.get(lexer_class.aliases[0], {}))
+
+
+@lru_cache(maxsize=None)
+def topic_lexer(topic_name):
+    """
+    Return the lexer for the language a topic is named after, or None.
+
+    Template languages are skipped, as the code in their topic is mostly
+    in another language, e.g. Python in the Django topic.
+    """
+    lexer = find_lexer(topic_name.lower())
+    if lexer is None or type(lexer).__module__ == 'pygments.lexers.templates':
+        return None
+    return lexer
+
+
+def guess_lexer(code):
+    """Return the lexer of the likeliest `GUESSED_LANGUAGES`, or None."""
+    score, lexer = max(
+        ((find_lexer(name).analyse_text(code), find_lexer(name))
+         for name in GUESSED_LANGUAGES), key=lambda pair: pair[0]
+    )
+    return lexer if score > 0 else None
+
+
+def hljs_class(token_type):
+    """Return the highlight.js class for a Pygments token type, or None."""
+    while token_type is not None:
+        if token_type in HLJS_CLASSES:
+            return HLJS_CLASSES[token_type]
+        token_type = token_type.parent
+    return None
+
+
+def highlight_code(code, lexer):
+    """
+    Highlight code with a Pygments lexer as highlight.js would.
+
+    Args:
+        code (str): The code, as plain text.
+        lexer (pygments.lexer.Lexer): The lexer for the code's language.
+
+    Returns:
+        str: The escaped code, with tokens wrapped in spans that have
+             highlight.js classes. Adjacent tokens with the same class
+             share a span.
+    """
+    parts = []
+    for css_class, tokens in itertools.groupby(
+            lexer.get_tokens(code), key=lambda token: hljs_class(token[0])):
+        text = escape(''.join(value for _, value in tokens), quote=False)
+        if css_class is None:
+            parts.append(text)
+        else:
+            parts.append(f'<span class="{css_class}">{text}</span>')
+    return ''.join(parts)
+
+
+def highlight_html(html, topic_name):
+    """
+    Highlight the code blocks in some question HTML.
+
+    The language is taken from the fenced code block, otherwise the topic
+    name is tried as a language and then the language is guessed from the
+    code. Blocks in an unknown language are left for highlight.js, which
+    can tell more languages apart.
+
+    Returns:
+        tuple: The HTML and whether every code block was highlighted. A
+               block whose language is unknown, which Pygments fails on
+               or in which it finds no tokens to highlight is left for
+               highlight.js to highlight in the browser.
+    """
+    from pygments.lexers.special import TextLexer
+    complete = True
+
+    def replace(match):
+        nonlocal complete
+        code = unescape(match.group('code'))
+        language = match.group('language')
+        if language is not None:
+            lexer = find_lexer(language.lower())
+        else:
+            lexer = topic_lexer(topic_name)
+            if lexer is None:
+                lexer = guess_lexer(code)
+        if lexer is None:
+            complete = False
+            return match.group()
+        try:
+            highlighted = highlight_code(code, lexer)
+        # Lexers are third party code, any failure leaves the block as it was
+        except Exception:
+            complete = False
+            return match.group()
+        # Plain text aside, code without a single highlighted token is
+        # most likely in another language than the lexer's
+        if '<span' not in highlighted and not isinstance(lexer, TextLexer):
+            complete = False
+            return match.group()
+        if isinstance(lexer, TextLexer):
+            css_class = 'hljs'
+        else:
+            css_class = f'hljs language-{lexer.aliases[0]}'
+        return f'<pre><code class="{css_class}">{highlighted}</code>'
+
+    if html:
+        html = CODE_BLOCK_RE.sub(replace, html)
+    return html, complete
+
+
+def highlight_question(question, topic_name):
+    """
+    Highlight the code in a parsed question and its explanation.
+
+    Returns:
+        tuple: The question tuple, see `parse_md_file`, with the
+               highlighted HTML and a flag set if every code block was
+               highlighted, so the client does not need to.
+    """
+    number, title, content, explanation, correct_index = question
+    content, content_complete = highlight_html(content, topic_name)
+    explanation, explanation_complete = highlight_html(explanation,
+                                                       topic_name)
+    return (number, title, content, explanation, correct_index,
+            content_complete and explanation_complete)
+
+
+def parse_md_file(filepath, topic_name, timings=None, highlight=True):
     """
     Parse a markdown file and return a list of tuples.
 
@@ -55,109 +556,167 @@ def parse_md_file(filepath, topic_name):
     - question_content: The HTML content of the question.
     - question_explanation: The HTML content of the explanation if it exists.
     - correct_index: The index of the correct answer choice.
+    - highlighted: Whether all the code in the question was highlighted.
 
     Each question is parsed using BeautifulSoup and stored as html
-    so that it can be displayed in the quiz.
+    so that it can be displayed in the quiz, with its code highlighted
+    by `highlight_question`.
 
     Args:
         filepath (str): The path to the markdown file.
         topic_name (str): The name of the topic.
+        timings (dict, optional): Collects the time spent in each stage,
+                                  see `iter_md_questions`.
+        highlight (bool, optional): Whether to highlight the code with
+                                    Pygments. Defaults to True.
     
     Returns:
         list: A list of tuples representing the questions.
     """
-    questions = []
-    with open(filepath, 'r') as f:
-        md_text = f.read()
+    return list(iter_md_questions(filepath, topic_name, timings, highlight))
 
-    # Update all image paths to point to static folder
-    md_text = md_text.replace('(images/', f'(static/data/{topic_name}/images/')
-    # Extensions used to preserve newlines and code blocks
-    html = markdown.markdown(md_text, extensions=['nl2br', 'fenced_code'])
-    # Parse HTML using BeautifulSoup
-    soup = BeautifulSoup(html, 'html.parser')
-    # Iterate through each question block and parse it
-    for block in soup.find_all('h4'):
-        answer_idx = 0
-        correct_index = None
-        question_explanation = None
-        question_number = re.search(r'\d+', block.text).group()
-        question_title = ' '.join(block.text.strip().split()[1:])
-        question_content = [question_title]
-        # Find the next sibling until the next question block or end of file
-        next_sibling = block.next_sibling
-        while next_sibling and next_sibling.name != 'h4':
-            if next_sibling.name == 'ul':
-                # Add the answer choices
-                next_sibling['class'] = 'list-group'
-                next_sibling['id'] = 'answer_choices'
-                answer_choices = []
-                for item in next_sibling.find_all('li'):
-                    if item.text.strip().startswith('[x]'):
-                        correct_index = answer_idx
-                    item['onclick'] = f"checkAnswer({answer_idx})"
-                    item['class'] = 'my-1 list-group-item'
-                    item.string = item.text[4:].strip()
-                    answer_choices.append(str(item).strip())
-                    # Increment the answer index
-                    answer_idx += 1
-
-                question_content.append(str(next_sibling))
-            elif next_sibling.name != 'a':
-                # Append anchor tags to the question content
-                question_content.append(str(next_sibling).strip())
-            next_sibling = next_sibling.next_sibling
-
-        question_content_html = ''.join(question_content)
-        # Insert 'pre' tag before 'code' tag to enable syntax highlighting
-        pattern = r'(<code>.*?</code>)'
-        replacement = r'<pre>\1</pre>'
-        question_content_html = re.sub(pattern,
-                                       replacement,
-                                       question_content_html)
-        # Remove duplicate ul tags
-        question_content_html = remove_duplicate_ul(question_content_html)
-        # Check if there is an explanation after the question content
-        if not question_content_html.endswith('</ul>'):
-            # Split the question content and explanation at list UL tag
-            split_idx = question_content_html.index('</ul>') + 5
-            question_content, question_explanation = (
-                question_content_html[:split_idx],
-                question_content_html[split_idx:]
-            )
-            # Change all <p> tags to <div> in the explanation
-            question_explanation = (
-                question_explanation
-                .replace('<p>', '<div class="my-2">')
-                .replace('</p>', '</div>')
-            )
-            # Change the <strong> tag to <h5> in the explanation
-            question_explanation = (
-                question_explanation
-                .replace('<strong>', '<h5 id="explanation-header">')
-                .replace('</strong>', '</h5>')
-            )
-            # Style anchor tag as button and make link open in new tab
-            a_str = '<a target="_blank" id="explanation-header" class="btn btn-secondary"'
-            question_explanation = (
-                question_explanation
-                .replace('<a', a_str)
-            )
-        else:
-            # Question has no explanation, just use the question content
-            question_content = question_content_html
 
-        # Remove all p tags from content and append to questions list
-        question_content = question_content.replace('<p>', '').replace('</p>', '')
-        questions.append((question_number, question_title, question_content,
-                          question_explanation, correct_index))
+def file_hash(filepath, extra_paths=()):
+    """
+    Return the SHA-256 hex digest of a file's contents and the parser version.
+
+    The parser version is included so that the hash of an unchanged file
+    changes whenever the output of the parser does, and so is the Pygments
+    version, as the highlighted code can change with it. The names and
+    contents of `extra_paths` are included too, so a topic is parsed again
+    when one of its images changes, as the image URLs hold their content
+    hash.
+    """
+    import pygments
+    digest = hashlib.sha256(
+        f'parser-v{PARSER_VERSION}:pygments-{pygments.__version__}:'.encode())
+    for path in (filepath, *extra_paths):
+        if path != filepath:
+            digest.update(f'\0{os.path.basename(path)}\0'.encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def topic_images(data_dir, topic):
+    """Return the sorted paths of the files in a topic's images directory."""
+    images_dir = os.path.join(data_dir, topic, 'images')
+    if not os.path.isdir(images_dir):
+        return []
+    return sorted(entry.path for entry in os.scandir(images_dir)
+                  if entry.is_file())
+
 
-    return questions
+def get_engine():
+    """Return the app's engine, configured by `Config`."""
+    from app import app, db
+    with app.app_context():
+        return db.engine
 
 
-def add_topic(topic_name, questions, db_path='app.db'):
+def get_db_path(db_path=None):
+    """Return `db_path`, or the path of the app's configured database."""
+    return db_path if db_path is not None else get_engine().url.database
+
+
+def connect(db_path=None):
     """
-    Add a new topic to the database.
+    Open a connection to a database file.
+
+    Without a path, a connection is checked out of the app's engine pool,
+    so it has the storage profile `SQLITE_PRAGMAS` applied. Closing it
+    returns it to the pool.
+    """
+    if db_path is None:
+        return get_engine().raw_connection()
+    return sqlite3.connect(db_path)
+
+
+def get_topic_hashes(db_path=None):
+    """Return a dict mapping each topic name to its stored content hash."""
+    conn = connect(db_path)
+    rows = conn.execute("SELECT name, content_hash FROM topic").fetchall()
+    conn.close()
+    return dict(rows)
+
+
+# PRAGMAs used while bulk loading, restored once the load is finished.
+# N.B. with an in-memory journal and no syncing a crash part way through
+# an ingest can corrupt the database, re-run with --force-clone if so.
+INGEST_PRAGMAS = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'cache_size': -64000,  # Negative values are in KiB, i.e. 64MB
+}
+
+# Indexes that can be dropped during a load and rebuilt afterwards
+DEFERRED_INDEXES = {
+    'ix_question_ema_score': 'CREATE INDEX IF NOT EXISTS '
+                             'ix_question_ema_score ON question (ema_score)',
+}
+
+
+@contextmanager
+def ingest_connection(db_path=None, defer_indexes=False):
+    """
+    Open a single connection for a bulk load inside one transaction.
+
+    The `INGEST_PRAGMAS` are applied for the duration of the load and
+    the previous values restored afterwards. The transaction is committed
+    if the block succeeds and rolled back otherwise.
+
+    Args:
+        db_path (str, optional): The path to the database file.
+                                 Defaults to None, the app's database.
+        defer_indexes (bool, optional): Drop the `DEFERRED_INDEXES` before
+                                        the load and create them again
+                                        afterwards. Defaults to False.
+
+    Yields:
+        sqlite3.Connection: The connection to load the data with.
+    """
+    conn = connect(db_path)
+    previous = {}
+    for pragma, value in INGEST_PRAGMAS.items():
+        current = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        # Leaving WAL mode needs exclusive access, which a running app
+        # prevents, and bulk loads are fast enough in WAL mode anyway
+        if pragma == 'journal_mode' and current == 'wal':
+            continue
+        previous[pragma] = current
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    try:
+        conn.execute("BEGIN")
+        if defer_indexes:
+            for index in DEFERRED_INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {index}")
+        yield conn
+        if defer_indexes:
+            for create_index in DEFERRED_INDEXES.values():
+                conn.execute(create_index)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        for pragma, value in previous.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        conn.close()
+
+
+def add_topic(topic_name, questions, db_path=None, content_hash=None,
+              conn=None):
+    """
+    Add a topic to the database or update it if it already exists.
+
+    Questions are upserted, keyed on their number and title, so that
+    questions which are still present keep their id and EMA score.
+    If a question was renumbered it is matched on its title alone,
+    as long as that title is unique within the topic. Questions that
+    are no longer in the markdown file are deleted. All rows are
+    written with batched statements, and only the questions whose
+    text changed are re-indexed in the search index.
 
     N.B. The database must already exist and have the correct schema.
 
@@ -165,59 +724,820 @@ def add_topic(topic_name, questions, db_path='app.db'):
         topic_name (str): The name of the topic.
         questions (list): A list of tuples representing the questions.
         db_path (str, optional): The path to the database file.
-                                 Defaults to 'app.db'.
+                                 Defaults to None, the app's database.
+        content_hash (str, optional): The hash of the markdown file the
+                                      questions were parsed from.
+        conn (sqlite3.Connection, optional): A connection from
+            `ingest_connection`. The caller is then responsible for
+            committing, otherwise a connection to `db_path` is opened
+            and committed here.
     """
-    # Create the databse connection
-    conn = sqlite3.connect(db_path)
+    if conn is None:
+        with ingest_connection(db_path) as conn:
+            return add_topic(topic_name, questions, content_hash=content_hash,
+                             conn=conn)
+    ensure_search_index(conn)
     cur = conn.cursor()
-    # Add topic to the database if it doesn't already exist
-    try:
+    # Add topic to the database if it doesn't already exist, the id is
+    # looked up by name as lastrowid is stale when the topic exists
+    cur.execute("SELECT id FROM topic WHERE name = ?", (topic_name,))
+    row = cur.fetchone()
+    if row is None:
         cur.execute("INSERT INTO topic (name) VALUES (?)", (topic_name,))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        print(f"Topic '{topic_name}' already exists, adding more rows...")
-    # Add questions to the database
-    topic_id = cur.lastrowid # Get the last inserted row id
-    query = """
+        topic_id = cur.lastrowid
+    else:
+        topic_id = row[0]
+    cur.execute("UPDATE topic SET content_hash = ? WHERE id = ?",
+                (content_hash, topic_id))
+    # Index the existing questions by (number, title) and by title, and
+    # keep their indexed text to find the ones which changed
+    by_key = {}
+    by_title = {}
+    indexed = {}
+    cur.execute(
+        "SELECT id, question_number, question_title, question_html, "
+        "question_explanation FROM question WHERE topic_id = ?", (topic_id,)
+    )
+    for question_id, number, title, content, explanation in cur.fetchall():
+        by_key[(number, title)] = question_id
+        by_title.setdefault(title, []).append(question_id)
+        indexed[question_id] = (title, content, explanation)
+    # Split the questions into updates, keeping the EMA score of
+    # existing rows, and inserts
+    updates = []
+    inserts = []
+    changed = []
+    matched = set()
+    for row in questions:
+        number, title, content, explanation, correct_idx, highlighted = row
+        # Only add rows that have a correct answer
+        if correct_idx is None:
+            continue
+        question_id = by_key.get((int(number), title))
+        if question_id is None or question_id in matched:
+            candidates = by_title.get(title, [])
+            question_id = candidates[0] if len(candidates) == 1 else None
+        if question_id is not None and question_id not in matched:
+            matched.add(question_id)
+            updates.append((number, title, content, explanation,
+                            correct_idx, topic_name, highlighted, question_id))
+            if indexed[question_id] != (title, content, explanation):
+                changed.append((question_id, title, content, explanation))
+        else:
+            inserts.append((number, title, content, explanation,
+                            correct_idx, topic_id, topic_name, highlighted,
+                            0.0))
+    cur.executemany("""
+        UPDATE question SET
+            question_number = ?, question_title = ?, question_html = ?,
+            question_explanation = ?, correct_choice = ?, topic_name = ?,
+            highlighted = ?
+        WHERE id = ?
+    """, updates)
+    # New rows get ids above the current maximum
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM question")
+    last_id = cur.fetchone()[0]
+    cur.executemany("""
         INSERT INTO question (
             question_number, question_title, question_html,
             question_explanation, correct_choice, topic_id,
-            topic_name, ema_score
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            topic_name, highlighted, ema_score
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, inserts)
+    # Remove questions that are no longer in the markdown file
+    removed = [(question_id,) for question_id in by_key.values()
+               if question_id not in matched]
+    cur.executemany("DELETE FROM question WHERE id = ?", removed)
+    cur.execute(
+        "SELECT id, question_title, question_html, question_explanation "
+        "FROM question WHERE topic_id = ? AND id > ?", (topic_id, last_id)
+    )
+    update_search_index(
+        conn, removed + [(row[0],) for row in changed],
+        changed + cur.fetchall()
+    )
+
+
+def remove_topics(conn, topic_names):
     """
-    for row in questions:
-        number, title, content, explanation, correct_idx = row
-        # Only add rows that have a correct answer
-        if correct_idx is not None:
-            cur.execute(query, (number, title, content, explanation,
-                                correct_idx, topic_id, topic_name, 0.0))
-    # Commit the changes and close the connection
-    conn.commit()
-    conn.close()
+    Delete topics which are no longer in the data directory, along with
+    their questions, search index entries and statistics. Their
+    performance history is kept.
+
+    Args:
+        conn (sqlite3.Connection): The connection to write with, the
+                                   caller is responsible for committing.
+        topic_names (list): The names of the topics.
+    """
+    ensure_search_index(conn)
+    for topic_name in topic_names:
+        row = conn.execute("SELECT id FROM topic WHERE name = ?",
+                           (topic_name,)).fetchone()
+        if row is None:
+            continue
+        topic_id = row[0]
+        conn.execute(
+            "DELETE FROM question_fts WHERE rowid IN "
+            "(SELECT id FROM question WHERE topic_id = ?)", (topic_id,)
+        )
+        conn.execute("DELETE FROM question WHERE topic_id = ?", (topic_id,))
+        conn.execute("DELETE FROM topic_stats WHERE topic_id = ?",
+                     (topic_id,))
+        conn.execute("DELETE FROM topic WHERE id = ?", (topic_id,))
+
+
+def refresh_topic_stats(conn):
+    """
+    Recompute the question count and EMA scores in `topic_stats`.
+
+    Topics without a row are added, with their attempt columns computed
+    from `performance_tracker`, existing rows keep their attempt columns.
+
+    Args:
+        conn (sqlite3.Connection): The connection to write with, the
+                                   caller is responsible for committing.
+    """
+    conn.execute("""
+        INSERT INTO topic_stats (
+            topic_id, topic_name, question_count, ema_mean, ema_min,
+            attempt_count, last_accuracy, last_seen
+        )
+        SELECT
+            topic.id, topic.name, COUNT(question.id),
+            COALESCE(AVG(question.ema_score), 0.0),
+            COALESCE(MIN(question.ema_score), 0.0),
+            (SELECT COUNT(*) FROM performance_tracker
+             WHERE performance_tracker.topic_id = topic.id),
+            (SELECT accuracy FROM performance_tracker
+             WHERE performance_tracker.topic_id = topic.id
+             ORDER BY date DESC LIMIT 1),
+            (SELECT MAX(date) FROM performance_tracker
+             WHERE performance_tracker.topic_id = topic.id)
+        FROM topic LEFT JOIN question ON question.topic_id = topic.id
+        WHERE true
+        GROUP BY topic.id
+        ON CONFLICT (topic_id) DO UPDATE SET
+            topic_name = excluded.topic_name,
+            question_count = excluded.question_count,
+            ema_mean = excluded.ema_mean,
+            ema_min = excluded.ema_min
+    """)
+
+
+# Matches the HTML tags which are removed before questions are indexed, the
+# spans of highlighted code are removed without adding a space
+TAG_RE = re.compile(r'<[^>]+>')
+SPAN_RE = re.compile(r'</?span[^>]*>')
+
+
+def strip_tags(html):
+    """Return the text of some HTML, as it is added to the search index."""
+    if not html:
+        return ''
+    return unescape(TAG_RE.sub(' ', SPAN_RE.sub('', html)))
+
+
+def index_questions(conn, rows):
+    """Add (id, title, html, explanation) rows to the search index."""
+    conn.executemany(
+        "INSERT INTO question_fts (rowid, question_title, question_text, "
+        "question_explanation) VALUES (?, ?, ?, ?)",
+        [(question_id, title, strip_tags(html), strip_tags(explanation))
+         for question_id, title, html, explanation in rows]
+    )
+
+
+def ensure_search_index(conn):
+    """
+    Create the full-text search index of questions if it does not exist.
+
+    The index is an FTS5 table, `question_fts`, whose rowid is the id of
+    the question. It holds the title, and the text of the question and
+    explanation with their HTML tags removed. Questions already in the
+    database are indexed when it is created.
+
+    Args:
+        conn (sqlite3.Connection): The connection to write with, the
+                                   caller is responsible for committing.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'question_fts'"
+    ).fetchone()
+    if exists:
+        return
+    conn.execute("""
+        CREATE VIRTUAL TABLE question_fts USING fts5(
+            question_title, question_text, question_explanation,
+            tokenize = 'porter unicode61'
+        )
+    """)
+    index_questions(conn, conn.execute(
+        "SELECT id, question_title, question_html, question_explanation "
+        "FROM question"
+    ).fetchall())
+
+
+def update_search_index(conn, stale, rows):
+    """
+    Update the search index after questions were written.
+
+    Args:
+        conn (sqlite3.Connection): The connection to write with.
+        stale (list): (id,) tuples of the questions which were removed or
+                      changed.
+        rows (list): (id, title, html, explanation) tuples of the
+                     questions which changed or were added.
+    """
+    conn.executemany("DELETE FROM question_fts WHERE rowid = ?", stale)
+    index_questions(conn, rows)
 
 
 def remove_table_rows(db_path, table_name):
     """Remove all rows from a table in the database."""
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cur = conn.cursor()
     cur.execute(f"DELETE from {table_name}")
     conn.commit()
     conn.close()
 
 
-def populate_database():
-    """Populate the database with questions from markdown files."""
-    # Iterate over each item in the data directory
-    data_dir = 'app/static/data'
+def load_parse_cache(cache_dir, content_hash):
+    """
+    Load the questions parsed from a file with the given hash.
+
+    Args:
+        cache_dir (str): The path to the parse cache directory.
+        content_hash (str): The hash of the file, see `file_hash`.
+
+    Returns:
+        list: The list of question tuples, or None on a cache miss.
+    """
+    path = os.path.join(cache_dir, f'{content_hash}.bin')
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    # Update the modification time so eviction removes the oldest entries
+    os.utime(path)
+    return [tuple(row) for row in json.loads(zlib.decompress(data))]
+
+
+def save_parse_cache(cache_dir, content_hash, questions):
+    """
+    Save parsed questions to the cache as compressed JSON.
+
+    The file is written to a temporary path and then renamed, so it is
+    safe for several worker processes to write to the cache at once.
+
+    Args:
+        cache_dir (str): The path to the parse cache directory.
+        content_hash (str): The hash of the file, see `file_hash`.
+        questions (list): A list of tuples representing the questions.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f'{content_hash}.bin')
+    data = zlib.compress(json.dumps(questions, separators=(',', ':')).encode())
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def evict_parse_cache(cache_dir, max_bytes=PARSE_CACHE_MAX_BYTES):
+    """Remove the least recently used cache entries above `max_bytes`."""
+    if not os.path.isdir(cache_dir):
+        return
+    entries = [entry for entry in os.scandir(cache_dir)
+               if entry.name.endswith('.bin')]
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    total = 0
+    for entry in entries:
+        total += entry.stat().st_size
+        if total > max_bytes:
+            os.remove(entry.path)
+
+
+def clear_parse_cache(cache_dir=PARSE_CACHE_DIR):
+    """Remove every entry from the parse cache."""
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+
+
+def parse_topic(data_dir, topic, content_hash=None, cache_dir=None):
+    """
+    Parse the markdown file for a topic and time how long it takes.
+
+    This is a module level function so that it can be pickled and run
+    in a worker process by `populate_database`.
+
+    Args:
+        data_dir (str): The path to the data directory.
+        topic (str): The name of the topic (and its directory).
+        content_hash (str, optional): The hash of the markdown file, used
+                                      as the parse cache key.
+        cache_dir (str, optional): The path to the parse cache directory.
+                                   Defaults to None (no cache).
+
+    Returns:
+        tuple: The topic name, the list of question tuples (or None if
+               no markdown file was found), the elapsed seconds, whether
+               the questions were loaded from the cache and the seconds
+               spent in each parsing stage.
+    """
+    start = time.perf_counter()
+    use_cache = cache_dir is not None and content_hash is not None
+    if use_cache:
+        questions = load_parse_cache(cache_dir, content_hash)
+        if questions is not None:
+            return topic, questions, time.perf_counter() - start, True, {}
+    markdown_file = os.path.join(data_dir, topic, f'{topic}-quiz.md')
+    timings = {}
+    try:
+        questions = parse_md_file(markdown_file, topic, timings)
+    except FileNotFoundError:
+        return topic, None, time.perf_counter() - start, False, timings
+    if use_cache:
+        save_parse_cache(cache_dir, content_hash, questions)
+    return topic, questions, time.perf_counter() - start, False, timings
+
+
+# Stages of an ingest which are timed: converting markdown to HTML, parsing
+# the HTML and highlighting code (summed over the parser processes), writing
+# the side database, finding near-duplicates and swapping the topics into
+# the database
+INGEST_STAGES = ('convert', 'soup', 'highlight', 'stage', 'dedup', 'insert')
+
+# Functions called with the seconds spent in each stage after every ingest
+INGEST_STAGE_OBSERVERS = []
+
+
+class IngestValidationError(Exception):
+    """Raised when staged data fails validation and is not swapped in."""
+
+
+def get_data_generation(conn):
+    """Return the generation of the data, bumped by every ingest swap."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+@contextmanager
+def staging_connection(staging_path):
+    """
+    Open a new side database to stage parsed topics in.
+
+    The side database is scratch space, so it is written without a
+    journal or syncing, and it is removed once the block exits.
+
+    Yields:
+        sqlite3.Connection: The connection to the side database.
+    """
+    if os.path.exists(staging_path):
+        os.remove(staging_path)
+    conn = sqlite3.connect(staging_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("""
+            CREATE TABLE staged_topic (
+                name TEXT PRIMARY KEY,
+                content_hash TEXT,
+                question_count INTEGER NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE staged_question (
+                topic_name TEXT NOT NULL,
+                question_number INTEGER,
+                question_title TEXT,
+                question_html TEXT,
+                question_explanation TEXT,
+                correct_choice INTEGER,
+                highlighted BOOLEAN
+            )
+        """)
+        conn.execute("CREATE INDEX ix_staged_question_topic_name "
+                     "ON staged_question (topic_name)")
+        yield conn
+    finally:
+        conn.close()
+        os.remove(staging_path)
+
+
+def stage_topic(topic_name, questions, content_hash, staging):
+    """Write a parsed topic's questions to the side database."""
+    rows = [(topic_name, *row) for row in questions]
+    staging.executemany(
+        "INSERT INTO staged_question VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+    )
+    # Only rows with a correct answer are added to the database
+    count = sum(1 for row in questions if row[4] is not None)
+    staging.execute("INSERT INTO staged_topic VALUES (?, ?, ?)",
+                    (topic_name, content_hash, count))
+    staging.commit()
+
+
+def validate_staged_topics(staging, db_path, expected_topics):
+    """
+    Check the side database holds every topic that was meant to be staged.
+
+    Raises:
+        IngestValidationError: If a topic is missing, its row count does
+                               not match what was parsed, or a topic that
+                               has questions would be left with none.
+    """
+    staged = dict(staging.execute(
+        "SELECT name, question_count FROM staged_topic"
+    ).fetchall())
+    missing = set(expected_topics) - set(staged)
+    if missing:
+        raise IngestValidationError(
+            f'Topics missing from staging: {", ".join(sorted(missing))}')
+    counts = dict(staging.execute(
+        "SELECT topic_name, COUNT(*) FROM staged_question "
+        "WHERE correct_choice IS NOT NULL GROUP BY topic_name"
+    ).fetchall())
+    conn = connect(db_path)
+    current = dict(conn.execute(
+        "SELECT topic.name, COUNT(question.id) FROM topic "
+        "JOIN question ON question.topic_id = topic.id GROUP BY topic.id"
+    ).fetchall())
+    conn.close()
+    for topic, count in staged.items():
+        if counts.get(topic, 0) != count:
+            raise IngestValidationError(
+                f'{topic}: staged {counts.get(topic, 0)} questions, '
+                f'expected {count}')
+        if count == 0 and current.get(topic):
+            raise IngestValidationError(
+                f'{topic}: no questions parsed, it has {current[topic]}')
+
+
+# Size of the MinHash signature of each question
+MINHASH_SIZE = 32
+# LSH buckets stop growing at this size, as a band value shared by so many
+# questions says little about any of them
+LSH_MAX_BUCKET_SIZE = 64
+# Most candidates whose similarity is computed for each question
+LSH_MAX_CANDIDATES = 32
+# Matches the text of an answer choice in the question HTML
+CHOICE_RE = re.compile(r'<li[^>]*>(.*?)</li>', re.DOTALL)
+# What is done with near-duplicate questions found at ingest
+DUPLICATE_MODES = ('report', 'drop', 'off')
+
+
+def normalize_question(title, html):
+    """
+    Return the lower case words of a question's title, answer choices and
+    code. The code is included as questions such as "What is the output
+    of this code?" often only differ in it.
+    """
+    parts = [title]
+    parts += [strip_tags(choice) for choice in CHOICE_RE.findall(html or '')]
+    parts += [strip_tags(match.group('code'))
+              for match in CODE_BLOCK_RE.finditer(html or '')]
+    return ' '.join(re.findall(r'\w+', ' '.join(parts).lower()))
+
+
+def shingle(text):
+    """Return the hashed word bigrams of normalized text."""
+    words = text.split()
+    if len(words) < 2:
+        return {hash(tuple(words))}
+    return {hash(pair) for pair in zip(words, words[1:])}
+
+
+def minhash_signature(shingles, size=MINHASH_SIZE):
+    """
+    Return the MinHash signature of a set of hashed shingles.
+
+    One permutation hashing is used: each shingle is hashed once, into one
+    of `size` bins which keep their minimum value, so the cost is linear
+    in the number of shingles rather than `size` times it. An empty bin
+    takes the value of the next bin which is not, offset by the distance
+    to it, so that similar sets still tend to agree on it.
+    """
+    bins = [None] * size
+    for value in shingles:
+        value &= 0xFFFFFFFFFFFFFFFF
+        idx, value = value % size, value // size
+        if bins[idx] is None or value < bins[idx]:
+            bins[idx] = value
+    # Offsets are above any value, so borrowed values never collide
+    offset = 2 ** 64 // size
+    signature = list(bins)
+    for idx in range(size):
+        distance = 0
+        while bins[(idx + distance) % size] is None:
+            distance += 1
+        signature[idx] = bins[(idx + distance) % size] + distance * offset
+    return signature
+
+
+def lsh_rows(size, threshold):
+    """
+    Return the number of signature rows in each LSH band.
+
+    The most rows are used, so the fewest dissimilar pairs are candidates,
+    while the similarity at which a pair is likely to become a candidate,
+    about `(1 / bands) ** (1 / rows)`, stays well below the threshold.
+    """
+    rows = 1
+    for candidate in range(1, size + 1):
+        if (size % candidate == 0
+                and (candidate / size) ** (1 / candidate) <= threshold - 0.1):
+            rows = candidate
+    return rows
+
+
+class DuplicateIndex:
+    """
+    An LSH index of questions, which finds near-duplicates as they are added.
+
+    Candidates are the questions sharing at least one band of the MinHash
+    signature, and only their exact Jaccard similarity decides whether
+    they are duplicates, so the signature just has to find them. With the
+    bucket size and number of candidates capped, adding a question costs
+    about the same however large the index is.
+
+    Args:
+        threshold (float): The Jaccard similarity of the shingles from
+                           which questions are duplicates.
+        size (int, optional): The size of the MinHash signatures.
+                              Defaults to `MINHASH_SIZE`.
+    """
+
+    def __init__(self, threshold, size=MINHASH_SIZE):
+        self.threshold = threshold
+        self.size = size
+        self.rows = lsh_rows(size, threshold)
+        self.buckets = [{} for _ in range(size // self.rows)]
+        self.keys = []
+        self.texts = []
+
+    def add(self, key, text):
+        """
+        Add a question unless it is a near-duplicate of one already added.
+
+        Args:
+            key: Identifies the question in the result.
+            text (str): The question's text, see `normalize_question`.
+
+        Returns:
+            tuple: The key of the question it duplicates and their
+                   similarity, or None if it was added.
+        """
+        shingles = shingle(text)
+        signature = minhash_signature(shingles, self.size)
+        band_keys = [hash(tuple(signature[start:start + self.rows]))
+                     for start in range(0, self.size, self.rows)]
+        counts = Counter()
+        for bucket, band_key in zip(self.buckets, band_keys):
+            counts.update(bucket.get(band_key, ()))
+        # Questions sharing the most bands are the most likely duplicates
+        for idx, _ in counts.most_common(LSH_MAX_CANDIDATES):
+            other = shingle(self.texts[idx])
+            similarity = len(shingles & other) / len(shingles | other)
+            if similarity >= self.threshold:
+                return self.keys[idx], similarity
+        idx = len(self.keys)
+        self.keys.append(key)
+        self.texts.append(text)
+        for bucket, band_key in zip(self.buckets, band_keys):
+            members = bucket.setdefault(band_key, [])
+            if len(members) < LSH_MAX_BUCKET_SIZE:
+                members.append(idx)
+        return None
+
+
+def find_duplicates(staging, db_path, threshold, drop=False):
+    """
+    Find near-duplicate questions in the corpus with MinHash and LSH.
+
+    Questions are compared on the shingles of their title and answer
+    choices. The questions in the database, of topics which were not
+    staged, are indexed first and then the staged questions in order, so
+    the later of two near-duplicates is the one reported.
+
+    Args:
+        staging (sqlite3.Connection): The side database, see
+                                      `staging_connection`.
+        db_path (str): The path to the database file, None for the app's.
+        threshold (float): The similarity from which questions are
+                           near-duplicates, between 0 and 1.
+        drop (bool, optional): Delete staged near-duplicates from the side
+                               database, so they are not added. Defaults
+                               to False.
+
+    Returns:
+        list: A (topic, number, title, original topic, original number,
+              similarity) tuple for each near-duplicate.
+    """
+    index = DuplicateIndex(threshold)
+    duplicates = []
+    staged_topics = {name for name, in staging.execute(
+        "SELECT name FROM staged_topic")}
+    conn = connect(db_path)
+    for topic, number, title, html in conn.execute(
+            "SELECT topic_name, question_number, question_title, "
+            "question_html FROM question ORDER BY topic_id, id"):
+        if topic in staged_topics:
+            continue
+        match = index.add((topic, number), normalize_question(title, html))
+        if match is not None:
+            duplicates.append((topic, number, title, *match[0], match[1]))
+    conn.close()
+    dropped = []
+    for rowid, topic, number, title, html in staging.execute(
+            "SELECT rowid, topic_name, question_number, question_title, "
+            "question_html FROM staged_question "
+            "WHERE correct_choice IS NOT NULL ORDER BY rowid").fetchall():
+        match = index.add((topic, number), normalize_question(title, html))
+        if match is not None:
+            duplicates.append((topic, number, title, *match[0], match[1]))
+            dropped.append((rowid, topic))
+    if drop and dropped:
+        staging.executemany("DELETE FROM staged_question WHERE rowid = ?",
+                            [(rowid,) for rowid, _ in dropped])
+        staging.executemany(
+            "UPDATE staged_topic SET question_count = question_count - ? "
+            "WHERE name = ?",
+            [(count, topic) for topic, count
+             in Counter(topic for _, topic in dropped).items()]
+        )
+        staging.commit()
+    return duplicates
+
+
+def swap_staged_topics(staging, conn, removed=()):
+    """
+    Apply every staged topic to the database, delete the `removed` topics
+    and bump the data generation.
+
+    This only copies rows that have already been parsed and validated, so
+    the write transaction it runs in is short.
+    """
+    staged = staging.execute(
+        "SELECT name, content_hash FROM staged_topic ORDER BY rowid"
+    ).fetchall()
+    for topic, content_hash in staged:
+        questions = staging.execute(
+            "SELECT question_number, question_title, question_html, "
+            "question_explanation, correct_choice, highlighted "
+            "FROM staged_question "
+            "WHERE topic_name = ? ORDER BY rowid", (topic,)
+        ).fetchall()
+        add_topic(topic, questions, content_hash=content_hash, conn=conn)
+    remove_topics(conn, removed)
+    refresh_topic_stats(conn)
+    conn.execute(f"PRAGMA user_version = {get_data_generation(conn) + 1}")
+
+
+def populate_database(data_dir='app/static/data', db_path=None,
+                      workers=None, force=False, defer_indexes=False,
+                      cache_dir=PARSE_CACHE_DIR, duplicates='report',
+                      duplicate_threshold=0.8):
+    """
+    Populate the database with questions from markdown files.
+
+    Only markdown files whose content hash differs from the one stored
+    for their topic are parsed, so a refresh scales with what changed.
+    Topics whose markdown file is no longer in `data_dir` are deleted.
+    Changed topics are parsed in a process pool and the results are
+    passed back, in directory order, to this process which is the only
+    one writing. This produces the same rows as parsing each topic one
+    after another.
+
+    The parsed topics are first staged in a side database next to
+    `db_path` and their row counts validated. Only then are they applied
+    to the database, with the refreshed `topic_stats`, in one short
+    transaction which also bumps the data generation (`PRAGMA
+    user_version`). A running app sees either the old or the new data,
+    never a partial load, and notices the new generation without a
+    restart. If validation fails the database is left untouched.
+
+    Before validation, the staged questions are checked for near-duplicates
+    of each other and of the questions already in the database, see
+    `find_duplicates`. They are reported, or dropped from the staged data.
+
+    Parsed questions are cached on disk, keyed by the file hash (which
+    includes the parser version), so rebuilding the database from
+    unchanged files skips parsing altogether.
+
+    The time spent in each of the `INGEST_STAGES` is printed and passed
+    to the `INGEST_STAGE_OBSERVERS`.
+
+    Args:
+        data_dir (str, optional): The path to the data directory.
+                                  Defaults to 'app/static/data'.
+        db_path (str, optional): The path to the database file.
+                                 Defaults to None, the app's database.
+        workers (int, optional): The number of parser processes. Defaults
+                                 to the number of CPUs, 1 parses serially
+                                 in this process.
+        force (bool, optional): Parse every file even if it is unchanged.
+                                Defaults to False.
+        defer_indexes (bool, optional): Rebuild the EMA score index after
+                                        the load rather than updating it
+                                        row by row. Defaults to False.
+        cache_dir (str, optional): The path to the parse cache directory,
+                                   None disables the cache. Defaults to
+                                   `PARSE_CACHE_DIR`.
+        duplicates (str, optional): One of `DUPLICATE_MODES`, whether
+                                    near-duplicate questions are reported,
+                                    reported and dropped or not looked
+                                    for. Defaults to 'report'.
+        duplicate_threshold (float, optional): The similarity from which
+                                               questions are near-duplicates.
+                                               Defaults to 0.8.
+
+    Raises:
+        IngestValidationError: If the staged data fails validation, or
+                               `data_dir` holds no topics at all.
+    """
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    stored_hashes = get_topic_hashes(db_path)
+    hashes = {}
+    found = set()
     for topic in os.listdir(data_dir):
-        path = os.path.join(data_dir, topic)
-        # Check if the item is a directory
-        if os.path.isdir(path):
-            # Ensure the directory contains a markdown file
-            try:
-                markdown_file = os.path.join(path, f'{topic}-quiz.md')
-                questions = parse_md_file(markdown_file, topic)
-                add_topic(topic, questions)
-            except FileNotFoundError:
-                print(f'No markdown file found for {topic}, skipping...')
-                
\ No newline at end of file
+        # Only directories can contain a topic markdown file
+        markdown_file = os.path.join(data_dir, topic, f'{topic}-quiz.md')
+        if not os.path.isdir(os.path.join(data_dir, topic)):
+            continue
+        if not os.path.isfile(markdown_file):
+            print(f'No markdown file found for {topic}, skipping...')
+            continue
+        found.add(topic)
+        content_hash = file_hash(markdown_file, topic_images(data_dir, topic))
+        if force or stored_hashes.get(topic) != content_hash:
+            hashes[topic] = content_hash
+    if stored_hashes and not found:
+        # Most likely the data repository is not checked out, rather than
+        # every topic having been removed
+        raise IngestValidationError(f'No topics found in {data_dir}')
+    removed = sorted(set(stored_hashes) - found)
+    topics = list(hashes)
+    args = (itertools.repeat(data_dir), topics, hashes.values(),
+            itertools.repeat(cache_dir))
+    timings = dict.fromkeys(INGEST_STAGES, 0.0)
+    with staging_connection(f'{get_db_path(db_path)}.staging') as staging:
+        if workers > 1 and len(topics) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(parse_topic, *args)
+                staged = _stage_topics(results, hashes, staging, timings)
+        else:
+            staged = _stage_topics(map(parse_topic, *args), hashes, staging,
+                                   timings)
+        if staged and duplicates != 'off':
+            dedup_start = time.perf_counter()
+            found = find_duplicates(staging, db_path, duplicate_threshold,
+                                    drop=duplicates == 'drop')
+            timings['dedup'] = time.perf_counter() - dedup_start
+            _report_duplicates(found, duplicate_threshold, timings['dedup'],
+                               duplicates == 'drop')
+        validate_staged_topics(staging, db_path, topics)
+        swap_start = time.perf_counter()
+        if staged or removed:
+            with ingest_connection(db_path, defer_indexes) as conn:
+                swap_staged_topics(staging, conn, removed)
+        timings['insert'] = time.perf_counter() - swap_start
+    if cache_dir is not None:
+        evict_parse_cache(cache_dir)
+    for observer in INGEST_STAGE_OBSERVERS:
+        observer(timings)
+    if removed:
+        print(f'Removed {len(removed)} topics: {", ".join(removed)}')
+    print(f'Populated {len(topics)} changed topics in '
+          f'{time.perf_counter() - start:.2f}s ({workers} workers, '
+          + ', '.join(f'{stage} {seconds:.2f}s'
+                      for stage, seconds in timings.items()) + ')')
+
+
+def _report_duplicates(duplicates, threshold, elapsed, dropped):
+    """Print the near-duplicates found by `find_duplicates`."""
+    print(f'Found {len(duplicates)} near-duplicate questions (similarity '
+          f'>= {threshold}) in {elapsed:.2f}s'
+          + (', staged duplicates were dropped' if dropped else ''))
+    for topic, number, title, original_topic, original_number, similarity \
+            in duplicates:
+        print(f'  {topic} Q{number} ~ {original_topic} Q{original_number} '
+              f'({similarity:.2f}): {title}')
+
+
+def _stage_topics(results, hashes, staging, timings):
+    """Stage parsed topics as they arrive and return the staged names."""
+    staged = []
+    for topic, questions, elapsed, cached, parse_timings in results:
+        if questions is None:
+            print(f'No markdown file found for {topic}, skipping...')
+            continue
+        for stage, seconds in parse_timings.items():
+            timings[stage] += seconds
+        stage_start = time.perf_counter()
+        stage_topic(topic, questions, hashes[topic], staging)
+        timings['stage'] += time.perf_counter() - stage_start
+        staged.append(topic)
+        source = 'loaded from cache' if cached else 'parsed'
+        print(f'{topic}: {len(questions)} questions {source} in {elapsed:.2f}s')
+    return staged